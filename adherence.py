@@ -0,0 +1,392 @@
+"""
+Incrementally maintained adherence rollups.
+
+`adherence_rollups` keeps taken/missed/pending dose counts per patient per
+week (starting Monday) and per month, and `adherence_streaks` the current
+run of consecutive TAKEN days (a day with several doses is TAKEN when none
+of its decided doses was MISSED). Every status write calls `apply_change` in the same
+transaction, so reading a patient's adherence is a primary-key lookup.
+
+`adherence_days` holds each day's taken/missed counts, so a status change
+only moves the streak when it changes how the whole day reads, and then
+mostly by one step. Un-deciding the latest day, clearing its MISSED dose or
+editing an older day walks back over these day rows to the first break,
+never over the logs.
+
+`rebuild` recomputes everything from medication_logs (hot and archived, see
+archive.py); run this module with --check to compare the maintained values
+against a fresh recomputation:
+
+    python adherence.py --db medication_manager.db --check
+"""
+
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import archive
+
+STATUS_COLUMNS = {"TAKEN": "taken", "MISSED": "missed", "PENDING": "pending"}
+
+
+def create_tables(c):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS adherence_rollups (
+            patient_id INTEGER NOT NULL,
+            period TEXT NOT NULL CHECK(period IN ('week', 'month')),
+            period_start TEXT NOT NULL,
+            taken INTEGER NOT NULL DEFAULT 0,
+            missed INTEGER NOT NULL DEFAULT 0,
+            pending INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (patient_id, period, period_start)
+        )
+    """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS adherence_days (
+            patient_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            taken INTEGER NOT NULL DEFAULT 0,
+            missed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (patient_id, date)
+        )
+    """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS adherence_streaks (
+            patient_id INTEGER PRIMARY KEY,
+            current_streak INTEGER NOT NULL DEFAULT 0,
+            last_date TEXT
+        )
+    """
+    )
+
+
+def _parse(date_str):
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+
+def period_starts(date_str):
+    """(week start, month start) of a YYYY-MM-DD date, as strings."""
+    day = _parse(date_str)
+    week = day - timedelta(days=day.weekday())
+    return week.isoformat(), day.replace(day=1).isoformat()
+
+
+def _bump(c, patient_id, date_str, status, delta):
+    column = STATUS_COLUMNS.get(status)
+    if not column:
+        return
+    week, month = period_starts(date_str)
+    for period, start in (("week", week), ("month", month)):
+        c.execute(
+            "INSERT OR IGNORE INTO adherence_rollups (patient_id, period, period_start) VALUES (?, ?, ?)",
+            (patient_id, period, start),
+        )
+        c.execute(
+            f"UPDATE adherence_rollups SET {column} = {column} + ? WHERE patient_id = ? AND period = ? AND period_start = ?",
+            (delta, patient_id, period, start),
+        )
+
+
+def _day_status(taken, missed):
+    """How a day reads: MISSED if any dose was, TAKEN, or None if undecided."""
+    if missed:
+        return "MISSED"
+    return "TAKEN" if taken else None
+
+
+def _count_streak(days):
+    """Streak and last date from (date, day status) pairs, newest first."""
+    streak = 0
+    last_date = None
+    expected = None
+    for date_str, status in days:
+        day = _parse(date_str)
+        if last_date is None:
+            last_date = date_str
+        elif day != expected:
+            break
+        if status != "TAKEN":
+            break
+        streak += 1
+        expected = day - timedelta(days=1)
+    return streak, last_date
+
+
+def compute_streak(c, patient_id):
+    """
+    Consecutive TAKEN days ending at the latest decided (non-PENDING) day,
+    from the logs. A MISSED day or a day without a log ends the streak.
+    Returns (streak, last decided date or None).
+    """
+    # MIN() picks MISSED over TAKEN for days with several doses
+    rows = c.execute(
+        f"SELECT date, MIN(status) FROM {archive.logs_source(c)} WHERE patient_id = ? AND status != 'PENDING' GROUP BY date ORDER BY date DESC",
+        (patient_id,),
+    )
+    return _count_streak(rows)
+
+
+def _walk_days(c, patient_id):
+    """compute_streak from adherence_days; reads back to the first break only."""
+    rows = c.execute(
+        "SELECT date, taken, missed FROM adherence_days WHERE patient_id = ? ORDER BY date DESC",
+        (patient_id,),
+    )
+    return _count_streak((d, _day_status(t, m)) for d, t, m in rows)
+
+
+def _bump_day(c, patient_id, date_str, old_status, new_status):
+    """Move one dose between the day's counts. Returns (day before, day after)."""
+    row = c.execute(
+        "SELECT taken, missed FROM adherence_days WHERE patient_id = ? AND date = ?",
+        (patient_id, date_str),
+    ).fetchone()
+    taken, missed = row if row else (0, 0)
+    before = _day_status(taken, missed)
+    for status, delta in ((old_status, -1), (new_status, 1)):
+        if status == "TAKEN":
+            taken += delta
+        elif status == "MISSED":
+            missed += delta
+    if taken or missed:
+        c.execute(
+            """INSERT INTO adherence_days (patient_id, date, taken, missed) VALUES (?, ?, ?, ?)
+            ON CONFLICT(patient_id, date) DO UPDATE SET taken=excluded.taken, missed=excluded.missed""",
+            (patient_id, date_str, taken, missed),
+        )
+    elif row:
+        c.execute(
+            "DELETE FROM adherence_days WHERE patient_id = ? AND date = ?",
+            (patient_id, date_str),
+        )
+    return before, _day_status(taken, missed)
+
+
+def _update_streak(c, patient_id, date_str, before, after):
+    if before == after:
+        return  # The day reads the same, e.g. a second dose TAKEN
+
+    row = c.execute(
+        "SELECT current_streak, last_date FROM adherence_streaks WHERE patient_id = ?",
+        (patient_id,),
+    ).fetchone()
+    streak, last_date = (row[0], row[1]) if row else (0, None)
+
+    if last_date is None or date_str > last_date:
+        # Common case: the day's first dose decided after the previous day
+        contiguous = last_date and _parse(date_str) - _parse(last_date) == timedelta(
+            days=1
+        )
+        if after == "MISSED":
+            streak = 0
+        else:
+            # A gap or a MISSED previous day leaves streak at 0 here
+            streak = streak + 1 if contiguous else 1
+        last_date = date_str
+    elif date_str == last_date and after == "MISSED":
+        streak = 0
+    else:
+        # Un-deciding or un-missing the latest day, or an edit to the past
+        streak, last_date = _walk_days(c, patient_id)
+
+    c.execute(
+        """INSERT INTO adherence_streaks (patient_id, current_streak, last_date) VALUES (?, ?, ?)
+        ON CONFLICT(patient_id) DO UPDATE SET current_streak=excluded.current_streak, last_date=excluded.last_date""",
+        (patient_id, streak, last_date),
+    )
+
+
+def apply_change(c, patient_id, date_str, old_status, new_status):
+    """
+    Account for one medication_logs row going from `old_status` to
+    `new_status` (either may be None for insert/delete). Does not commit.
+    """
+    if old_status == new_status:
+        return
+    if old_status:
+        _bump(c, patient_id, date_str, old_status, -1)
+    if new_status:
+        _bump(c, patient_id, date_str, new_status, 1)
+    before, after = _bump_day(c, patient_id, date_str, old_status, new_status)
+    _update_streak(c, patient_id, date_str, before, after)
+
+
+def add_pending(c, patient_ids, date_str):
+    """
+    Count a new PENDING log on `date_str` for each patient, in bulk. PENDING
+    days do not affect streaks. Does not commit.
+    """
+    week, month = period_starts(date_str)
+    c.executemany(
+        """INSERT INTO adherence_rollups (patient_id, period, period_start, pending) VALUES (?, ?, ?, 1)
+        ON CONFLICT(patient_id, period, period_start) DO UPDATE SET pending = pending + 1""",
+        [
+            (pid, period, start)
+            for pid in patient_ids
+            for period, start in (("week", week), ("month", month))
+        ],
+    )
+
+
+def get_adherence(conn, patient_id, on=None):
+    """Current week's and month's counts plus the streak for a patient."""
+    on = on or date.today()
+    week, month = period_starts(on.isoformat())
+    result = {"patient_id": patient_id}
+    for period, start in (("week", week), ("month", month)):
+        row = conn.execute(
+            "SELECT taken, missed, pending FROM adherence_rollups WHERE patient_id = ? AND period = ? AND period_start = ?",
+            (patient_id, period, start),
+        ).fetchone()
+        taken, missed, pending = row if row else (0, 0, 0)
+        decided = taken + missed
+        result[period] = {
+            "period_start": start,
+            "taken": taken,
+            "missed": missed,
+            "pending": pending,
+            "adherence": round(taken / decided, 4) if decided else None,
+        }
+    row = conn.execute(
+        "SELECT current_streak FROM adherence_streaks WHERE patient_id = ?",
+        (patient_id,),
+    ).fetchone()
+    result["current_streak"] = row[0] if row else 0
+    return result
+
+
+def _recompute(c):
+    logs = archive.logs_source(c)
+    rollups = {}
+    days = {}
+    for patient_id, date_str, status in c.execute(
+        f"SELECT patient_id, date, status FROM {logs}"
+    ):
+        column = STATUS_COLUMNS.get(status)
+        if not column:
+            continue
+        week, month = period_starts(date_str)
+        for key in ((patient_id, "week", week), (patient_id, "month", month)):
+            counts = rollups.setdefault(key, {"taken": 0, "missed": 0, "pending": 0})
+            counts[column] += 1
+        if column != "pending":
+            counts = days.setdefault((patient_id, date_str), {"taken": 0, "missed": 0})
+            counts[column] += 1
+
+    streaks = {}
+    patient_ids = [r[0] for r in c.execute(f"SELECT DISTINCT patient_id FROM {logs}")]
+    for patient_id in patient_ids:
+        streaks[patient_id] = compute_streak(c, patient_id)
+    return rollups, days, streaks
+
+
+def rebuild(c):
+    """Recompute every rollup and streak from medication_logs. Does not commit."""
+    rollups, days, streaks = _recompute(c)
+    c.execute("DELETE FROM adherence_rollups")
+    c.execute("DELETE FROM adherence_days")
+    c.execute("DELETE FROM adherence_streaks")
+    c.executemany(
+        "INSERT INTO adherence_rollups (patient_id, period, period_start, taken, missed, pending) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (pid, period, start, v["taken"], v["missed"], v["pending"])
+            for (pid, period, start), v in rollups.items()
+        ],
+    )
+    c.executemany(
+        "INSERT INTO adherence_days (patient_id, date, taken, missed) VALUES (?, ?, ?, ?)",
+        [(pid, day, v["taken"], v["missed"]) for (pid, day), v in days.items()],
+    )
+    c.executemany(
+        "INSERT INTO adherence_streaks (patient_id, current_streak, last_date) VALUES (?, ?, ?)",
+        [(pid, streak, last) for pid, (streak, last) in streaks.items()],
+    )
+
+
+def check(c):
+    """List of mismatches between the maintained and recomputed values."""
+    rollups, days, streaks = _recompute(c)
+    mismatches = []
+
+    maintained = {
+        (pid, period, start): {"taken": t, "missed": m, "pending": p}
+        for pid, period, start, t, m, p in c.execute(
+            "SELECT patient_id, period, period_start, taken, missed, pending FROM adherence_rollups"
+        )
+    }
+    zero = {"taken": 0, "missed": 0, "pending": 0}
+    for key in set(rollups) | set(maintained):
+        expected = rollups.get(key, zero)
+        actual = maintained.get(key, zero)
+        if expected != actual:
+            mismatches.append(f"rollup {key}: expected {expected}, have {actual}")
+
+    maintained = {
+        (pid, day): {"taken": t, "missed": m}
+        for pid, day, t, m in c.execute(
+            "SELECT patient_id, date, taken, missed FROM adherence_days"
+        )
+    }
+    zero = {"taken": 0, "missed": 0}
+    for key in set(days) | set(maintained):
+        expected = days.get(key, zero)
+        actual = maintained.get(key, zero)
+        if expected != actual:
+            mismatches.append(f"day {key}: expected {expected}, have {actual}")
+
+    for pid, streak, last in c.execute(
+        "SELECT patient_id, current_streak, last_date FROM adherence_streaks"
+    ):
+        expected = streaks.get(pid, (0, None))
+        if expected[0] != streak:
+            mismatches.append(f"streak {pid}: expected {expected[0]}, have {streak}")
+    for pid, expected in streaks.items():
+        if expected[0] and not c.execute(
+            "SELECT 1 FROM adherence_streaks WHERE patient_id = ?", (pid,)
+        ).fetchone():
+            mismatches.append(f"streak {pid}: expected {expected[0]}, have none")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adherence rollup maintenance")
+    parser.add_argument("--db", default="medication_manager.db")
+    parser.add_argument(
+        "--archive-db", help="Archived logs (default: <db>_archive.db if it exists)"
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="Compare rollups with a recomputation"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Recompute rollups from raw logs"
+    )
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    archive_db = args.archive_db or archive.archive_path(args.db)
+    if args.archive_db or os.path.exists(archive_db):
+        archive.attach(conn, archive_db)
+    create_tables(conn)
+    status = 0
+    if args.check or not args.rebuild:
+        mismatches = check(conn)
+        for line in mismatches:
+            print(line)
+        print(f"{len(mismatches)} mismatches.")
+        status = 1 if mismatches else 0
+    if args.rebuild:
+        rebuild(conn)
+        conn.commit()
+        print("Rollups rebuilt.")
+    conn.close()
+    raise SystemExit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Caregiver alert store.
+
+Alerts are persisted in the `alerts` table; the most recent ones are also
+kept in a fixed-size ring buffer so the dashboard can render them without a
+query. Memory use is bounded by the ring buffer capacity however long the
+process runs.
+
+Writes go through `write(fn, *args)`, which runs `fn(conn, *args)` in a
+transaction and returns its result once committed (DBWriter.write), and the
+ring buffer only changes after that.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime
+
+ALERT_STATES = ("OPEN", "ACKNOWLEDGED", "DISMISSED")
+MAX_PAGE_SIZE = 200
+
+
+def create_table(c):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            patient_name TEXT,
+            reason TEXT,
+            message TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'OPEN' CHECK(state IN ('OPEN', 'ACKNOWLEDGED', 'DISMISSED')),
+            updated_at TEXT
+        )
+    """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_created_at ON alerts (created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_state ON alerts (state, id)")
+
+
+def page_size(limit):
+    """`limit` clamped to 1..MAX_PAGE_SIZE, the page size query() uses."""
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def _row_to_dict(row):
+    alert = dict(row)
+    # Kept for the dashboard popup, which shows the time of day
+    alert["timestamp"] = alert["created_at"][11:19]
+    return alert
+
+
+def _insert_job(conn, created_at, patient_name, reason, message):
+    cur = conn.execute(
+        "INSERT INTO alerts (created_at, patient_name, reason, message) VALUES (?, ?, ?, ?)",
+        (created_at, patient_name, reason, message),
+    )
+    return cur.lastrowid
+
+
+def _set_state_job(conn, alert_id, state, updated_at):
+    cur = conn.execute(
+        "UPDATE alerts SET state = ?, updated_at = ? WHERE id = ?",
+        (state, updated_at, alert_id),
+    )
+    return cur.rowcount > 0
+
+
+class AlertStore:
+    def __init__(self, write, capacity=50):
+        self._write = write
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=capacity)
+
+    def load(self, conn):
+        """Warm the ring buffer from the database (e.g. after a restart)."""
+        rows = conn.execute(
+            "SELECT * FROM alerts ORDER BY id DESC LIMIT ?", (self._recent.maxlen,)
+        ).fetchall()
+        with self._lock:
+            self._recent.clear()
+            for row in reversed(rows):
+                self._recent.append(_row_to_dict(row))
+
+    def add(self, patient_name, reason):
+        """Persist a new OPEN alert and return it as a dict."""
+        created_at = datetime.now().isoformat(timespec="seconds")
+        message = f"ALERT: {patient_name} - {reason}"
+        alert_id = self._write(_insert_job, created_at, patient_name, reason, message)
+        alert = {
+            "id": alert_id,
+            "created_at": created_at,
+            "patient_name": patient_name,
+            "reason": reason,
+            "message": message,
+            "state": "OPEN",
+            "updated_at": None,
+            "timestamp": created_at[11:19],
+        }
+        with self._lock:
+            self._recent.append(alert)
+        return alert
+
+    def recent(self, state=None):
+        """Newest-first alerts from the ring buffer, optionally by state."""
+        with self._lock:
+            alerts = [dict(a) for a in reversed(self._recent)]
+        if state:
+            alerts = [a for a in alerts if a["state"] == state]
+        return alerts
+
+    def query(self, conn, state=None, before=None, limit=50):
+        """
+        Newest-first page of alerts from the database. Pass the smallest id of
+        a page as `before` to get the next one.
+        """
+        limit = page_size(limit)
+        clauses = []
+        params = []
+        if state:
+            clauses.append("state = ?")
+            params.append(state)
+        if before:
+            clauses.append("id < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = conn.execute(
+            f"SELECT * FROM alerts {where} ORDER BY id DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def set_state(self, alert_id, state):
+        """Acknowledge or dismiss an alert. Returns False if it does not exist."""
+        if state not in ALERT_STATES:
+            raise ValueError(f"Unknown alert state: {state}")
+        updated_at = datetime.now().isoformat(timespec="seconds")
+        if not self._write(_set_state_job, alert_id, state, updated_at):
+            return False
+        with self._lock:
+            for alert in self._recent:
+                if alert["id"] == alert_id:
+                    alert["state"] = state
+                    alert["updated_at"] = updated_at
+        return True
@@ -0,0 +1,326 @@
+"""
+Adherence analytics and log export over the full medication history.
+
+Logs are read in keyset-paged chunks (by medication_logs.id), archived logs
+first when the archive database is attached (less any a crash mid-move left
+in both databases), so memory use depends on the chunk size, not on the
+number of rows. For statistics each
+chunk is turned into integer NumPy columns (times are converted to minutes
+of the day inside SQLite) and folded into fixed-size accumulators with
+bincount; nothing is processed row by row in Python.
+
+    python analytics.py stats --db medication_manager.db
+    python analytics.py export --format parquet --out logs.parquet
+
+NumPy is needed for `stats` and pyarrow for Parquet export; both are imported
+on first use.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+
+import archive
+
+DEFAULT_CHUNK_ROWS = 50_000
+DELAY_RANGE_MINUTES = 720  # delays are wrapped into [-12h, +12h)
+
+STATS_QUERY = """
+    SELECT ml.id, ml.patient_id,
+        CASE ml.status WHEN 'TAKEN' THEN 0 WHEN 'MISSED' THEN 1 ELSE 2 END,
+        COALESCE(CAST(substr(ml.time_taken, 1, 2) AS INTEGER) * 60
+            + CAST(substr(ml.time_taken, 4, 2) AS INTEGER), -1),
+        COALESCE(s.due_minute, -1), ml.schedule_id
+    FROM {logs} ml JOIN schedules s ON s.id = ml.schedule_id
+    WHERE ml.id > ? AND {only} ORDER BY ml.id LIMIT ?
+"""
+
+EXPORT_COLUMNS = (
+    "id",
+    "patient_id",
+    "patient_name",
+    "schedule_id",
+    "medicine",
+    "date",
+    "time_taken",
+    "status",
+    "notes",
+)
+EXPORT_QUERY = """
+    SELECT ml.id, ml.patient_id, p.name, ml.schedule_id, s.medicine, ml.date,
+        ml.time_taken, ml.status, ml.notes
+    FROM {logs} ml LEFT JOIN patients p ON p.id = ml.patient_id
+    LEFT JOIN schedules s ON s.id = ml.schedule_id
+    WHERE ml.id > ? AND {only} ORDER BY ml.id LIMIT ?
+"""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Analytics needs numpy (pip install numpy)")
+    return numpy
+
+
+def iter_chunks(conn, query, chunk_size=DEFAULT_CHUNK_ROWS):
+    """
+    Yield lists of rows from a keyset-paged `query` whose first column is the
+    id, once per log table (`{logs} ml` in the query, with `{only}` the
+    condition that skips archived logs still in the hot table).
+    """
+    for table, only in archive.log_tables(conn, "ml"):
+        table_query = query.format(logs=table, only=only)
+        last_id = 0
+        while True:
+            rows = conn.execute(table_query, (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+
+
+def _ratio(taken, missed):
+    decided = taken + missed
+    return round(taken / decided, 4) if decided else None
+
+
+def _percentile(np, histogram, offset, pct):
+    total = histogram.sum()
+    if not total:
+        return None
+    index = int(np.searchsorted(np.cumsum(histogram), total * pct / 100.0))
+    return index - offset
+
+
+def _add_counts(np, counts, ids, status):
+    """Add one chunk's status counts to the (id -> taken, missed, pending) table."""
+    size = int(ids.max()) + 1
+    if size > len(counts):
+        grown = np.zeros((size, 3), dtype=np.int64)
+        grown[: len(counts)] = counts
+        counts = grown
+    flat = np.bincount(ids * 3 + status, minlength=len(counts) * 3)
+    return counts + flat.reshape(-1, 3)
+
+
+def _counts_at(counts, index):
+    return tuple(int(v) for v in counts[index]) if index < len(counts) else (0, 0, 0)
+
+
+def compute_stats(conn, chunk_size=DEFAULT_CHUNK_ROWS):
+    """
+    Per-patient and per-cohort (patients on the same medicine) adherence,
+    missed doses by hour of the due time, and delay statistics for taken doses
+    (minutes after the due time; negative means early). A dose counts towards
+    the cohort of its schedule's medicine, and a patient on several medicines
+    is in each of their cohorts.
+    """
+    np = _numpy()
+
+    counts = np.zeros((0, 3), dtype=np.int64)  # patient_id -> taken, missed, pending
+    by_schedule = np.zeros((0, 3), dtype=np.int64)  # schedule_id -> the same
+    missed_by_hour = np.zeros(24, dtype=np.int64)
+    delays = np.zeros(2 * DELAY_RANGE_MINUTES, dtype=np.int64)
+    delay_sum = 0
+    rows_seen = 0
+
+    for rows in iter_chunks(conn, STATS_QUERY, chunk_size):
+        chunk = np.array(rows, dtype=np.int64)
+        rows_seen += len(chunk)
+        patient_id, status = chunk[:, 1], chunk[:, 2]
+        taken_min, due_min = chunk[:, 3], chunk[:, 4]
+
+        counts = _add_counts(np, counts, patient_id, status)
+        by_schedule = _add_counts(np, by_schedule, chunk[:, 5], status)
+
+        missed = (status == 1) & (due_min >= 0)
+        missed_by_hour += np.bincount(due_min[missed] // 60, minlength=24)
+
+        timed = (status == 0) & (taken_min >= 0) & (due_min >= 0)
+        delay = (taken_min[timed] - due_min[timed] + DELAY_RANGE_MINUTES) % (
+            2 * DELAY_RANGE_MINUTES
+        )
+        delays += np.bincount(delay, minlength=len(delays))
+        delay_sum += int(delay.sum()) - DELAY_RANGE_MINUTES * len(delay)
+
+    patients = conn.execute("SELECT id, name FROM patients ORDER BY id").fetchall()
+    per_patient = []
+    for pid, name in patients:
+        taken, missed, pending = _counts_at(counts, pid)
+        per_patient.append(
+            {
+                "patient_id": pid,
+                "name": name,
+                "taken": taken,
+                "missed": missed,
+                "pending": pending,
+                "adherence": _ratio(taken, missed),
+            }
+        )
+
+    cohorts = {}
+    members = {}  # medicine -> patient ids
+    for sid, pid, medicine in conn.execute(
+        "SELECT id, patient_id, medicine FROM schedules ORDER BY id"
+    ):
+        cohort = cohorts.setdefault(
+            medicine or "",
+            {"medicine": medicine, "patients": 0, "taken": 0, "missed": 0, "pending": 0},
+        )
+        members.setdefault(medicine or "", set()).add(pid)
+        taken, missed, pending = _counts_at(by_schedule, sid)
+        cohort["taken"] += taken
+        cohort["missed"] += missed
+        cohort["pending"] += pending
+    for key, cohort in cohorts.items():
+        cohort["patients"] = len(members[key])
+        cohort["adherence"] = _ratio(cohort["taken"], cohort["missed"])
+
+    delay_count = int(delays.sum())
+    nonzero = np.nonzero(delays)[0]
+    return {
+        "rows": rows_seen,
+        "patients": per_patient,
+        "cohorts": sorted(cohorts.values(), key=lambda c: c["medicine"] or ""),
+        "missed_by_due_hour": [int(v) for v in missed_by_hour],
+        "delay_minutes": {
+            "count": delay_count,
+            "mean": round(delay_sum / delay_count, 2) if delay_count else None,
+            "min": int(nonzero[0]) - DELAY_RANGE_MINUTES if delay_count else None,
+            "p50": _percentile(np, delays, DELAY_RANGE_MINUTES, 50),
+            "p90": _percentile(np, delays, DELAY_RANGE_MINUTES, 90),
+            "p99": _percentile(np, delays, DELAY_RANGE_MINUTES, 99),
+            "max": int(nonzero[-1]) - DELAY_RANGE_MINUTES if delay_count else None,
+        },
+    }
+
+
+def iter_csv(conn, chunk_size=DEFAULT_CHUNK_ROWS):
+    """Yield the log export as CSV text, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_chunks(conn, EXPORT_QUERY, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ByteSink:
+    """Write-only file object whose contents are handed out as they arrive."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(conn, chunk_size=DEFAULT_CHUNK_ROWS):
+    """Yield the log export as Parquet bytes, one row group per chunk."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("patient_id", pa.int64()),
+            ("patient_name", pa.string()),
+            ("schedule_id", pa.int64()),
+            ("medicine", pa.string()),
+            ("date", pa.string()),
+            ("time_taken", pa.string()),
+            ("status", pa.string()),
+            ("notes", pa.string()),
+        ]
+    )
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in iter_chunks(conn, EXPORT_QUERY, chunk_size):
+            columns = dict(zip(EXPORT_COLUMNS, (list(c) for c in zip(*rows))))
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "parquet": (iter_parquet, "application/vnd.apache.parquet"),
+}
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default="medication_manager.db")
+    common.add_argument(
+        "--archive-db", help="Archived logs (default: <db>_archive.db if it exists)"
+    )
+    common.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser = argparse.ArgumentParser(description="Adherence analytics and log export")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser(
+        "stats", parents=[common], help="Print adherence statistics as JSON"
+    )
+    export = sub.add_parser(
+        "export", parents=[common], help="Stream all logs to a file"
+    )
+    export.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    export.add_argument("--out", default="-", help="Output path, or - for stdout")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    archive_db = args.archive_db or archive.archive_path(args.db)
+    if args.archive_db or os.path.exists(archive_db):
+        archive.attach(conn, archive_db)
+    if args.command == "stats":
+        print(json.dumps(compute_stats(conn, args.chunk_rows), indent=2))
+    else:
+        produce, _ = EXPORT_FORMATS[args.format]
+        binary = args.format != "csv"
+        if args.out == "-":
+            out = sys.stdout.buffer if binary else sys.stdout
+        else:
+            out = open(args.out, "wb" if binary else "w", newline=None if binary else "")
+        try:
+            for piece in produce(conn, args.chunk_rows):
+                out.write(piece)
+        finally:
+            if out not in (sys.stdout, sys.stdout.buffer):
+                out.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,132 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for
-from flask_socketio import SocketIO, emit
+import argparse
+import sys
+
+parser = argparse.ArgumentParser(description="Medication Manager Voice Assistant")
+parser.add_argument(
+    "--no-pi",
+    action="store_true",
+    help="Run in local test mode without Pi-specific hardware (LEDs) or Arduino.",
+)
+parser.add_argument(
+    "--led-log",
+    metavar="PATH",
+    help="Record every LED frame to PATH (see benchmarks/led_report.py). With --no-pi "
+    "or --stub the LEDs are simulated.",
+)
+parser.add_argument(
+    "--stt",
+    choices=["cloud", "local", "cloud+local", "local+cloud"],
+    default="cloud",
+    help="Speech-to-text engine(s), in the order they are tried.",
+)
+parser.add_argument(
+    "--vosk-model",
+    default="models/vosk-model-small-en-us-0.15",
+    help="Path to the Vosk model used by the local STT engine.",
+)
+parser.add_argument(
+    "--demo",
+    action="store_true",
+    help="Run the ENTER-driven demo sequence instead of reminding at each time_due.",
+)
+parser.add_argument(
+    "--stub",
+    action="store_true",
+    help="Run without hardware, audio or cloud services (canned STT/LLM/TTS), e.g. for load tests.",
+)
+parser.add_argument(
+    "--db",
+    default="medication_manager.db",
+    help="SQLite database file.",
+)
+parser.add_argument(
+    "--durability",
+    choices=["strict", "sd-card"],
+    default="strict",
+    help="strict: fsync every commit. sd-card: WAL with synchronous=NORMAL, batched "
+    "checkpoints and transient audio on tmpfs, to spare the SD card.",
+)
+parser.add_argument(
+    "--archive-db",
+    help="SQLite file for logs past the retention horizon (default: <db>_archive.db).",
+)
+parser.add_argument(
+    "--archive-after-days",
+    type=int,
+    default=90,
+    help="Keep this many days of logs in the main database; older ones are archived.",
+)
+parser.add_argument(
+    "--maintenance-time",
+    default="03:00",
+    metavar="HH:MM",
+    help="Quiet time of day for archiving, incremental VACUUM and PRAGMA optimize.",
+)
+parser.add_argument(
+    "--serial-port",
+    action="append",
+    metavar="PATH[@PATIENT_ID]",
+    help="Pillbox serial port; repeat for several pillboxes. With @PATIENT_ID the "
+    "pillbox belongs to that patient instead of whoever is being reminded.",
+)
+parser.add_argument(
+    "--speaker",
+    action="append",
+    metavar="NAME=INPUT[:OUTPUT][@PATIENT_ID,...]",
+    help="Speaker/microphone by PyAudio device index; repeat for one per room. "
+    "Reminders for the listed patients run on it, everyone else's on the first "
+    "speaker. Default: the ReSpeaker HAT.",
+)
+parser.add_argument(
+    "--serve",
+    choices=["dev", "production"],
+    default="dev",
+    help="dev: Werkzeug debug server. production: gevent server with websockets, debug off.",
+)
+parser.add_argument("--host", default="0.0.0.0")
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument(
+    "--max-connections",
+    type=int,
+    default=1000,
+    help="Production mode: maximum concurrent HTTP/websocket connections.",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=16,
+    help="Worker threads for blocking cloud/audio calls made by reminder sessions.",
+)
+args = parser.parse_args()
+
+if args.serve == "production":
+    # gevent has to patch sockets before anything else imports them. Threads are
+    # left alone so the audio, serial and session threads stay real OS threads,
+    # and so is queue: the writer, emitter and thread pools hand work between
+    # those threads through it, and a gevent queue only works within one.
+    from gevent import monkey
+
+    monkey.patch_all(thread=False, select=False, queue=False)
+
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
+from flask_socketio import SocketIO, emit, join_room
 import sqlite3
 from datetime import datetime, timedelta
 import os
-import sys
 import time
 import wave
 import json
 import random
-import argparse
 import pyaudio
-import audioop
 import requests
 import threading
 import serial
@@ -18,66 +134,211 @@ from threading import Lock
 from dotenv import load_dotenv
 import urllib.parse
 import atexit
-from google.cloud import speech
+import functools
+import hashlib
+import shutil
+from contextlib import contextmanager
 from google.cloud import texttospeech
 import vertexai
 from vertexai.generative_models import GenerativeModel
+from stt_backends import build_grammar, make_stt_backend, rms as frame_rms
+from scheduler import ReminderScheduler, next_occurrence
+from reminder_sessions import (
+    DeviceContext,
+    ReminderSession,
+    SessionRunner,
+    greeting_text,
+)
+from event_bus import EventBus, MedicationStatusEvent
+import adherence
+import analytics
+import archive
+import durability
+import patient_import
+import patient_search
+import schedules
+import change_log
+import alerts
+from alerts import AlertStore
+from db_writer import DBWriter, gevent_wait
+from io_accounting import IOAccounting
+from metrics import CONTENT_TYPE, DEFAULT_BUCKETS, Registry, ResponseTimer
+from socket_emitter import CoalescingEmitter, DASHBOARD_ROOM, patient_room
 
 load_dotenv()
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "interfaces"))
 
-parser = argparse.ArgumentParser(description="Medication Manager Voice Assistant")
-parser.add_argument(
-    "--no-pi",
-    action="store_true",
-    help="Run in local test mode without Pi-specific hardware (LEDs) or Arduino.",
-)
-args = parser.parse_args()
-
-if args.no_pi:
-    print("--- RUNNING IN AUDIO-ENABLED LOCAL TEST MODE (--no-pi) ---")
-
-    class MockPixels:
-        def listen(self):
-            print("\n[LED: LISTENING]")
-
-        def think(self):
-            print("[LED: THINKING]")
 
-        def speak(self):
-            print("[LED: SPEAKING]")
+if args.no_pi or args.stub:
+    if args.stub:
+        print("--- RUNNING IN STUBBED MODE (--stub): no hardware, audio or cloud ---")
+    else:
+        print("--- RUNNING IN AUDIO-ENABLED LOCAL TEST MODE (--no-pi) ---")
 
-        def off(self):
-            print("[LED: OFF]")
+    # Same LED code as on the Pi, with a simulated strip that prints each state
+    from led_backend import SimulatedBackend
+    from pixels import Pixels
 
-    pixels = MockPixels()
+    pixels = Pixels(backend=SimulatedBackend(args.led_log, echo=True))
 else:
     try:
-        sys.path.append(os.path.join(os.path.dirname(__file__), "interfaces"))
-        from pixels import pixels
+        from led_backend import HardwareBackend
+        from pixels import Pixels
+
+        pixels = Pixels(backend=HardwareBackend(args.led_log))
     except ImportError as e:
         print(f"FATAL: Raspberry Pi hardware library import failed: {e}")
         sys.exit(1)
 
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
-DB_NAME = "medication_manager.db"
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode="gevent" if args.serve == "production" else "threading",
+)
+socket_emitter = CoalescingEmitter(socketio, window=0.05)
+DB_NAME = args.db
+ARCHIVE_DB = args.archive_db or archive.archive_path(DB_NAME)
+DURABILITY = durability.PROFILES[args.durability]
+
+
+def prepare_writer_connection(conn):
+    durability.apply(conn, DURABILITY)
+    # Streaks that reach back past the retention horizon need archived logs
+    archive.attach(conn, ARCHIVE_DB)
+
+
+# --- Metrics (Prometheus text format on /metrics) ---
+metrics_registry = Registry()
+STAGE_BUCKETS = DEFAULT_BUCKETS + (20.0, 30.0, 60.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+voice_stage_seconds = metrics_registry.histogram(
+    "medmgr_voice_stage_seconds",
+    "Time spent in each voice pipeline stage (record, stt, intent, tts, play).",
+    labels=("stage",),
+    buckets=STAGE_BUCKETS,
+)
+# Observed through each speaker's ResponseTimer
+voice_response_seconds = metrics_registry.histogram(
+    "medmgr_voice_response_seconds",
+    "Patient stopped speaking to assistant started speaking.",
+    buckets=STAGE_BUCKETS,
+)
+cloud_call_seconds = metrics_registry.histogram(
+    "medmgr_cloud_call_seconds",
+    "Google Cloud request time (speech, gemini, tts), failures included.",
+    labels=("service",),
+)
+cloud_call_errors = metrics_registry.counter(
+    "medmgr_cloud_call_errors_total",
+    "Failed Google Cloud requests.",
+    labels=("service",),
+)
+local_stt_seconds = metrics_registry.histogram(
+    "medmgr_local_stt_seconds", "On-device (Vosk) transcription time."
+)
+tts_cache_lookups = metrics_registry.counter(
+    "medmgr_tts_cache_lookups_total",
+    "Replies served from the TTS cache (hit) or synthesized (miss).",
+    labels=("result",),
+)
+db_query_seconds = metrics_registry.histogram(
+    "medmgr_db_query_seconds",
+    "Read-side SQLite execute() time by statement (to the first row of a SELECT).",
+    labels=("op",),
+    buckets=DB_BUCKETS,
+)
+db_commit_seconds = metrics_registry.histogram(
+    "medmgr_db_commit_seconds",
+    "Writer thread transaction time, BEGIN to COMMIT including fsync.",
+    buckets=DB_BUCKETS,
+)
+db_write_seconds = metrics_registry.histogram(
+    "medmgr_db_write_seconds",
+    "Write job latency from submit to commit.",
+    buckets=DB_BUCKETS,
+)
+metrics_registry.gauge(
+    "medmgr_db_write_queue",
+    "Write jobs waiting for the writer thread.",
+    lambda: db_writer.stats()["queued"],
+)
+serial_events = metrics_registry.counter(
+    "medmgr_serial_events_total",
+    "Pillbox serial lines: open (today), wrong_day or other.",
+    labels=("port", "event"),
+)
+serial_errors = metrics_registry.counter(
+    "medmgr_serial_errors_total",
+    "Pillbox serial connect/read errors.",
+    labels=("port",),
+)
+serial_event_seconds = metrics_registry.histogram(
+    "medmgr_serial_event_seconds",
+    "Pillbox event received to announcement ready (DB write and TTS).",
+    labels=("event",),
+    buckets=STAGE_BUCKETS,
+)
+
+
+@contextmanager
+def cloud_call(service):
+    """Times one cloud request; a failure is counted and re-raised."""
+    with cloud_call_seconds.time(service=service):
+        try:
+            yield
+        except Exception:
+            cloud_call_errors.inc(service=service)
+            raise
+
+
+def observe_stt_call(engine, seconds, failed):
+    if engine == "cloud":
+        cloud_call_seconds.observe(seconds, service="speech")
+        if failed:
+            cloud_call_errors.inc(service="speech")
+    else:
+        local_stt_seconds.observe(seconds)
+
+
+def observe_commit(seconds, latencies):
+    db_commit_seconds.observe(seconds)
+    for latency in latencies:
+        db_write_seconds.observe(latency)
+
+
+# All medication status and patient writes go through this one thread
+db_writer = DBWriter(
+    DB_NAME,
+    max_delay=0.005,
+    on_connect=prepare_writer_connection,
+    on_commit=observe_commit,
+    # Request greenlets must not block the gevent hub while a commit is pending
+    wait=gevent_wait if args.serve == "production" else None,
+)
+checkpointer = None
+if DURABILITY.checkpoint_interval:
+    checkpointer = durability.Checkpointer(DB_NAME, DURABILITY.checkpoint_interval)
+io_accounting = IOAccounting()  # Bytes written per reminder turn and per day
 CREDENTIALS_FILE = "google_credentials.json"
 RESPEAKER_RATE = 16000
 RESPEAKER_CHANNELS = 2
 RESPEAKER_WIDTH = 2
 CHUNK = 1024
-INPUT_FILENAME = "input_request.wav"
-OUTPUT_FILENAME = "output_response.wav"
-ALERT_FILENAME = "alert_response.wav"
+TTS_CACHE_DIR = "tts_cache"  # Pre-synthesized greetings, keyed by text
 GEMINI_MODEL_NAME = "gemini-2.5-flash"
 SILENCE_THRESHOLD = 500
 SILENCE_DURATION = 2.0
 MAX_RECORD_SECONDS = 10
+STT_CLOUD_TIMEOUT = 4.0  # Seconds before falling back to the local engine
 SERIAL_PORT = "/dev/ttyACM0"
 BAUD_RATE = 9600
+STUB_ANSWER = "Yes, I took it."  # What the patient "says" in --stub mode
+SNOOZE_SECONDS = 5 * 60  # How long a DELAY answer postpones the reminder
+DEMO_SNOOZE_SECONDS = 5
+MAINTENANCE_JOB = "maintenance"  # Scheduler key; reminders use schedule ids
 
 DAY_MAPPING = {
     "Mon": "Monday",
@@ -89,13 +350,16 @@ DAY_MAPPING = {
     "Sun": "Sunday",
 }
 
-CURRENT_PATIENT_ID = None
-MEDICATION_TAKEN_EVENT = threading.Event()
-audio_lock = Lock()
 pyaudio_instance = None  # Global instance for PyAudio
-global_alerts = []  # List to store active alerts for the frontend
+alert_store = AlertStore(db_writer.write, capacity=50)  # Persisted + recent ring buffer
+event_bus = EventBus()  # Medication status changes, see log_medication_by_id
+reminder_scheduler = ReminderScheduler()
+session_runner = SessionRunner(max_workers=args.workers)
+snooze_counts = {}  # schedule_id -> DELAY answers so far for the current dose
 
-if args.no_pi:
+if args.stub:
+    RESPEAKER_INDEX = -1
+elif args.no_pi:
     p = pyaudio.PyAudio()
     info = p.get_host_api_info_by_index(0)
     numdevices = info.get("deviceCount")
@@ -123,11 +387,72 @@ else:
     atexit.register(terminate_audio)
 
 
+class Speaker:
+    """
+    One speaker/microphone pair (one room). Recording and playback on it are
+    serialised by its own lock, so rooms do not wait for each other.
+    """
+
+    def __init__(self, name, input_index, output_index=None, patient_ids=()):
+        self.name = name
+        self.input_index = input_index
+        self.output_index = output_index  # None: the default output device
+        self.patient_ids = set(patient_ids)
+        # Rewritten on every turn, so on tmpfs under the sd-card profile
+        suffix = "" if name == "default" else f"_{name}"
+        self.input_file = self._audio_file(f"input_request{suffix}.wav")
+        self.output_file = self._audio_file(f"output_response{suffix}.wav")
+        self.alert_file = self._audio_file(f"alert_response{suffix}.wav")
+        self.lock = Lock()
+        self.response_timer = ResponseTimer(voice_response_seconds)
+
+    @staticmethod
+    def _audio_file(name):
+        return durability.audio_path(DURABILITY, name)
+
+
+def configured_speakers():
+    """A Speaker per --speaker, or the ReSpeaker HAT alone."""
+    if not args.speaker:
+        return [Speaker("default", RESPEAKER_INDEX)]
+
+    speakers = []
+    for spec in args.speaker:
+        spec, _, patient_ids = spec.partition("@")
+        name, _, indexes = spec.partition("=")
+        input_index, _, output_index = indexes.partition(":")
+        speakers.append(
+            Speaker(
+                name,
+                int(input_index) if input_index else RESPEAKER_INDEX,
+                int(output_index) if output_index else None,
+                [int(i) for i in patient_ids.split(",") if i],
+            )
+        )
+    return speakers
+
+
+speakers = configured_speakers()
+default_speaker = speakers[0]
+
+
+def speaker_for(patient_id):
+    """The speaker a patient is reminded on: theirs, else the first one."""
+    for speaker in speakers:
+        if patient_id in speaker.patient_ids:
+            return speaker
+    return default_speaker
+
+
 # --- Database Setup (Merged from setup_db.py) ---
 def setup_database():
     print("--- Running Database Setup for Flask App ---")
     conn = sqlite3.connect(DB_NAME)
+    durability.apply(conn, DURABILITY, persistent=True)
     c = conn.cursor()
+    # Lets the nightly maintenance hand freed pages back (new databases only)
+    if not archive.enable_incremental_vacuum(c):
+        print("Run 'python archive.py --vacuum' once to enable incremental VACUUM.")
     # Create tables
     c.execute(
         """
@@ -139,20 +464,17 @@ def setup_database():
         )
     """
     )
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS medication_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            time_taken TEXT,
-            status TEXT NOT NULL CHECK(status IN ('TAKEN', 'MISSED', 'PENDING')),
-            notes TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients (id),
-            UNIQUE(patient_id, date)
-        )
-    """
-    )
+    # Dose schedules and per-dose logs (migrates one-log-per-day databases)
+    schedules.create_tables(c)
+    conn.commit()  # ATTACH cannot run inside the migration's transaction
+    archive.attach(conn, ARCHIVE_DB)
+    change_log.create_table(c)
+    alerts.create_table(c)
+    adherence.create_tables(c)
+    # Databases from before the rollups (or their per-day counts) existed get
+    # them computed once
+    if c.execute("SELECT 1 FROM adherence_days LIMIT 1").fetchone() is None:
+        adherence.rebuild(c)
 
     # Check if we already have patients
     c.execute("SELECT count(*) FROM patients")
@@ -170,14 +492,28 @@ def setup_database():
         )
         print("Seeded patients.")
 
-    c.execute("SELECT id, name FROM patients")
+    # Name lookup indexes and first schedules (also for patients added before
+    # they existed)
+    patient_search.create_index(c)
+    schedules.backfill(c)
+
+    c.execute(
+        """SELECT p.id, p.name, MIN(s.id) FROM patients p
+        JOIN schedules s ON s.patient_id = p.id GROUP BY p.id"""
+    )
     patient_list = c.fetchall()
 
     start_date = datetime(2025, 11, 1).date()
     end_date = datetime(2025, 12, 7).date()
     delta = end_date - start_date
 
-    for pid, name in patient_list:
+    for pid, name, schedule_id in patient_list:
+        # Seeded days that have been archived since must not come back
+        if c.execute(
+            "SELECT 1 FROM archive.medication_logs WHERE patient_id = ? LIMIT 1",
+            (pid,),
+        ).fetchone():
+            continue
         for i in range(delta.days + 1):
             log_date_obj = start_date + timedelta(days=i)
             log_date = log_date_obj.strftime("%Y-%m-%d")
@@ -201,80 +537,194 @@ def setup_database():
             time_taken = "09:00:00" if status == "TAKEN" else None
 
             c.execute(
-                "INSERT OR IGNORE INTO medication_logs (patient_id, date, time_taken, status, notes) VALUES (?, ?, ?, ?, ?)",
-                (pid, log_date, time_taken, status, "Seeded data"),
+                "INSERT OR IGNORE INTO medication_logs (patient_id, schedule_id, date, time_taken, status, notes) VALUES (?, ?, ?, ?, ?, ?)",
+                (pid, schedule_id, log_date, time_taken, status, "Seeded data"),
             )
+            if c.rowcount:
+                adherence.apply_change(c, pid, log_date, None, status)
 
     conn.commit()
     conn.close()
     print("--- Flask DB Setup Complete ---")
 
 
-if not os.path.exists(CREDENTIALS_FILE):
-    print(f"Error: {CREDENTIALS_FILE} not found!")
-    sys.exit(1)
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_FILE
-
-try:
-    with open(CREDENTIALS_FILE, "r") as f:
-        creds_data = json.load(f)
-    vertexai.init(project=creds_data.get("project_id"), location="us-central1")
-    model = GenerativeModel(
-        GEMINI_MODEL_NAME,
-        system_instruction=[
-            "You are a helpful medication manager assistant.",
-            "Return ONLY a JSON object.",
-            "Possible intents: 'MEDICATION_LOG', 'NEW_PATIENT', 'INTRODUCTION', 'DELAY', 'CONFIRMATION', 'UNKNOWN'.",
-            "If user says 'Yes' or 'I took it', return intent: CONFIRMATION value: YES.",
-            "If user says 'No' or 'Not yet', return intent: CONFIRMATION value: NO.",
-            "If user says 'Give me 5 minutes', return intent: DELAY.",
-        ],
-    )
-    print(f"* Vertex AI Initialized: {GEMINI_MODEL_NAME}")
-except Exception as e:
-    print(f"Error initializing Vertex AI: {e}")
-    sys.exit(1)
+model = None
+if not args.stub:
+    if not os.path.exists(CREDENTIALS_FILE):
+        print(f"Error: {CREDENTIALS_FILE} not found!")
+        sys.exit(1)
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_FILE
+
+    try:
+        with open(CREDENTIALS_FILE, "r") as f:
+            creds_data = json.load(f)
+        vertexai.init(project=creds_data.get("project_id"), location="us-central1")
+        model = GenerativeModel(
+            GEMINI_MODEL_NAME,
+            system_instruction=[
+                "You are a helpful medication manager assistant.",
+                "Return ONLY a JSON object.",
+                "Possible intents: 'MEDICATION_LOG', 'NEW_PATIENT', 'INTRODUCTION', 'DELAY', 'CONFIRMATION', 'UNKNOWN'.",
+                "If user says 'Yes' or 'I took it', return intent: CONFIRMATION value: YES.",
+                "If user says 'No' or 'Not yet', return intent: CONFIRMATION value: NO.",
+                "If user says 'Give me 5 minutes', return intent: DELAY.",
+                "If user says a patient took their medicine ('Joan took her iron'), "
+                "return intent: MEDICATION_LOG with name: the patient's name as heard.",
+                "If user says who they are, return intent: INTRODUCTION with name: "
+                "their name as heard.",
+            ],
+        )
+        print(f"* Vertex AI Initialized: {GEMINI_MODEL_NAME}")
+    except Exception as e:
+        print(f"Error initializing Vertex AI: {e}")
+        sys.exit(1)
+
+stt_backend = None
+if not args.no_pi and not args.stub:
+    try:
+        stt_backend = make_stt_backend(
+            args.stt,
+            RESPEAKER_RATE,
+            RESPEAKER_CHANNELS,
+            model_path=args.vosk_model,
+            cloud_timeout=STT_CLOUD_TIMEOUT,
+            grammar=build_grammar(),
+            on_call=observe_stt_call,
+        )
+        print(f"* STT Initialized: {stt_backend.name}")
+    except Exception as e:
+        print(f"Error initializing STT: {e}")
+        sys.exit(1)
+
+
+class MeteredConnection(sqlite3.Connection):
+    """sqlite3 connection whose execute() calls feed medmgr_db_query_seconds."""
+
+    def execute(self, sql, *args):
+        with db_query_seconds.time(op=sql.split(None, 1)[0].upper()):
+            return super().execute(sql, *args)
 
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, factory=MeteredConnection)
     conn.row_factory = sqlite3.Row
+    # Any commit made here must not fsync or auto-checkpoint behind the profile's back
+    durability.apply(conn, DURABILITY)
     return conn
 
 
-def log_medication(patient_name, status, notes=None):
-    try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT id FROM patients WHERE name LIKE ?", (f"%{patient_name}%",))
-        patient = c.fetchone()
-        if not patient:
-            conn.close()
-            return False, "Patient not found."
+def get_history_connection():
+    """Like get_db_connection, with archived logs readable as well."""
+    conn = get_db_connection()
+    archive.attach(conn, ARCHIVE_DB)
+    return conn
 
-        patient_id = patient["id"]
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        time_str = datetime.now().strftime("%H:%M:%S")
 
-        c.execute(
-            """INSERT INTO medication_logs (patient_id, date, time_taken, status, notes)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(patient_id, date) DO UPDATE SET
-            status=excluded.status, time_taken=excluded.time_taken, notes=excluded.notes""",
-            (patient_id, date_str, time_str, status, notes),
-        )
-        conn.commit()
-        conn.close()
+def get_today_status(patient_id, schedule_id=None):
+    """Today's status of one dose, or of the patient's first dose."""
+    conn = get_db_connection()
+    if schedule_id is None:
+        schedule_id = schedules.primary_schedule_id(conn, patient_id)
+    log = conn.execute(
+        "SELECT status FROM medication_logs WHERE schedule_id = ? AND date = ?",
+        (schedule_id, datetime.now().strftime("%Y-%m-%d")),
+    ).fetchone()
+    conn.close()
+    return log["status"] if log else None
 
-        # Emit real-time update
-        socketio.emit(
-            "status_update",
-            {
-                "patient_id": patient_id,
-                "patient_name": patient_name,
-                "status": status,
-                "time_taken": time_str,
-            },
+
+def write_status(
+    c, patient_id, patient_name, date_str, status, time_str, notes, schedule_id=None
+):
+    """
+    Upserts one dose's status for a day and records it in the change log, in
+    the caller's transaction, keeping the adherence rollups in step. Without
+    a schedule_id the patient's first schedule is used. Returns the
+    change_log seq.
+    """
+    if schedule_id is None:
+        schedule_id = schedules.primary_schedule_id(c, patient_id)
+    previous = c.execute(
+        "SELECT status FROM medication_logs WHERE schedule_id = ? AND date = ?",
+        (schedule_id, date_str),
+    ).fetchone()
+    c.execute(
+        """INSERT INTO medication_logs (patient_id, schedule_id, date, time_taken, status, notes)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(schedule_id, date) DO UPDATE SET
+        status=excluded.status, time_taken=excluded.time_taken, notes=excluded.notes""",
+        (patient_id, schedule_id, date_str, time_str, status, notes),
+    )
+    adherence.apply_change(
+        c, patient_id, date_str, previous[0] if previous else None, status
+    )
+    return change_log.record_change(
+        c,
+        "medication_log",
+        patient_id,
+        "upsert",
+        {
+            "patient_id": patient_id,
+            "patient_name": patient_name,
+            "schedule_id": schedule_id,
+            "date": date_str,
+            "status": status,
+            "time_taken": time_str,
+            "notes": notes,
+        },
+    )
+
+
+def _log_medication_job(conn, patient_id, status, notes, schedule_id):
+    patient = conn.execute(
+        "SELECT id, name FROM patients WHERE id = ?", (patient_id,)
+    ).fetchone()
+    if not patient:
+        return None
+
+    now = datetime.now()
+    if schedule_id is None:
+        schedule_id = schedules.current_schedule_id(conn, patient_id, now)
+    date_str = now.strftime("%Y-%m-%d")
+    time_str = now.strftime("%H:%M:%S")
+    seq = write_status(
+        conn,
+        patient["id"],
+        patient["name"],
+        date_str,
+        status,
+        time_str,
+        notes,
+        schedule_id,
+    )
+    return patient["name"], schedule_id, date_str, time_str, seq
+
+
+def log_medication_by_id(patient_id, status, notes=None, schedule_id=None):
+    """
+    Logs today's status for one of a patient's doses; without a schedule_id,
+    the dose closest to now that is not taken yet. Returns (ok, message).
+    """
+    try:
+        written = db_writer.write(
+            _log_medication_job, patient_id, status, notes, schedule_id
+        )
+        if not written:
+            return False, "Patient not found."
+        name, schedule_id, date_str, time_str, seq = written
+
+        # Only after the commit: tell reminder sessions, dashboards and alerting
+        event_bus.publish(
+            MedicationStatusEvent(
+                patient_id=patient_id,
+                patient_name=name,
+                status=status,
+                date=date_str,
+                time_taken=time_str,
+                notes=notes,
+                seq=seq,
+                schedule_id=schedule_id,
+            )
         )
         return True, "Success"
     except Exception as e:
@@ -282,10 +732,40 @@ def log_medication(patient_name, status, notes=None):
         return False, str(e)
 
 
-def record_audio():
+def emit_status_update(event):
+    """Queues a status change for the next status_batch to the dashboards."""
+    socket_emitter.status_update(
+        {
+            "patient_id": event.patient_id,
+            "patient_name": event.patient_name,
+            "status": event.status,
+            "date": event.date,
+            "time_taken": event.time_taken if event.status == "TAKEN" else None,
+            "seq": event.seq,
+            "schedule_id": event.schedule_id,
+        }
+    )
+
+
+event_bus.subscribe(MedicationStatusEvent, emit_status_update)
+
+
+@voice_stage_seconds.time(stage="record")
+def record_audio(cancel=None, speaker=None):
+    """
+    Records one answer on `speaker` (the first one by default) to its
+    input_file. Stops early, returning None, once `cancel` (a threading.Event)
+    is set, e.g. when the pillbox reports the dose taken mid-recording, so the
+    speaker's lock is freed for the next session.
+    """
+    speaker = speaker or default_speaker
+    if args.stub:
+        speaker.response_timer.heard(over=cancel)
+        return STUB_ANSWER
     if args.no_pi:
         pixels.listen()
         text_input = input("🎤 YOU (type response): ")
+        speaker.response_timer.heard(over=cancel)
         pixels.off()
         return text_input
 
@@ -294,14 +774,14 @@ def record_audio():
     p = pyaudio_instance  # Use the global instance
 
     # Use lock to prevent conflict with play_audio
-    with audio_lock:
+    with speaker.lock:
         try:
             stream = p.open(
                 rate=RESPEAKER_RATE,
                 format=p.get_format_from_width(RESPEAKER_WIDTH),
                 channels=RESPEAKER_CHANNELS,
                 input=True,
-                input_device_index=RESPEAKER_INDEX,
+                input_device_index=speaker.input_index,
             )
             frames = []
             silent_chunks = 0
@@ -310,17 +790,28 @@ def record_audio():
             max_total = int(chunks_per_second * MAX_RECORD_SECONDS)
             count = 0
 
-            while True:
+            while not (cancel and cancel.is_set()):
                 data = stream.read(CHUNK, exception_on_overflow=False)
                 frames.append(data)
                 count += 1
-                rms = audioop.rms(data, 2)
+                rms = frame_rms(data)
                 if rms < SILENCE_THRESHOLD:
                     silent_chunks += 1
                 else:
                     silent_chunks = 0
                 if silent_chunks > max_silent or count > max_total:
                     break
+            else:
+                stream.stop_stream()
+                stream.close()
+                print("* Recording cancelled.")
+                pixels.off()
+                return None
+
+            # The patient stopped speaking where the trailing silence began
+            speaker.response_timer.heard(
+                time.perf_counter() - silent_chunks / chunks_per_second, over=cancel
+            )
 
             stream.stop_stream()
             stream.close()
@@ -328,11 +819,11 @@ def record_audio():
         except Exception as e:
             print(f"Error recording: {e}")
             pixels.off()
-            return INPUT_FILENAME
+            return speaker.input_file
 
         try:
             silence = b"\x00" * int(RESPEAKER_RATE * RESPEAKER_WIDTH * 0.5)
-            wf = wave.open(INPUT_FILENAME, "wb")
+            wf = wave.open(speaker.input_file, "wb")
             wf.setnchannels(RESPEAKER_CHANNELS)
             wf.setsampwidth(p.get_sample_size(p.get_format_from_width(RESPEAKER_WIDTH)))
             wf.setframerate(RESPEAKER_RATE)
@@ -342,80 +833,132 @@ def record_audio():
             print(f"Error saving wav: {e}")
 
     pixels.off()
-    return INPUT_FILENAME
+    return speaker.input_file
+
+
+@voice_stage_seconds.time(stage="stt")
+def speech_to_text(audio_or_text, cancel=None, speaker=None):
+    if cancel and cancel.is_set():
+        return None  # The session is over; don't spend a cloud call on it
+    if args.no_pi or args.stub:
+        text = audio_or_text
+    else:
+        print("* STT Processing...")
+        pixels.think()
+        text = stt_backend.transcribe(audio_or_text)
+        pixels.off()
+        if text:
+            print(f"You said: {text}")
+    if not text:
+        # Nothing heard, so nothing to reply to
+        (speaker or default_speaker).response_timer.cancel()
+    return text
 
 
-def speech_to_text(audio_or_text):
-    if args.no_pi:
-        return audio_or_text
-    print("* STT Processing...")
-    pixels.think()
-    client = speech.SpeechClient()
-    with open(audio_or_text, "rb") as audio:
-        content = audio.read()
-    audio = speech.RecognitionAudio(content=content)
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-        sample_rate_hertz=RESPEAKER_RATE,
-        language_code="en-US",
-        audio_channel_count=RESPEAKER_CHANNELS,
+def tts_cache_file(text):
+    return os.path.join(
+        TTS_CACHE_DIR, hashlib.sha1(text.encode("utf-8")).hexdigest() + ".wav"
     )
-    try:
-        response = client.recognize(config=config, audio=audio)
-        pixels.off()
-        for result in response.results:
-            text = result.alternatives[0].transcript
-            print(f"You said: {text}")
-            return text
-    except Exception as e:
-        print(f"STT Error: {e}")
-    pixels.off()
-    return None
 
 
-def text_to_speech(text, filename=OUTPUT_FILENAME):
+def synthesize_speech(client, text):
+    """Returns LINEAR16 audio for `text` from Google Cloud TTS."""
+    ssml_text = f'<speak><break time="250ms"/>{text}</speak>'
+    synthesis_input = texttospeech.SynthesisInput(ssml=ssml_text)
+    voice = texttospeech.VoiceSelectionParams(
+        language_code="en-US", ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+    )
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.LINEAR16, sample_rate_hertz=16000
+    )
+    with cloud_call("tts"):
+        response = client.synthesize_speech(
+            input=synthesis_input, voice=voice, audio_config=audio_config
+        )
+    return response.audio_content
+
+
+def prewarm_greetings(patients):
+    """
+    Synthesizes each patient's reminder greeting into the TTS cache with one
+    client for the whole batch, so the first reminder does not wait on TTS.
+    """
+    if args.stub or args.no_pi:
+        return
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+    client = texttospeech.TextToSpeechClient()
+    warmed = 0
+    for p in patients:
+        text = greeting_text(p["name"], p["time_due"], p["medicine"])
+        path = tts_cache_file(text)
+        if os.path.exists(path):
+            continue
+        try:
+            audio = synthesize_speech(client, text)
+        except Exception as e:
+            print(f"TTS pre-warm error for {p['name']}: {e}")
+            continue
+        # Write then rename so a reminder never plays a half-written file
+        with open(path + ".tmp", "wb") as out:
+            out.write(audio)
+        os.replace(path + ".tmp", path)
+        warmed += 1
+    print(f"* Pre-warmed {warmed} greetings.")
+
+
+@voice_stage_seconds.time(stage="tts")
+def text_to_speech(text, filename=None, speaker=None):
     """
-    Synthesizes speech.
+    Synthesizes speech, by default to the speaker's output_file.
     Accepts a filename so the Pillbox thread can use a different file
     than the main thread to avoid collisions.
     """
+    speaker = speaker or default_speaker
+    filename = filename or speaker.output_file
+    if args.stub:
+        return True
     if args.no_pi:
         print(f"🔊 ASSISTANT: {text}")
         return True
 
+    cached = tts_cache_file(text)
+    if os.path.exists(cached):
+        tts_cache_lookups.inc(result="hit")
+        shutil.copyfile(cached, filename)
+        return True
+    tts_cache_lookups.inc(result="miss")
+
     print(f"* Synthesizing: '{text}'")
     pixels.think()
     client = texttospeech.TextToSpeechClient()
-    ssml_text = f'<speak><break time="250ms"/>{text}</speak>'
-    synthesis_input = texttospeech.SynthesisInput(ssml=ssml_text)
-    voice = texttospeech.VoiceSelectionParams(
-        language_code="en-US", ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-    )
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.LINEAR16, sample_rate_hertz=16000
-    )
 
     try:
-        response = client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+        audio = synthesize_speech(client, text)
         with open(filename, "wb") as out:
-            out.write(response.audio_content)
+            out.write(audio)
         pixels.off()
         return True
     except Exception as e:
         print(f"TTS Error: {e}")
         pixels.off()
+        if filename == speaker.output_file:
+            speaker.response_timer.cancel()  # No reply will be played for this turn
         return False
 
 
-def play_audio(audio_file):
-    if args.no_pi:
+@voice_stage_seconds.time(stage="play")
+def play_audio(audio_file, speaker=None):
+    speaker = speaker or default_speaker
+    # Pillbox announcements are not replies to anything the patient said
+    replying = audio_file != speaker.alert_file
+    if args.no_pi or args.stub:
+        if replying:
+            speaker.response_timer.speaking()
         return
 
     # --- CRITICAL: THREAD LOCK ---
     # This ensures the Pillbox and the Assistant don't speak over each other
-    with audio_lock:
+    with speaker.lock:
         print(f"* Playing {audio_file}...")
         pixels.speak()
         wf = wave.open(audio_file, "rb")
@@ -426,8 +969,11 @@ def play_audio(audio_file):
                 channels=wf.getnchannels(),
                 rate=wf.getframerate(),
                 output=True,
+                output_device_index=speaker.output_index,
             )
             data = wf.readframes(CHUNK)
+            if replying:
+                speaker.response_timer.speaking()
             while data:
                 stream.write(data)
                 data = wf.readframes(CHUNK)
@@ -439,21 +985,31 @@ def play_audio(audio_file):
             wf.close()
 
 
+@voice_stage_seconds.time(stage="intent")
 def process_intent(text):
+    if args.stub:
+        lowered = text.lower()
+        if "minute" in lowered or "later" in lowered:
+            return {"intent": "DELAY"}
+        if "yes" in lowered or "took" in lowered:
+            return {"intent": "CONFIRMATION", "value": "YES"}
+        return {"intent": "UNKNOWN"}
+
     print(f"* Gemini Analysis: '{text}'")
     pixels.think()
     try:
-        conn = get_db_connection()
-        patients = conn.execute("SELECT name, time_due FROM patients").fetchall()
-        conn.close()
-        patient_context = ", ".join(
-            [f"{p['name']} ({p['time_due']})" for p in patients]
-        )
-
-        full_prompt = f"Context: {patient_context}. User says: '{text}'"
-        response = model.generate_content(full_prompt)
+        with cloud_call("gemini"):
+            response = model.generate_content(f"User says: '{text}'")
         cleaned_text = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(cleaned_text)
+        intent_data = json.loads(cleaned_text)
+        # Gemini repeats the name it heard; the name indexes decide who that is
+        if intent_data.get("name"):
+            conn = get_db_connection()
+            intent_data["patient_id"] = patient_search.resolve(
+                conn, intent_data["name"]
+            )
+            conn.close()
+        return intent_data
     except Exception as e:
         print(f"Gemini Error: {e}")
         return {"intent": "UNKNOWN"}
@@ -461,206 +1017,308 @@ def process_intent(text):
 
 def trigger_caregiver_alert(patient_name, reason):
     """Triggers a visual alert on the Flask dashboard."""
-    alert_msg = f"ALERT: {patient_name} - {reason}"
-    print(f"🚨 {alert_msg}")
-
-    # Add to global list
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    alert_data = {"message": alert_msg, "timestamp": timestamp}
-    global_alerts.append(alert_data)
+    alert_data = alert_store.add(patient_name, reason)
+    print(f"🚨 {alert_data['message']}")
 
     # Emit socket event for immediate popup
-    socketio.emit("new_alert", alert_data)
+    socket_emitter.emit("new_alert", alert_data, room=DASHBOARD_ROOM)
+
+
+def alert_on_missed(event):
+    """A dose logged MISSED with a reason gets escalated to the caregiver."""
+    if event.status == "MISSED" and event.notes:
+        trigger_caregiver_alert(event.patient_name, event.notes)
+
+
+event_bus.subscribe(MedicationStatusEvent, alert_on_missed)
+
 
+def pillbox_ports():
+    """(port, patient_id or None) for every pillbox to monitor."""
+    if args.serial_port:
+        specs = args.serial_port
+    elif args.no_pi or args.stub:
+        specs = []
+    else:
+        specs = [SERIAL_PORT]
 
-def monitor_pillbox():
+    ports = []
+    for spec in specs:
+        port, _, patient_id = spec.partition("@")
+        ports.append((port, int(patient_id) if patient_id else None))
+    return ports
+
+
+def monitor_pillbox(port=SERIAL_PORT, patient_id=None):
     """
     Background thread that listens to the Arduino via USB Serial.
     It specifically looks for the 'OPENEVENT:' tag defined in your Arduino code.
+    A pillbox bound to `patient_id` always logs for that patient; otherwise the
+    opening is credited to whoever the assistant is currently reminding.
     """
-    if args.no_pi:
-        print("--- No Pi Mode: Skipping Serial Monitor ---")
-        return
-
-    print(f"--- Connecting to Arduino on {SERIAL_PORT} ---")
+    print(f"--- Connecting to Arduino on {port} ---")
 
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        ser = serial.Serial(port, BAUD_RATE, timeout=1)
         ser.flush()
     except Exception as e:
+        serial_errors.inc(port=port)
         print(f"⚠️ Error connecting to Arduino: {e}")
         return
 
     while True:
         try:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode("utf-8").strip()
-
-                if line.startswith("OPENEVENT:"):
-                    parts = line.split(":")
-                    if len(parts) >= 2:
-                        short_day = parts[1].strip()
-                        full_day = DAY_MAPPING.get(short_day, "Unknown Day")
-                        today_short_day = datetime.now().strftime("%a")
-
-                        if short_day == today_short_day:
-                            if CURRENT_PATIENT_ID is not None:
-                                conn = get_db_connection()
-                                patient = conn.execute(
-                                    "SELECT name FROM patients WHERE id = ?",
-                                    (CURRENT_PATIENT_ID,),
-                                ).fetchone()
-
-                                if patient:
-                                    log_medication(
-                                        patient["name"],
-                                        "TAKEN",
-                                        notes="Taken via pillbox.",
-                                    )
-                                    print(
-                                        f"💊 Pillbox event logged as TAKEN for {patient['name']}"
-                                    )
-                                    MEDICATION_TAKEN_EVENT.set()  # Signal main thread
-                                    message = "Thank you for taking your medication."
-                                else:
-                                    message = "Pillbox opened, but could not find the current patient."
-                                conn.close()
-                            else:
+            # Blocks for up to the 1s timeout instead of spinning on in_waiting
+            line = ser.readline().decode("utf-8").strip()
+            if not line:
+                continue
+            received = time.perf_counter()
+
+            if not line.startswith("OPENEVENT:"):
+                serial_events.inc(port=port, event="other")
+            else:
+                parts = line.split(":")
+                if len(parts) >= 2:
+                    short_day = parts[1].strip()
+                    full_day = DAY_MAPPING.get(short_day, "Unknown Day")
+                    today_short_day = datetime.now().strftime("%a")
+                    speaker = speaker_for(patient_id)
+
+                    if short_day == today_short_day:
+                        # A bound pillbox credits the patient's nearest open dose
+                        active_patient_id = patient_id
+                        schedule_id = None
+                        if active_patient_id is None:
+                            active_patient_id, schedule_id = active_dose()
+                        if active_patient_id is not None:
+                            speaker = speaker_for(active_patient_id)
+                            ok, _ = log_medication_by_id(
+                                active_patient_id,
+                                "TAKEN",
+                                notes="Taken via pillbox.",
+                                schedule_id=schedule_id,
+                            )
+                            if ok:
                                 print(
-                                    "💊 Pillbox opened, but no active patient reminder."
+                                    f"💊 Pillbox event logged as TAKEN for patient {active_patient_id}"
                                 )
-                                message = "Pillbox opened."
-
-                            if text_to_speech(message, filename=ALERT_FILENAME):
-                                play_audio(ALERT_FILENAME)
+                                message = "Thank you for taking your medication."
+                            else:
+                                message = "Pillbox opened, but could not find the current patient."
                         else:
-                            print(f"💊 PILLBOX EVENT DETECTED for {full_day}")
-                            today_full_day = DAY_MAPPING.get(
-                                today_short_day, today_short_day
-                            )
-                            message = f"The pillbox for {full_day} has been opened. Today is {today_full_day}."
-                            if text_to_speech(message, filename=ALERT_FILENAME):
-                                play_audio(ALERT_FILENAME)
+                            print("💊 Pillbox opened, but no active patient reminder.")
+                            message = "Pillbox opened."
+                        event = "open"
+                    else:
+                        print(f"💊 PILLBOX EVENT DETECTED for {full_day}")
+                        today_full_day = DAY_MAPPING.get(
+                            today_short_day, today_short_day
+                        )
+                        message = f"The pillbox for {full_day} has been opened. Today is {today_full_day}."
+                        event = "wrong_day"
+
+                    serial_events.inc(port=port, event=event)
+                    if text_to_speech(message, speaker.alert_file, speaker):
+                        serial_event_seconds.observe(
+                            time.perf_counter() - received, event=event
+                        )
+                        play_audio(speaker.alert_file, speaker)
 
         except Exception as e:
+            serial_errors.inc(port=port)
             print(f"Serial Error: {e}")
             time.sleep(1)
 
 
-def run_reminder_flow(patient_id, patient_name, medicine, time_due):
-    print(f"\n--- Reminder for {patient_name} ---")
-    reminders_count = 0
-    max_reminders = 3
-    delays_count = 0
-    max_delays = 3
+def make_device(speaker):
+    """The DeviceContext reminder sessions on `speaker` talk through."""
+    return DeviceContext(
+        speaker.name,
+        record=functools.partial(record_audio, speaker=speaker),
+        transcribe=functools.partial(speech_to_text, speaker=speaker),
+        understand=process_intent,
+        synthesize=functools.partial(text_to_speech, speaker=speaker),
+        play=functools.partial(play_audio, speaker=speaker),
+        status=get_today_status,
+        log=log_medication_by_id,
+        bus=event_bus,
+        output_file=speaker.output_file,
+        accounting=io_accounting,
+    )
+
 
-    # --- NEW: Check status before starting flow ---
+# One per speaker, so reminders in different rooms run concurrently
+devices = {speaker.name: make_device(speaker) for speaker in speakers}
+
+
+def device_for(patient_id):
+    return devices[speaker_for(patient_id).name]
+
+
+def active_dose():
+    """(patient_id, schedule_id) some device is reminding, or (None, None)."""
+    for device in devices.values():
+        if device.active_patient_id is not None:
+            return device.active_patient_id, device.active_schedule_id
+    return None, None
+
+
+def run_reminder_flow(
+    patient_id, patient_name, medicine, time_due, delays_count=0, schedule_id=None
+):
+    """
+    Runs one reminder conversation to completion on the calling thread.
+    Returns "TAKEN", "MISSED" or "SNOOZED".
+    """
+    session = ReminderSession(
+        device_for(patient_id),
+        patient_id,
+        patient_name,
+        medicine,
+        time_due,
+        delays_count,
+        schedule_id=schedule_id,
+    )
+    try:
+        return session_runner.run(session)
+    finally:
+        report_turn_io(patient_name, session.io)
+
+
+DOSES_QUERY = """SELECT p.id, s.id AS schedule_id, p.name, s.medicine, s.time_due
+    FROM schedules s JOIN patients p ON p.id = s.patient_id WHERE s.active = 1"""
+
+
+def load_doses(conn, schedule_id=None):
+    """
+    Active doses as reminder dicts: the patient's id and name with one
+    schedule's id, medicine and time_due.
+    """
+    if schedule_id is None:
+        rows = conn.execute(DOSES_QUERY + " ORDER BY s.id").fetchall()
+    else:
+        rows = conn.execute(DOSES_QUERY + " AND s.id = ?", (schedule_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def fire_reminder(dose):
+    """
+    Scheduler callback: starts a reminder session without waiting for it, so
+    other due doses (on other devices) are not held up.
+    """
+    session = ReminderSession(
+        device_for(dose["id"]),
+        dose["id"],
+        dose["name"],
+        dose["medicine"],
+        dose["time_due"],
+        delays_count=snooze_counts.get(dose["schedule_id"], 0),
+        schedule_id=dose["schedule_id"],
+    )
+    future = session_runner.submit(session)
+    future.add_done_callback(lambda f: reminder_finished(dose, session, f))
+
+
+def report_turn_io(patient_name, delta):
+    if delta:
+        print(
+            f"* I/O for {patient_name}'s reminder: {delta['storage_bytes'] / 1024:.1f} KB "
+            f"to storage, {delta['wchar'] / 1024:.1f} KB written in total"
+        )
+
+
+def reminder_finished(dose, session, future):
+    """Books the next timer once a reminder session is over."""
+    schedule_id = dose["schedule_id"]
+    device = session.device
+    report_turn_io(dose["name"], session.io)
+    try:
+        outcome = future.result()
+    except Exception as e:
+        print(f"Error in reminder for {dose['name']}: {e}")
+        outcome = None
+
+    if outcome == "SNOOZED":
+        snooze_counts[schedule_id] = snooze_counts.get(schedule_id, 0) + 1
+        # Keep the pillbox attributed to this dose while the patient is snoozing
+        if device.active_patient_id is None:
+            device.active_patient_id = dose["id"]
+            device.active_schedule_id = schedule_id
+        reminder_scheduler.schedule(
+            schedule_id, time.time() + SNOOZE_SECONDS, fire_reminder, dose
+        )
+    else:
+        snooze_counts.pop(schedule_id, None)
+        if device.active_schedule_id == schedule_id:
+            device.active_patient_id = None
+            device.active_schedule_id = None
+        schedule_patient_reminder(dose)
+
+
+def cancel_snooze_on_taken(event):
+    """A dose taken while snoozed (e.g. at the pillbox) needs no more reminders."""
+    if event.status != "TAKEN" or event.schedule_id not in snooze_counts:
+        return
+    snooze_counts.pop(event.schedule_id, None)
+    device = device_for(event.patient_id)
+    if device.active_schedule_id == event.schedule_id:
+        device.active_patient_id = None
+        device.active_schedule_id = None
     conn = get_db_connection()
-    today_date_str = datetime.now().strftime("%Y-%m-%d")
-    log = conn.execute(
-        "SELECT status FROM medication_logs WHERE patient_id = ? AND date = ?",
-        (patient_id, today_date_str),
-    ).fetchone()
+    doses = load_doses(conn, event.schedule_id)
     conn.close()
+    for dose in doses:
+        schedule_patient_reminder(dose)
 
-    if log and log["status"] == "TAKEN":
-        print(f"Medication already taken for {patient_name}. Skipping flow.")
-        return
 
-    text_to_speech(f"Hello {patient_name}. It's {time_due}, time for your {medicine}.")
-    play_audio(OUTPUT_FILENAME)
+event_bus.subscribe(MedicationStatusEvent, cancel_snooze_on_taken)
 
-    while reminders_count < max_reminders:
-        # --- NEW: Check status at the start of each loop ---
-        conn = get_db_connection()
-        log = conn.execute(
-            "SELECT status FROM medication_logs WHERE patient_id = ? AND date = ?",
-            (patient_id, today_date_str),
-        ).fetchone()
-        conn.close()
-        if log and log["status"] == "TAKEN":
-            print(
-                f"Medication for {patient_name} was logged as TAKEN. Stopping reminder."
-            )
-            return
 
-        audio_file = record_audio()
-        text = speech_to_text(audio_file)
+def schedule_patient_reminder(dose, catch_up=False, announce=True):
+    """
+    Books the next reminder for one of a patient's doses at its time_due.
+    With catch_up, a dose that was due earlier today and is still open fires
+    right away.
+    """
+    try:
+        due = next_occurrence(dose["time_due"])
+    except (ValueError, AttributeError):
+        print(f"Skipping reminder for {dose['name']}: bad time_due.")
+        return
 
-        # --- Check if pillbox event happened during recording ---
-        conn = get_db_connection()
-        log = conn.execute(
-            "SELECT status FROM medication_logs WHERE patient_id = ? AND date = ?",
-            (patient_id, today_date_str),
-        ).fetchone()
-        conn.close()
-        if log and log["status"] == "TAKEN":
-            print(
-                f"Medication for {patient_name} was logged as TAKEN during recording. Stopping reminder."
-            )
-            return
-        # -------------------------------------------------------
-
-        if not text:
-            print("* No response. Waiting...")
-            text_to_speech("I didn't hear you. Did you take your medication?")
-            play_audio(OUTPUT_FILENAME)
-            time.sleep(5)
-            reminders_count += 1
-            continue
+    if catch_up and due.date() > datetime.now().date():
+        if get_today_status(dose["id"], dose["schedule_id"]) in (None, "PENDING"):
+            due = datetime.now()
 
-        intent_data = process_intent(text)
+    reminder_scheduler.schedule(dose["schedule_id"], due, fire_reminder, dose)
+    if announce:
+        print(
+            f"* Next reminder for {dose['name']} ({dose['medicine']}) at {due:%Y-%m-%d %H:%M}"
+        )
 
-        if (
-            intent_data.get("intent") == "CONFIRMATION"
-            and intent_data.get("value") == "YES"
-        ):
-            log_medication(patient_name, "TAKEN")
-            text_to_speech("Thank you. Recorded.")
-            play_audio(OUTPUT_FILENAME)
-            return
 
-        elif intent_data.get("intent") == "DELAY":
-            if delays_count >= max_delays:
-                text_to_speech(
-                    "You have delayed too many times. I am notifying your caregiver."
-                )
-                play_audio(OUTPUT_FILENAME)
-                trigger_caregiver_alert(patient_name, "Exceeded max delays")
-                log_medication(patient_name, "MISSED")
-                return
-
-            delays_count += 1
-            text_to_speech("Okay, waiting 5 minutes.")
-            play_audio(OUTPUT_FILENAME)
-
-            # Wait for 5 seconds (demo) OR until medication is taken
-            # We clear the event first to ensure we catch a *new* event
-            MEDICATION_TAKEN_EVENT.clear()
-
-            print("DEBUG: Waiting for medication taken event or 5s timeout...")
-            if MEDICATION_TAKEN_EVENT.wait(timeout=5):
-                print(
-                    f"Medication taken during delay for {patient_name}. Stopping wait."
-                )
-                return
+def run_maintenance():
+    """Archives logs past the retention horizon and compacts the hot database."""
+    started = time.time()
+    try:
+        moved = archive.run_maintenance(db_writer.write, args.archive_after_days)
+    except Exception as e:
+        print(f"Maintenance error: {e}")
+        return
+    print(f"* Maintenance: archived {moved} logs in {time.time() - started:.1f}s")
 
-            text_to_speech("Time is up. Did you take it?")
-            play_audio(OUTPUT_FILENAME)
-            continue  # Restart loop
 
-        else:
-            reminders_count += 1
-            if reminders_count < max_reminders:
-                text_to_speech(
-                    "Let's time to take your medicine. Please take your medicine."
-                )
-                play_audio(OUTPUT_FILENAME)
+def schedule_maintenance():
+    """Books the next quiet-hours maintenance run; each run books the next."""
 
-    trigger_caregiver_alert(patient_name, "Missed medication after reminders")
-    text_to_speech("Max reminders reached. Sending alert.")
-    play_audio(OUTPUT_FILENAME)
-    log_medication(patient_name, "MISSED")
+    def start():
+        # Off the scheduler thread, so reminders due meanwhile are not held up
+        threading.Thread(target=run_maintenance, daemon=True).start()
+        schedule_maintenance()
+
+    reminder_scheduler.schedule(
+        MAINTENANCE_JOB, next_occurrence(args.maintenance_time), start
+    )
 
 
 @app.route("/")
@@ -674,30 +1332,28 @@ def caregiver_dashboard():
     conn = get_db_connection()
     today = datetime.now().strftime("%Y-%m-%d")
 
-    # Get all patients
-    patients = conn.execute("SELECT * FROM patients").fetchall()
-
-    patient_data = []
-    for p in patients:
-        # Get today's log
-        log = conn.execute(
-            "SELECT * FROM medication_logs WHERE patient_id = ? AND date = ?",
-            (p["id"], today),
-        ).fetchone()
-
-        status = log["status"] if log else "PENDING"
-        patient_data.append(
-            {
-                "id": p["id"],
-                "name": p["name"],
-                "status": status,
-                "medicine": p["medicine"],
-                "time_due": p["time_due"],
-            }
-        )
+    # One card per scheduled dose, with today's log for it
+    doses = conn.execute(
+        """SELECT p.id, p.name, s.id AS schedule_id, s.medicine, s.time_due,
+            COALESCE(ml.status, 'PENDING') AS status
+        FROM schedules s
+        JOIN patients p ON p.id = s.patient_id
+        LEFT JOIN medication_logs ml ON ml.schedule_id = s.id AND ml.date = ?
+        WHERE s.active = 1
+        ORDER BY p.id, s.due_minute, s.id""",
+        (today,),
+    ).fetchall()
+    patient_data = [dict(d) for d in doses]
 
+    last_seq = change_log.latest_seq(conn)
     conn.close()
-    return render_template("caregiver.html", patients=patient_data, today=today)
+    return render_template(
+        "caregiver.html",
+        patients=patient_data,
+        today=today,
+        last_seq=last_seq,
+        alerts=alert_store.recent(state="OPEN"),
+    )
 
 
 @app.route("/patient/new")
@@ -706,6 +1362,59 @@ def new_patient_form():
     return render_template("new_patient.html")
 
 
+def _create_patient_job(conn, name, medicine, time_due):
+    cur = conn.execute(
+        "INSERT INTO patients (name, medicine, time_due) VALUES (?, ?, ?)",
+        (name, medicine, time_due),
+    )
+    change_log.record_change(
+        conn,
+        "patient",
+        cur.lastrowid,
+        "insert",
+        {"name": name, "medicine": medicine, "time_due": time_due},
+    )
+    patient_search.index_names(conn, [(cur.lastrowid, name)])
+    (schedule_id,) = schedules.add_schedules(
+        conn, [(cur.lastrowid, medicine, time_due)]
+    )
+    return cur.lastrowid, schedule_id
+
+
+def _add_schedules_job(conn, patient_id, doses):
+    patient = conn.execute(
+        "SELECT name FROM patients WHERE id = ?", (patient_id,)
+    ).fetchone()
+    if not patient:
+        return None
+    ids = schedules.add_schedules(
+        conn, [(patient_id, medicine, time_due) for medicine, time_due in doses]
+    )
+    change_log.record_changes(
+        conn,
+        [
+            (
+                "schedule",
+                schedule_id,
+                "insert",
+                {"patient_id": patient_id, "medicine": medicine, "time_due": time_due},
+            )
+            for schedule_id, (medicine, time_due) in zip(ids, doses)
+        ],
+    )
+    return patient["name"], ids
+
+
+def announce_new_patients(patient_ids):
+    """
+    Tells open dashboards (after the commit) that these patients, or doses
+    of theirs, are new and the page needs a fresh render.
+    """
+    socket_emitter.emit(
+        "patients_added", {"ids": list(patient_ids)}, room=DASHBOARD_ROOM
+    )
+
+
 @app.route("/patient/create", methods=["POST"])
 def create_patient():
     """Handle the new patient form submission."""
@@ -714,17 +1423,166 @@ def create_patient():
     time_due = request.form["time_due"]
 
     if name and medicine and time_due:
-        conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO patients (name, medicine, time_due) VALUES (?, ?, ?)",
-            (name, medicine, time_due),
+        patient_id, schedule_id = db_writer.write(
+            _create_patient_job, name, medicine, time_due
         )
-        conn.commit()
-        conn.close()
+        announce_new_patients([patient_id])
+
+        if not args.demo:
+            schedule_patient_reminder(
+                {
+                    "id": patient_id,
+                    "schedule_id": schedule_id,
+                    "name": name,
+                    "medicine": medicine,
+                    "time_due": time_due,
+                }
+            )
 
     return redirect(url_for("caregiver_dashboard"))
 
 
+@app.route("/api/patient/<int:patient_id>/schedules", methods=["POST"])
+def add_patient_schedules(patient_id):
+    """
+    Adds doses to an existing patient: a JSON {"medicine", "time_due"} object
+    or a list of them, or the same two fields from a form. Books their
+    reminders.
+    """
+    body = request.get_json(silent=True) if request.is_json else request.form
+    rows = body if isinstance(body, list) else [body]
+    doses = []
+    for row in rows:
+        if not hasattr(row, "get"):
+            return jsonify({"error": "Each dose must be an object"}), 400
+        medicine = str(row.get("medicine") or "").strip()
+        minute = schedules.due_minute(str(row.get("time_due") or ""))
+        if not medicine or minute is None:
+            error = "Each dose needs a medicine and an HH:MM time_due"
+            return jsonify({"error": error}), 400
+        doses.append((medicine, f"{minute // 60:02d}:{minute % 60:02d}"))
+
+    written = db_writer.write(_add_schedules_job, patient_id, doses)
+    if written is None:
+        return jsonify({"error": "Patient not found"}), 404
+    name, ids = written
+    announce_new_patients([patient_id])
+    added = [
+        {
+            "id": patient_id,
+            "schedule_id": schedule_id,
+            "name": name,
+            "medicine": medicine,
+            "time_due": time_due,
+        }
+        for schedule_id, (medicine, time_due) in zip(ids, doses)
+    ]
+    if not args.demo:
+        for dose in added:
+            schedule_patient_reminder(dose)
+    return (
+        jsonify(
+            {
+                "patient_id": patient_id,
+                "schedules": [
+                    {k: d[k] for k in ("schedule_id", "medicine", "time_due")}
+                    for d in added
+                ],
+            }
+        ),
+        201,
+    )
+
+
+@app.route("/api/patients/search")
+def search_patients():
+    """Best-first patients matching a (partial or misspelt) name."""
+    conn = get_db_connection()
+    matches = patient_search.search(conn, request.args.get("q", ""))
+    conn.close()
+    return jsonify(
+        [{"id": pid, "name": name, "score": score} for pid, name, score in matches]
+    )
+
+
+@app.route("/api/schedules/due")
+def due_doses():
+    """Doses due in the next ?minutes=N (default 60, at most a day), soonest first."""
+    minutes = min(max(request.args.get("minutes", 60, type=int), 0), 24 * 60)
+    limit = request.args.get("limit", 500, type=int)
+    conn = get_db_connection()
+    doses = schedules.due_within(conn, minutes, limit=limit)
+    conn.close()
+    return jsonify(doses)
+
+
+@app.route("/api/patients/import", methods=["POST"])
+def import_patients():
+    """
+    Bulk-creates patients from an uploaded CSV/JSON file, a JSON body or a
+    text/csv body, one row per dose (a known name gets another dose). Valid
+    rows are imported through the writer thread in chunks; the rest are
+    reported back.
+    """
+    if "file" in request.files:
+        upload = request.files["file"]
+        fmt = "json" if upload.filename.lower().endswith(".json") else "csv"
+        data = upload.read().decode("utf-8-sig")
+    elif request.is_json:
+        fmt, data = "json", request.get_data(as_text=True)
+    else:
+        fmt, data = "csv", request.get_data(as_text=True)
+
+    try:
+        rows = patient_import.parse(data, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # In chunks on the writer thread, so status writes are not held up
+    doses, errors = patient_import.import_chunked(db_writer.write, rows)
+
+    if doses:
+        # Once per batch rather than once per patient
+        announce_new_patients({d["id"] for d in doses})
+        if not args.demo:
+            for dose in doses:
+                schedule_patient_reminder(dose, announce=False)
+        if stt_backend:
+            conn = get_db_connection()
+            names = [r[0] for r in conn.execute("SELECT name FROM patients")]
+            conn.close()
+            stt_backend.set_grammar(build_grammar(names))
+        threading.Thread(target=prewarm_greetings, args=(doses,), daemon=True).start()
+
+    return jsonify({"imported": len(doses), "errors": errors})
+
+
+def calendar_logs(where, params):
+    """
+    Logs matching `where` for the calendar APIs, limited to the ?start= and
+    ?end= range FullCalendar asks for. Ranges that reach back past the
+    retention horizon, or ?archive=1, also read the archive.
+    """
+    start = (request.args.get("start") or "")[:10]
+    end = (request.args.get("end") or "")[:10]
+    cutoff = archive.cutoff_date(args.archive_after_days)
+    with_archive = request.args.get("archive") == "1" or (start and start < cutoff)
+
+    conn = get_history_connection() if with_archive else get_db_connection()
+    query = f"""SELECT ml.status, ml.date, ml.notes, p.name AS patient_name
+        FROM {archive.logs_source(conn)} ml JOIN patients p ON ml.patient_id = p.id
+        WHERE {where}"""
+    if start:
+        query += " AND ml.date >= ?"
+        params += (start,)
+    if end:
+        query += " AND ml.date < ?"
+        params += (end,)
+    logs = conn.execute(query, params).fetchall()
+    conn.close()
+    return logs
+
+
 @app.route("/patient/<int:patient_id>")
 def patient_calendar(patient_id):
     """Calendar view for a specific patient."""
@@ -740,14 +1598,19 @@ def patient_calendar(patient_id):
     return render_template("calendar.html", patient=patient)
 
 
+@app.route("/api/patient/<int:patient_id>/adherence")
+def get_patient_adherence(patient_id):
+    """This week's and month's taken/missed/pending counts and the current streak."""
+    conn = get_db_connection()
+    result = adherence.get_adherence(conn, patient_id)
+    conn.close()
+    return jsonify(result)
+
+
 @app.route("/api/patient/<int:patient_id>/logs")
 def get_patient_logs(patient_id):
     """API to get logs for the calendar."""
-    conn = get_db_connection()
-    logs = conn.execute(
-        "SELECT * FROM medication_logs WHERE patient_id = ?", (patient_id,)
-    ).fetchall()
-    conn.close()
+    logs = calendar_logs("ml.patient_id = ?", (patient_id,))
 
     events = []
     for log in logs:
@@ -781,19 +1644,7 @@ def all_patients_calendar():
 @app.route("/api/logs/all")
 def get_all_logs():
     """API to get all logs for the combined calendar."""
-    conn = get_db_connection()
-    logs = conn.execute(
-        """
-        SELECT 
-            ml.status, 
-            ml.date, 
-            ml.notes, 
-            p.name as patient_name 
-        FROM medication_logs ml
-        JOIN patients p ON ml.patient_id = p.id
-    """
-    ).fetchall()
-    conn.close()
+    logs = calendar_logs("1", ())
 
     events = []
     for log in logs:
@@ -818,99 +1669,368 @@ def get_all_logs():
     return jsonify(events)
 
 
-@app.route("/admin/reset_status", methods=["POST"])
-def reset_status():
-    """Reset everyone's status for TODAY to PENDING (useful for demos/testing)."""
+@app.route("/api/analytics")
+def get_analytics():
+    """Per-patient and per-cohort adherence, missed-dose hours and delay stats."""
+    conn = sqlite3.connect(DB_NAME)
+    archive.attach(conn, ARCHIVE_DB)
+    try:
+        return jsonify(analytics.compute_stats(conn))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    finally:
+        conn.close()
+
+
+@app.route("/api/export/logs")
+def export_logs():
+    """Streams every log as CSV (default) or Parquet, a chunk of rows at a time."""
+    fmt = request.args.get("format", "csv")
+    if fmt not in analytics.EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    produce, mimetype = analytics.EXPORT_FORMATS[fmt]
+
+    def generate():
+        conn = sqlite3.connect(DB_NAME)
+        archive.attach(conn, ARCHIVE_DB)
+        try:
+            yield from produce(conn)
+        finally:
+            conn.close()
+
+    pieces = generate()
+    try:
+        # Surface a missing optional dependency before the response starts
+        first = next(pieces)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    except StopIteration:
+        first = b""
+
+    def stream():
+        yield first
+        yield from pieces
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=medication_logs.{fmt}"
+        },
+    )
+
+
+@socketio.on("subscribe")
+def on_subscribe(data):
+    """Dashboards join the dashboard room; calendar pages join their patient's."""
+    data = data or {}
+    if data.get("patient_id") is not None:
+        try:
+            join_room(patient_room(int(data["patient_id"])))
+        except (TypeError, ValueError):
+            return
+    else:
+        join_room(DASHBOARD_ROOM)
+
+
+def changes_reply(conn, since, limit=500):
+    """
+    One page of changes after `since`. With "resync" set, entries the client
+    needed were pruned: it has to reload, then follow on from last_seq.
+    """
+    if change_log.is_stale(conn, since):
+        latest = change_log.latest_seq(conn)
+        return {"changes": [], "last_seq": latest, "has_more": False, "resync": True}
+    changes, last_seq, has_more = change_log.changes_since(conn, since, limit)
+    return {
+        "changes": changes,
+        "last_seq": last_seq,
+        "has_more": has_more,
+        "resync": False,
+    }
+
+
+@socketio.on("resume")
+def on_resume(data):
+    """A reconnecting client asks for everything after the last seq it applied."""
+    try:
+        since = int((data or {}).get("since", 0))
+    except (TypeError, ValueError):
+        since = 0
     conn = get_db_connection()
-    today = datetime.now().strftime("%Y-%m-%d")
+    reply = changes_reply(conn, since)
+    conn.close()
+    emit("changes", reply)
+
 
+@app.route("/api/changes")
+def get_changes():
+    """Change-log entries after ?since=N (paged with ?limit=, max 1000)."""
+    since = request.args.get("since", 0, type=int)
+    limit = request.args.get("limit", 500, type=int)
+    conn = get_db_connection()
+    reply = changes_reply(conn, since, limit)
+    conn.close()
+    return jsonify(reply)
+
+
+@app.route("/api/alerts")
+def get_alerts():
+    """Newest-first alerts, paged with ?before=<id>&limit=N, filtered by ?state=."""
+    state = request.args.get("state")
+    if state and state not in alerts.ALERT_STATES:
+        return jsonify({"error": f"Unknown state: {state}"}), 400
+    before = request.args.get("before", type=int)
+    # Clamped here too: a full page is only recognisable at the real size
+    limit = alerts.page_size(request.args.get("limit", 50, type=int))
+    conn = get_db_connection()
+    page = alert_store.query(conn, state=state, before=before, limit=limit)
+    conn.close()
+    return jsonify(
+        {"alerts": page, "next_before": page[-1]["id"] if len(page) == limit else None}
+    )
+
+
+@app.route("/api/alerts/<int:alert_id>/<action>", methods=["POST"])
+def update_alert(alert_id, action):
+    """Acknowledge or dismiss an alert."""
+    states = {"ack": "ACKNOWLEDGED", "acknowledge": "ACKNOWLEDGED", "dismiss": "DISMISSED"}
+    if action not in states:
+        return jsonify({"error": f"Unknown action: {action}"}), 404
+    found = alert_store.set_state(alert_id, states[action])
+    if not found:
+        return jsonify({"error": "Alert not found"}), 404
+    socket_emitter.emit(
+        "alert_update", {"id": alert_id, "state": states[action]}, room=DASHBOARD_ROOM
+    )
+    return jsonify({"id": alert_id, "state": states[action]})
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    Voice pipeline stage, cloud call, DB and pillbox serial counters and
+    latency histograms, in the Prometheus text format.
+    """
+    return Response(metrics_registry.render(), content_type=CONTENT_TYPE)
+
+
+@app.route("/api/metrics/socketio")
+def socketio_metrics():
+    """Broadcast volume: messages and payload bytes, totals and per second."""
+    return jsonify(socket_emitter.stats())
+
+
+def _reset_status_job(conn, today):
     # Delete today's logs so they revert to "PENDING" (which is the absence of a log)
+    cleared = conn.execute(
+        "SELECT patient_id, status FROM medication_logs WHERE date = ?", (today,)
+    ).fetchall()
     conn.execute("DELETE FROM medication_logs WHERE date = ?", (today,))
-    conn.commit()
+    for row in cleared:
+        adherence.apply_change(conn, row["patient_id"], today, row["status"], None)
+    doses = load_doses(conn)
+    seqs = {}
+    for d in doses:
+        seqs[d["schedule_id"]] = change_log.record_change(
+            conn,
+            "medication_log",
+            d["id"],
+            "delete",
+            {
+                "patient_id": d["id"],
+                "patient_name": d["name"],
+                "schedule_id": d["schedule_id"],
+                "date": today,
+                "status": "PENDING",
+            },
+        )
+    return doses, seqs
+
+
+@app.route("/api/metrics/db")
+def db_metrics():
+    """
+    Writer thread throughput, jobs per group commit and commit latency, and
+    the size of the hot and archive databases.
+    """
+    conn = get_history_connection()
+    storage = archive.storage_stats(conn)
     conn.close()
+    return jsonify(dict(db_writer.stats(), storage=storage))
+
+
+@app.route("/api/metrics/io")
+def io_metrics():
+    """
+    Process I/O from /proc/self/io per reminder turn and per day, with the
+    durability profile and WAL checkpoint counts.
+    """
+    report = io_accounting.report()
+    report["durability"] = DURABILITY.name
+    report["checkpointer"] = checkpointer.stats() if checkpointer else None
+    return jsonify(report)
+
+
+@app.route("/api/metrics/leds")
+def led_metrics():
+    """LED frames sent to the strip and unchanged frames skipped."""
+    stats = getattr(pixels, "stats", None)
+    if stats is None:
+        return jsonify({"available": False})
+    return jsonify(dict(stats(), available=True))
+
+
+@app.route("/admin/reset_status", methods=["POST"])
+def reset_status():
+    """Reset everyone's status for TODAY to PENDING (useful for demos/testing)."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    doses, seqs = db_writer.write(_reset_status_job, today)
+
+    for d in doses:
+        event_bus.publish(
+            MedicationStatusEvent(
+                patient_id=d["id"],
+                patient_name=d["name"],
+                status="PENDING",
+                date=today,
+                seq=seqs[d["schedule_id"]],
+                schedule_id=d["schedule_id"],
+            )
+        )
 
     return redirect(url_for("caregiver_dashboard"))
 
 
-def start_voice_assistant():
-    global CURRENT_PATIENT_ID
-    # 1. Start the Pillbox Monitor in a background thread
-    #    daemon=True means this thread dies when the main program exits
-    pillbox_thread = threading.Thread(target=monitor_pillbox, daemon=True)
-    pillbox_thread.start()
+def run_demo_flow(patients):
+    """ENTER-driven walkthrough of the demo personas, one after another."""
 
-    try:
-        conn = get_db_connection()
-        patients = conn.execute(
-            "SELECT id, name, medicine, time_due FROM patients"
-        ).fetchall()
-        conn.close()
+    # Sort patients for demo order: Student Hamad, Athlete Joan, Uncle Sam, Grandpa Albert
+    def sort_key(p):
+        if "Hamad" in p["name"]:
+            return 1
+        if "Joan" in p["name"]:
+            return 2
+        if "Sam" in p["name"]:
+            return 3
+        if "Albert" in p["name"]:
+            return 4
+        return 99
 
-        # Sort patients for demo order: Student Hamad, Athlete Joan, Uncle Sam, Grandpa Albert
-        def sort_key(p):
-            if "Hamad" in p["name"]:
-                return 1
-            if "Joan" in p["name"]:
-                return 2
-            if "Sam" in p["name"]:
-                return 3
-            if "Albert" in p["name"]:
-                return 4
-            return 99
-
-        patients.sort(key=sort_key)
-
-        # Infinite loop to keep the program alive so the pillbox monitor keeps working
-        # even after reminders are done (or you can remove the while True to run once)
-        print("\n--- Press ENTER to start the demo flow ---")
-        input()
-
-        while True:
-            for patient in patients:
-                # Demo Mode: Reset status to PENDING for each patient before starting
-                # This allows the pillbox interaction to be demoed for every patient in sequence
-                conn = get_db_connection()
-                today_date_str = datetime.now().strftime("%Y-%m-%d")
-
-                # Insert PENDING if not exists, or update to PENDING if exists
-                conn.execute(
-                    """INSERT INTO medication_logs (patient_id, date, status) 
-                       VALUES (?, ?, 'PENDING')
-                       ON CONFLICT(patient_id, date) DO UPDATE SET 
-                       status='PENDING', time_taken=NULL, notes=NULL""",
-                    (patient["id"], today_date_str),
-                )
-                conn.commit()
-                conn.close()
-
-                # Emit socket update to refresh UI to PENDING
-                socketio.emit(
-                    "status_update",
-                    {
-                        "patient_id": patient["id"],
-                        "patient_name": patient["name"],
-                        "status": "PENDING",
-                        "time_taken": None,
-                    },
+    patients.sort(key=sort_key)
+
+    # Infinite loop to keep the program alive so the pillbox monitor keeps working
+    # even after reminders are done (or you can remove the while True to run once)
+    print("\n--- Press ENTER to start the demo flow ---")
+    input()
+
+    while True:
+        for patient in patients:
+            # Demo Mode: Reset status to PENDING for each patient before starting
+            # This allows the pillbox interaction to be demoed for every patient in sequence
+            today_date_str = datetime.now().strftime("%Y-%m-%d")
+
+            # Insert PENDING if not exists, or update to PENDING if exists
+            seq = db_writer.write(
+                write_status,
+                patient["id"],
+                patient["name"],
+                today_date_str,
+                "PENDING",
+                None,
+                None,
+                patient["schedule_id"],
+            )
+
+            # Refresh the dashboards to PENDING
+            event_bus.publish(
+                MedicationStatusEvent(
+                    patient_id=patient["id"],
+                    patient_name=patient["name"],
+                    status="PENDING",
+                    date=today_date_str,
+                    seq=seq,
+                    schedule_id=patient["schedule_id"],
                 )
+            )
 
-                CURRENT_PATIENT_ID = patient["id"]
-                run_reminder_flow(
+            taken = threading.Event()
+            unsubscribe = event_bus.subscribe(
+                MedicationStatusEvent,
+                lambda e: e.status == "TAKEN"
+                and e.schedule_id in (None, patient["schedule_id"])
+                and taken.set(),
+                patient_id=patient["id"],
+            )
+            delays_count = 0
+            while True:
+                outcome = run_reminder_flow(
                     patient["id"],
                     patient["name"],
                     patient["medicine"],
                     patient["time_due"],
+                    delays_count=delays_count,
+                    schedule_id=patient["schedule_id"],
                 )
-                print(
-                    f"--- Finished flow for {patient['name']}. Press ENTER for next patient... ---"
-                )
-                input()
-                CURRENT_PATIENT_ID = None
-
+                if outcome != "SNOOZED":
+                    break
+                delays_count += 1
+                # Short demo snooze, cut short if the pillbox is opened
+                device = device_for(patient["id"])
+                device.active_patient_id = patient["id"]
+                device.active_schedule_id = patient["schedule_id"]
+                if taken.wait(timeout=DEMO_SNOOZE_SECONDS):
+                    print(
+                        f"Medication taken during delay for {patient['name']}. Stopping wait."
+                    )
+                    break
             print(
-                "--- All reminders done. Listening for Pillbox events (Ctrl+C to exit) ---"
+                f"--- Finished flow for {patient['name']}. Press ENTER for next patient... ---"
             )
-            time.sleep(60)  # Just wait and let the background thread do its work
+            input()
+            unsubscribe()
+            device = device_for(patient["id"])
+            device.active_patient_id = None
+            device.active_schedule_id = None
+
+        print(
+            "--- All reminders done. Listening for Pillbox events (Ctrl+C to exit) ---"
+        )
+        time.sleep(60)  # Just wait and let the background thread do its work
+
+
+def start_voice_assistant():
+    # 1. Start a Pillbox Monitor per serial port in background threads
+    #    daemon=True means these threads die when the main program exits
+    ports = pillbox_ports()
+    if not ports:
+        print("--- No Pi Mode: Skipping Serial Monitor ---")
+    for port, patient_id in ports:
+        pillbox_thread = threading.Thread(
+            target=monitor_pillbox, args=(port, patient_id), daemon=True
+        )
+        pillbox_thread.start()
+
+    try:
+        conn = get_db_connection()
+        doses = load_doses(conn)
+        names = [r["name"] for r in conn.execute("SELECT name FROM patients")]
+        conn.close()
+
+        if stt_backend:
+            stt_backend.set_grammar(build_grammar(names))
+
+        if args.demo:
+            run_demo_flow(doses)
+            return
+
+        # 2. Book every scheduled dose, then start a reminder session for each
+        #    as it comes due. Snoozes are rescheduled timers, not blocking waits.
+        for dose in doses:
+            schedule_patient_reminder(dose, catch_up=True)
+        schedule_maintenance()
+        print(f"--- Reminder scheduler running ({len(doses)} doses) ---")
+        reminder_scheduler.run_forever()
 
     except KeyboardInterrupt:
         print("\nExiting voice assistant...")
@@ -923,16 +2043,43 @@ def start_voice_assistant():
 if __name__ == "__main__":
     # Initialize DB if not exists
     setup_database()
+    conn = get_db_connection()
+    alert_store.load(conn)
+    conn.close()
+
+    # Single writer thread with group commit, then batched Socket.IO broadcasts
+    db_writer.start()
+    if checkpointer:
+        checkpointer.start()
+        atexit.register(checkpointer.stop)
+    socket_emitter.start()
 
     # Run the voice assistant in a background thread
     assistant_thread = threading.Thread(target=start_voice_assistant, daemon=True)
     assistant_thread.start()
 
-    socketio.run(
-        app,
-        host="0.0.0.0",
-        port=8080,
-        debug=True,
-        use_reloader=False,
-        allow_unsafe_werkzeug=True,
-    )
+    if args.serve == "production":
+        from gevent.pool import Pool
+
+        print(
+            f"--- Serving (production, gevent) on {args.host}:{args.port}, "
+            f"max {args.max_connections} connections ---"
+        )
+        socketio.run(
+            app,
+            host=args.host,
+            port=args.port,
+            debug=False,
+            use_reloader=False,
+            log_output=False,
+            spawn=Pool(args.max_connections),
+        )
+    else:
+        socketio.run(
+            app,
+            host=args.host,
+            port=args.port,
+            debug=True,
+            use_reloader=False,
+            allow_unsafe_werkzeug=True,
+        )
@@ -0,0 +1,251 @@
+"""
+Hot/cold storage for medication logs.
+
+The main ("hot") database only keeps the last `horizon_days` days of
+medication_logs, which is what the dashboard and the reminder loop read.
+Older logs are moved in id-ordered batches into the same table in an
+attached archive database, so the hot file stays small enough to sit in the
+page cache and nothing is lost.
+
+Each batch is copied in one transaction and deleted from the hot table in
+the next: with WAL, a commit spanning two attached databases is not atomic,
+so a crash in between leaves a log in both places (readers skip the archive
+copy) but never in neither.
+
+Connections that need the full history `attach` the archive, which also
+creates the TEMP view `all_medication_logs` over both tables. `run_maintenance`
+archives, prunes the dashboard change log to the same horizon, then frees
+the emptied pages with incremental VACUUM and refreshes the planner
+statistics with PRAGMA optimize; app.py runs it daily in quiet hours.
+
+    python archive.py --db medication_manager.db --horizon-days 90
+    python archive.py --db medication_manager.db --vacuum   # enable incremental VACUUM once
+"""
+
+import argparse
+import os
+import sqlite3
+from datetime import date, timedelta
+
+import change_log
+
+DEFAULT_HORIZON_DAYS = 90
+BATCH_ROWS = 5000
+VACUUM_PAGES = 4096  # Pages freed per maintenance run, about 16 MB
+
+LOG_COLUMNS = "id, patient_id, schedule_id, date, time_taken, status, notes"
+
+
+def archive_path(db_path):
+    """medication_manager.db -> medication_manager_archive.db"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def _not_in_hot(alias):
+    """SQL condition: the archived log `alias` has no copy left in main."""
+    return (
+        f"NOT EXISTS (SELECT 1 FROM main.medication_logs m WHERE m.id = {alias}.id)"
+    )
+
+
+def is_attached(c):
+    return any(row[1] == "archive" for row in c.execute("PRAGMA database_list"))
+
+
+def attach(c, path):
+    """
+    Attach the archive database at `path` (creating it if needed) and the
+    `all_medication_logs` view. Must not be called inside a transaction.
+    """
+    if not is_attached(c):
+        c.execute("ATTACH DATABASE ? AS archive", (path,))
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS archive.medication_logs (
+            id INTEGER PRIMARY KEY,
+            patient_id INTEGER NOT NULL,
+            schedule_id INTEGER,
+            date TEXT NOT NULL,
+            time_taken TEXT,
+            status TEXT NOT NULL,
+            notes TEXT
+        )
+    """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_archive_logs_patient_date ON medication_logs (patient_id, date)"
+    )
+    # A log caught in both tables by a crash mid-move is read from the hot one
+    c.execute(
+        f"""CREATE TEMP VIEW IF NOT EXISTS all_medication_logs AS
+        SELECT {LOG_COLUMNS} FROM main.medication_logs
+        UNION ALL
+        SELECT {LOG_COLUMNS} FROM archive.medication_logs a
+        WHERE {_not_in_hot("a")}"""
+    )
+
+
+def logs_source(c):
+    """The table or view holding every log this connection can see."""
+    return "all_medication_logs" if is_attached(c) else "medication_logs"
+
+
+def log_tables(c, alias):
+    """
+    (table, condition) pairs to scan one after the other for the full
+    history, oldest first, where `alias` names the table in the query. As
+    in all_medication_logs, archived logs still in main are left to main.
+    """
+    if is_attached(c):
+        return [
+            ("archive.medication_logs", _not_in_hot(alias)),
+            ("main.medication_logs", "1"),
+        ]
+    return [("medication_logs", "1")]
+
+
+def cutoff_date(horizon_days, today=None):
+    """Logs dated before this (YYYY-MM-DD) belong in the archive."""
+    today = today or date.today()
+    return (today - timedelta(days=horizon_days)).isoformat()
+
+
+def _id_range(c, after_id, batch):
+    row = c.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM main.medication_logs WHERE id > ? ORDER BY id LIMIT ?)",
+        (after_id, batch),
+    ).fetchone()
+    return row[0]
+
+
+def copy_batch(c, cutoff, after_id, batch=BATCH_ROWS):
+    """
+    Copy logs dated before `cutoff` among the next `batch` hot rows after
+    `after_id` into the archive. Returns the last id looked at, or None
+    when there are no more rows. Does not commit.
+    """
+    last_id = _id_range(c, after_id, batch)
+    if last_id is not None:
+        c.execute(
+            f"""INSERT OR REPLACE INTO archive.medication_logs ({LOG_COLUMNS})
+            SELECT {LOG_COLUMNS} FROM main.medication_logs
+            WHERE id > ? AND id <= ? AND date < ?""",
+            (after_id, last_id, cutoff),
+        )
+    return last_id
+
+
+def delete_batch(c, cutoff, after_id, last_id):
+    """Delete the hot copies of logs `copy_batch` archived. Returns how many."""
+    return c.execute(
+        """DELETE FROM main.medication_logs
+        WHERE id > ? AND id <= ? AND date < ?
+        AND id IN (SELECT id FROM archive.medication_logs WHERE id > ? AND id <= ?)""",
+        (after_id, last_id, cutoff, after_id, last_id),
+    ).rowcount
+
+
+def archive_logs(run, cutoff, batch=BATCH_ROWS):
+    """
+    Move every log dated before `cutoff` to the archive. `run(fn, *args)`
+    calls fn(conn, *args) in a transaction of its own and commits it
+    (DBWriter.write in the app). Returns the number of logs moved.
+    """
+    moved = 0
+    after_id = 0
+    while True:
+        last_id = run(copy_batch, cutoff, after_id, batch)
+        if last_id is None:
+            return moved
+        moved += run(delete_batch, cutoff, after_id, last_id)
+        after_id = last_id
+
+
+def compact(c, pages=VACUUM_PAGES):
+    """Free up to `pages` unused pages and refresh planner statistics."""
+    free = c.execute("PRAGMA main.freelist_count").fetchone()[0]
+    # sqlite3 steps a row-less PRAGMA only once, which frees a single page
+    for _ in range(min(free, pages)):
+        c.execute("PRAGMA main.incremental_vacuum(1)")
+    c.execute("PRAGMA optimize")
+
+
+def enable_incremental_vacuum(c, vacuum=False):
+    """
+    Switch the main database to auto_vacuum=INCREMENTAL. That is free on a
+    new database; an existing one also needs a full VACUUM (`vacuum=True`),
+    which rewrites the whole file. Returns True if it is enabled.
+    """
+    if c.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+        return True
+    has_tables = c.execute("SELECT 1 FROM main.sqlite_master LIMIT 1").fetchone()
+    if has_tables and not vacuum:
+        return False
+    c.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+    if has_tables:
+        c.execute("VACUUM")
+    return True
+
+
+def storage_stats(c):
+    """Sizes of the hot (and, if attached, archive) database files."""
+    stats = {}
+    for schema in ["main", "archive"] if is_attached(c) else ["main"]:
+        page_size = c.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+        pages = c.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        free = c.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+        stats["hot" if schema == "main" else "archive"] = {
+            "bytes": pages * page_size,
+            "free_bytes": free * page_size,
+        }
+    return stats
+
+
+def run_maintenance(run, horizon_days=DEFAULT_HORIZON_DAYS, today=None):
+    """
+    Archive logs past the horizon, prune the change log to it, then compact.
+    Returns logs moved.
+    """
+    cutoff = cutoff_date(horizon_days, today)
+    moved = archive_logs(run, cutoff)
+    run(change_log.prune, cutoff)
+    run(compact)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old medication logs")
+    parser.add_argument("--db", default="medication_manager.db")
+    parser.add_argument("--archive-db", help="Defaults to <db>_archive.db")
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS)
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="Enable incremental VACUUM on an existing database (rewrites the file)",
+    )
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    if args.vacuum:
+        enable_incremental_vacuum(conn, vacuum=True)
+    attach(conn, args.archive_db or archive_path(args.db))
+
+    def run(fn, *fn_args):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, *fn_args)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    moved = run_maintenance(run, args.horizon_days)
+    print(f"Archived {moved} logs.")
+    print(storage_stats(conn))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
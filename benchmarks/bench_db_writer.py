@@ -0,0 +1,304 @@
+"""
+Write throughput and commit latency under contention.
+
+Several threads log medication statuses into a scratch database, first each
+with its own connection committing every write (the old path), then through
+the single DBWriter thread with group commit. Reports writes per second, the
+average number of writes per commit, p50/p95/p99 latency from submitting
+a write to its commit and bytes sent to storage per write (/proc/self/io).
+Run it on the SD card with each durability profile to compare them:
+
+    python benchmarks/bench_db_writer.py --threads 16 --writes 200
+    python benchmarks/bench_db_writer.py --dir /home/pi --durability sd-card
+
+With --gevent the writers are greenlets, as request handlers are under
+`app.py --serve production`, and the writer is waited on with a plain
+Future.result() and then with db_writer.gevent_wait. A ticker greenlet
+reports the longest time the hub was kept from running it.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import adherence
+import change_log
+import durability
+import schedules
+from db_writer import DBWriter, gevent_wait
+from io_accounting import read_proc_io
+
+
+def create_schema(path, patients, profile):
+    conn = sqlite3.connect(path)
+    durability.apply(conn, profile, persistent=True)
+    conn.execute(
+        "CREATE TABLE patients (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, medicine TEXT, time_due TEXT)"
+    )
+    schedules.create_tables(conn)
+    change_log.create_table(conn)
+    adherence.create_tables(conn)
+    conn.executemany(
+        "INSERT INTO patients (name, medicine, time_due) VALUES (?, 'Vitamin B', '10:00')",
+        [(f"Patient {i}",) for i in range(patients)],
+    )
+    # One schedule per patient, so schedule ids equal patient ids here
+    schedules.backfill(conn)
+    conn.commit()
+    conn.close()
+
+
+def write_status(c, patient_id, date_str, status):
+    """The same statements app.write_status runs for one status change."""
+    previous = c.execute(
+        "SELECT status FROM medication_logs WHERE schedule_id = ? AND date = ?",
+        (patient_id, date_str),
+    ).fetchone()
+    c.execute(
+        """INSERT INTO medication_logs (patient_id, schedule_id, date, time_taken, status, notes)
+        VALUES (?, ?, ?, '10:00:00', ?, NULL)
+        ON CONFLICT(schedule_id, date) DO UPDATE SET status=excluded.status""",
+        (patient_id, patient_id, date_str, status),
+    )
+    adherence.apply_change(
+        c, patient_id, date_str, previous[0] if previous else None, status
+    )
+    return change_log.record_change(
+        c, "medication_log", patient_id, "upsert", {"status": status}
+    )
+
+
+def workload(thread_index, writes, patients):
+    start = date(2025, 1, 1)
+    for i in range(writes):
+        patient_id = (thread_index * writes + i) % patients + 1
+        day = (start + timedelta(days=i % 60)).isoformat()
+        yield patient_id, day, "TAKEN" if i % 4 else "MISSED"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100.0 * len(values)))]
+
+
+def run_direct(path, threads, writes, patients, profile):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        conn = sqlite3.connect(path, timeout=30)
+        durability.apply(conn, profile)
+        local = []
+        for patient_id, day, status in workload(index, writes, patients):
+            started = time.perf_counter()
+            write_status(conn, patient_id, day, status)
+            conn.commit()
+            local.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - started, latencies, len(latencies)
+
+
+def run_group(path, threads, writes, patients, profile, max_delay):
+    writer = DBWriter(
+        path, max_delay=max_delay, on_connect=lambda c: durability.apply(c, profile)
+    ).start()
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = []
+        for patient_id, day, status in workload(index, writes, patients):
+            started = time.perf_counter()
+            writer.write(write_status, patient_id, day, status)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    commits = writer.stats()["commits_total"]
+    writer.stop()
+    return elapsed, latencies, commits
+
+
+def run_greenlets(path, greenlets, writes, patients, profile, max_delay, wait):
+    """run_group with greenlets; also returns the longest hub stall."""
+    import gevent
+
+    writer = DBWriter(
+        path,
+        max_delay=max_delay,
+        on_connect=lambda c: durability.apply(c, profile),
+        wait=wait,
+    ).start()
+    latencies = []
+    stalls = []
+    running = True
+
+    def ticker():
+        last = time.perf_counter()
+        while running:
+            gevent.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    def worker(index):
+        for patient_id, day, status in workload(index, writes, patients):
+            started = time.perf_counter()
+            writer.write(write_status, patient_id, day, status)
+            latencies.append(time.perf_counter() - started)
+
+    tick = gevent.spawn(ticker)
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(worker, i) for i in range(greenlets)])
+    elapsed = time.perf_counter() - started
+    running = False
+    tick.join()
+    commits = writer.stats()["commits_total"]
+    writer.stop()
+    return elapsed, latencies, commits, max(stalls)
+
+
+def storage_bytes():
+    io = read_proc_io()
+    return io["write_bytes"] - io["cancelled_write_bytes"] if io else None
+
+
+def measure(run, *args):
+    before = storage_bytes()
+    result = run(*args)
+    after = storage_bytes()
+    written = after - before if before is not None else None
+    return result + (written,)
+
+
+def report(label, elapsed, latencies, commits, written):
+    per_write = f"{written / len(latencies) / 1024:.2f}" if written is not None else "n/a"
+    print(
+        f"{label:<14}{len(latencies) / elapsed:>10.0f}{len(latencies) / commits:>12.1f}"
+        f"{percentile(latencies, 50) * 1000:>10.2f}"
+        f"{percentile(latencies, 95) * 1000:>10.2f}"
+        f"{percentile(latencies, 99) * 1000:>10.2f}"
+        f"{per_write:>10}"
+    )
+
+
+def compare_gevent(args, workdir, profile):
+    from gevent import monkey
+
+    # What app.py --serve production patches
+    monkey.patch_all(thread=False, select=False, queue=False)
+    print(
+        f"{args.threads} greenlets x {args.writes} writes, {profile.name} durability, "
+        f"database in {workdir}\n"
+    )
+    print(
+        f"{'wait':<14}{'writes/s':>10}{'per commit':>12}{'p50 ms':>10}"
+        f"{'p99 ms':>10}{'max stall ms':>14}"
+    )
+    for label, wait in (("Future.result", None), ("gevent_wait", gevent_wait)):
+        path = os.path.join(workdir, label.replace(".", "_") + ".db")
+        create_schema(path, args.patients, profile)
+        elapsed, latencies, commits, stall = run_greenlets(
+            path,
+            args.threads,
+            args.writes,
+            args.patients,
+            profile,
+            args.max_delay_ms / 1000,
+            wait,
+        )
+        print(
+            f"{label:<14}{len(latencies) / elapsed:>10.0f}"
+            f"{len(latencies) / commits:>12.1f}"
+            f"{percentile(latencies, 50) * 1000:>10.2f}"
+            f"{percentile(latencies, 99) * 1000:>10.2f}{stall * 1000:>14.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=200, help="Per thread")
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--durability", choices=sorted(durability.PROFILES), default="strict"
+    )
+    parser.add_argument(
+        "--dir", help="Where to put the scratch database (e.g. on the SD card)"
+    )
+    parser.add_argument(
+        "--gevent",
+        action="store_true",
+        help="Greenlet writers, as under --serve production (--threads greenlets)",
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="medmgr-writer-", dir=args.dir)
+    profile = durability.PROFILES[args.durability]
+    if args.gevent:
+        compare_gevent(args, workdir, profile)
+        return
+    direct_db = os.path.join(workdir, "direct.db")
+    group_db = os.path.join(workdir, "group.db")
+    create_schema(direct_db, args.patients, profile)
+    create_schema(group_db, args.patients, profile)
+
+    print(
+        f"{args.threads} threads x {args.writes} writes, {profile.name} durability, "
+        f"database in {workdir}\n"
+    )
+    print(f"{'mode':<14}{'writes/s':>10}{'per commit':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'KB/write':>10}")
+    report(
+        "direct",
+        *measure(
+            run_direct, direct_db, args.threads, args.writes, args.patients, profile
+        ),
+    )
+    report(
+        "group commit",
+        *measure(
+            run_group,
+            group_db,
+            args.threads,
+            args.writes,
+            args.patients,
+            profile,
+            args.max_delay_ms / 1000,
+        ),
+    )
+
+    # Racing read-then-write transactions on separate connections can lose
+    # rollup updates; the single writer cannot
+    for label, path in (("direct", direct_db), ("group commit", group_db)):
+        conn = sqlite3.connect(path)
+        mismatches = adherence.check(conn)
+        conn.close()
+        print(f"{label}: {len(mismatches)} rollup mismatches")
+
+
+if __name__ == "__main__":
+    main()
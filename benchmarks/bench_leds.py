@@ -0,0 +1,394 @@
+"""
+APA102 frame output benchmark.
+
+Paints every LED and calls show() in a loop, once with the original driver
+(a list buffer, one xfer2 for the start frame, a copied list for the LEDs and
+one xfer2 per end frame byte) and once with interfaces/apa102.py (one
+bytearray, one writebytes2). Reports frames per second and CPU time per
+frame for each strip length. With --static every frame is the same (as
+when a pattern holds still), which the new driver does not resend.
+
+--set-frame instead times filling the pixel buffer from a pattern frame,
+Pixels.show's old per-LED set_pixel loop against APA102.set_frame, for list,
+bytes and (if NumPy is installed) float array frames.
+
+--clock plays each AlexaLedPattern state on the frame clock and reports the
+frames shown, how late ticks were (jitter), the clock thread's CPU time per
+frame and the CPU share of the whole process. It then switches states at
+random moments and reports the latency from play() to the new state's
+first frame, which should stay under one frame period, and how many states
+were dropped because a newer one was picked before they were shown.
+
+--google times building GoogleHomeLedPattern's frames (every state at every
+position) the old way, numpy.roll and float arithmetic converted to uint8,
+against the in-place uint8 version, with the bytes allocated per frame
+(tracemalloc peak) and the time to compile the frame tables. Needs NumPy.
+
+By default the SPI device is a stand-in that only does the argument
+conversion spidev does (a list becomes a C buffer; writebytes2 just reads the
+buffer), so the numbers are the Python-side cost. On a Pi, --hardware sends
+the frames to /dev/spidev0.1 at 8 MHz instead.
+
+    python benchmarks/bench_leds.py --leds 12 2000 --seconds 2
+    python benchmarks/bench_leds.py --set-frame
+    python benchmarks/bench_leds.py --clock --seconds 5
+    python benchmarks/bench_leds.py --google
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from math import ceil
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "interfaces"))
+
+import apa102
+from alexa_led_pattern import AlexaLedPattern
+from led_animation import FrameClock, compile_table
+
+
+class FakeSpi:
+    """Enough of spidev.SpiDev for APA102, without a device behind it."""
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.transfers = 0
+
+    def xfer2(self, data):
+        # spidev converts the list into a C buffer and returns what came back
+        buf = bytes(data)
+        self.bytes_sent += len(buf)
+        self.transfers += 1
+        return list(buf)
+
+    def writebytes2(self, data):
+        view = memoryview(data)
+        self.bytes_sent += view.nbytes
+        self.transfers += 1
+
+    def close(self):
+        pass
+
+
+class LegacyAPA102:
+    """set_pixel/show of the driver before the bytearray frame buffer."""
+
+    MAX_BRIGHTNESS = 31
+    LED_START = 0b11100000
+
+    def __init__(self, num_led, spi, global_brightness=MAX_BRIGHTNESS):
+        self.num_led = num_led
+        self.rgb = apa102.RGB_MAP["rgb"]
+        self.global_brightness = global_brightness
+        self.leds = [self.LED_START, 0, 0, 0] * num_led
+        self.spi = spi
+
+    def set_pixel(self, led_num, red, green, blue, bright_percent=100):
+        if led_num < 0:
+            return
+        if led_num >= self.num_led:
+            return
+        brightness = ceil(bright_percent * self.global_brightness / 100.0)
+        brightness = int(brightness)
+        ledstart = (brightness & 0b00011111) | self.LED_START
+        start_index = 4 * led_num
+        self.leds[start_index] = ledstart
+        self.leds[start_index + self.rgb[0]] = red
+        self.leds[start_index + self.rgb[1]] = green
+        self.leds[start_index + self.rgb[2]] = blue
+
+    def show(self):
+        self.spi.xfer2([0] * 4)
+        self.spi.xfer2(list(self.leds))
+        for _ in range((self.num_led + 15) // 16):
+            self.spi.xfer2([0x00])
+
+
+def make_spi(hardware):
+    if not hardware:
+        return FakeSpi()
+    import spidev
+
+    spi = spidev.SpiDev()
+    spi.open(0, 1)
+    spi.max_speed_hz = 8000000
+    return spi
+
+
+def run(driver, seconds, static=False):
+    """Paint a moving gradient for `seconds`. Returns (frames, fps, cpu ms per frame)."""
+    n = driver.num_led
+    frames = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    while time.perf_counter() - wall_start < seconds:
+        for i in range(n):
+            level = (i if static else i + frames) & 0xFF
+            driver.set_pixel(i, level, 255 - level, 24)
+        driver.show()
+        frames += 1
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return frames, frames / wall, cpu / frames * 1000
+
+
+def set_pixel_loop(driver, data):
+    """What Pixels.show did before set_frame."""
+    for i in range(driver.num_led):
+        driver.set_pixel(
+            i, int(data[4 * i + 1]), int(data[4 * i + 2]), int(data[4 * i + 3])
+        )
+
+
+def bench_set_frame(leds, seconds):
+    frames = {}
+    for n in leds:
+        values = [(i * 7) & 0xFF for i in range(4 * n)]
+        frames[n] = [("list", values), ("bytes", bytes(values))]
+        try:
+            import numpy
+
+            frames[n].append(("float64", numpy.array(values) * 0.5))
+            frames[n].append(("uint8", numpy.array(values, dtype=numpy.uint8)))
+        except ImportError:
+            pass
+
+    print(f"{'frame':<8} {'leds':>6} {'set_pixel us':>13} {'set_frame us':>13} {'speedup':>8}")
+    for n in leds:
+        driver = apa102.APA102(n, spi=FakeSpi())
+        for kind, data in frames[n]:
+            timings = []
+            for fn in (set_pixel_loop, apa102.APA102.set_frame):
+                timer = timeit.Timer(lambda: fn(driver, data))
+                number, _ = timer.autorange()
+                number = max(1, int(number * seconds / 0.2))
+                timings.append(min(timer.repeat(3, number)) / number * 1e6)
+            loop_us, frame_us = timings
+            print(
+                f"{kind:<8} {n:>6} {loop_us:>13.2f} {frame_us:>13.2f} {loop_us / frame_us:>7.1f}x"
+            )
+
+
+def bench_clock(leds, seconds, hardware):
+    print(
+        f"{'state':<8} {'leds':>6} {'frames':>7} {'sent':>6} {'jitter p99 ms':>14}"
+        f" {'max ms':>7} {'cpu ms/frame':>13} {'cpu %':>6}"
+    )
+    for n in leds:
+        for state in ("listen", "think", "speak"):
+            spi = make_spi(hardware)
+            driver = apa102.APA102(n, spi=spi)
+            pattern = AlexaLedPattern(number=n, encode=driver.encode)
+            table = getattr(pattern, state)()
+            clock = FrameClock(driver.show_frame).start()
+            cpu_start = time.process_time()
+            clock.play(table)
+            time.sleep(seconds)
+            clock.stop()
+            cpu = time.process_time() - cpu_start
+            stats = clock.stats()
+            jitter = stats["jitter"] or {"p99_ms": 0, "max_ms": 0}
+            print(
+                f"{state:<8} {n:>6} {stats['frames']:>7} {driver.frames_sent:>6}"
+                f" {jitter['p99_ms']:>14.3f} {jitter['max_ms']:>7.3f}"
+                f" {stats['cpu_ms_per_frame']:>13.3f} {cpu / seconds * 100:>5.1f}%"
+            )
+            if hardware:
+                spi.close()
+
+        bench_switch(n, seconds, hardware)
+
+
+def bench_switch(n, seconds, hardware):
+    spi = make_spi(hardware)
+    driver = apa102.APA102(n, spi=spi)
+    pattern = AlexaLedPattern(number=n, encode=driver.encode)
+    clock = FrameClock(driver.show_frame).start()
+    states = ("listen", "think", "speak", "off")
+    tables = [getattr(pattern, state)() for state in states]  # Compiled up front
+
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        clock.play(random.choice(tables))
+        if random.random() < 0.2:
+            clock.play(random.choice(tables))  # e.g. think() then off() at once
+        time.sleep(random.uniform(0, 5 * clock.period))
+    clock.stop()
+
+    stats = clock.stats()
+    latency = stats["switch_latency"]
+    print(
+        f"switches {stats['switches']} (superseded {stats['superseded']}), "
+        f"play() -> first frame mean {latency['mean_ms']:.3f} ms, "
+        f"p99 {latency['p99_ms']:.3f} ms, max {latency['max_ms']:.3f} ms; "
+        f"frame period {stats['period_ms']:.1f} ms"
+    )
+    if hardware:
+        spi.close()
+
+
+class LegacyGoogleSteps:
+    """GoogleHomeLedPattern's timelines before the in-place rewrite."""
+
+    def __init__(self, np, number=12, fps=50):
+        self.np = np
+        self.fps = fps
+        self.basis = np.array([0] * 4 * number)
+        self.basis[0 * 4 + 1] = 2
+        self.basis[3 * 4 + 1] = 1
+        self.basis[3 * 4 + 2] = 1
+        self.basis[6 * 4 + 2] = 2
+        self.basis[9 * 4 + 3] = 2
+
+    def _pixels(self, position):
+        return self.np.roll(self.basis, position * 4) * 24
+
+    def _uint8(self, frames):
+        return [(pixels.astype(self.np.uint8), seconds) for pixels, seconds in frames]
+
+    def wakeup_steps(self, position):
+        np = self.np
+        basis = np.roll(self.basis, position * 4)
+        frames = [(basis * i, 0.005) for i in range(1, 25)]
+        pixels = self._pixels(position + 1)
+        frames.append((pixels, 0.1))
+        for _ in range(2):
+            new_pixels = np.roll(pixels, 4)
+            frames.append((new_pixels * 0.5 + pixels, 0.1))
+            pixels = new_pixels
+        frames.append((pixels, 1.0 / self.fps))
+        return self._uint8(frames)
+
+    def listen_steps(self, position):
+        pixels = self._pixels(position)
+        return self._uint8([(pixels * i / 24, 0.01) for i in range(1, 25)])
+
+    def think_steps(self, position):
+        return self._uint8(
+            [(self._pixels(position + i), 0.2) for i in range(1, len(self.basis) // 4 + 1)]
+        )
+
+    def speak_steps(self, position):
+        pixels = self._pixels(position)
+        frames = []
+        for brightness in list(range(5, 25)) + list(range(23, 5, -1)):
+            seconds = 0.42 if brightness in (5, 24) else 0.02
+            frames.append((pixels * brightness / 24, seconds))
+        return self._uint8(frames)
+
+
+def bench_google(repeat):
+    from google_home_led_pattern import GoogleHomeLedPattern
+
+    pattern = GoogleHomeLedPattern()
+    implementations = [
+        ("numpy.roll", LegacyGoogleSteps(pattern.np)),
+        ("in-place", pattern),
+    ]
+    states = ("wakeup", "listen", "think", "speak")
+    positions = range(pattern.pixels_number)
+
+    def build(steps):
+        frames = 0
+        for state in states:
+            for position in positions:
+                frames += len(getattr(steps, state + "_steps")(position))
+        return frames
+
+    def build_tables(steps):
+        for state in states:
+            for position in positions:
+                compile_table(state, getattr(steps, state + "_steps")(position), peak=48)
+
+    print(f"{'frames':<11} {'us/frame':>9} {'bytes/frame':>12} {'tables ms':>10}")
+    for name, steps in implementations:
+        frames = build(steps)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            build(steps)
+        per_frame = (time.perf_counter() - start) / (repeat * frames) * 1e6
+
+        # Peak memory while building one timeline, over its frames
+        peaks = []
+        tracemalloc.start()
+        for state in states:
+            for position in positions:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                timeline = getattr(steps, state + "_steps")(position)
+                peaks.append((tracemalloc.get_traced_memory()[1] - base) / len(timeline))
+                del timeline
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        build_tables(steps)
+        tables_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"{name:<11} {per_frame:>9.2f} {sum(peaks) / len(peaks):>12.0f} {tables_ms:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APA102 frame output benchmark")
+    parser.add_argument("--leds", type=int, nargs="+", default=[12, 2000])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument(
+        "--hardware", action="store_true", help="Send frames to /dev/spidev0.1"
+    )
+    parser.add_argument(
+        "--static", action="store_true", help="Repaint the same frame every time"
+    )
+    parser.add_argument(
+        "--set-frame",
+        action="store_true",
+        help="Time set_frame against the per-LED set_pixel loop instead",
+    )
+    parser.add_argument(
+        "--clock",
+        action="store_true",
+        help="Play the LED states on the frame clock and report jitter and CPU",
+    )
+    parser.add_argument(
+        "--google",
+        action="store_true",
+        help="Time building GoogleHomeLedPattern frames, old against in-place",
+    )
+    args = parser.parse_args()
+
+    if args.google:
+        bench_google(max(1, int(args.seconds * 20)))
+        return
+    if args.clock:
+        bench_clock(args.leds, args.seconds, args.hardware)
+        return
+    if args.set_frame:
+        bench_set_frame(args.leds, args.seconds)
+        return
+
+    print(f"{'driver':<10} {'leds':>6} {'fps':>10} {'cpu ms/frame':>13} {'xfers/frame':>12}")
+    for n in args.leds:
+        for name in ("legacy", "bytearray"):
+            spi = make_spi(args.hardware)
+            if name == "legacy":
+                if args.hardware and n > 1024:
+                    # xfer2 takes at most 4096 bytes per call
+                    print(f"{name:<10} {n:>6} {'unsupported':>10}")
+                    continue
+                driver = LegacyAPA102(n, spi)
+            else:
+                driver = apa102.APA102(n, spi=spi)
+            frames, fps, cpu_ms = run(driver, args.seconds, args.static)
+            transfers = ""
+            if isinstance(spi, FakeSpi):
+                transfers = f"{spi.transfers / frames:.0f}"
+            print(f"{name:<10} {n:>6} {fps:>10.0f} {cpu_ms:>13.3f} {transfers:>12}")
+            if args.hardware:
+                spi.close()
+
+
+if __name__ == "__main__":
+    main()
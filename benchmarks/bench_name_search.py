@@ -0,0 +1,96 @@
+"""
+Patient name resolution latency at scale.
+
+Fills an in-memory database with generated patient names, builds the name
+indexes and times patient_search.resolve for exact names, single words,
+prefixes and misspellings. Reports p50/p95 latency and how often the
+resolved patient was the intended one, missing, or refused as ambiguous.
+
+    python benchmarks/bench_name_search.py --patients 50000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import patient_search
+
+SYLLABLES = "ba be bo da de di fa ga ha jo ka ki la le li ma me mi na ne no ra re ri sa se so ta te to va vi wa ya yo za".split()
+
+
+def make_name(rnd):
+    def word():
+        return "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 3))).title()
+
+    return f"{word()} {word()}"
+
+
+def misspell(name, rnd):
+    """Double one consonant, the way a recognizer might hear it."""
+    positions = [i for i, ch in enumerate(name) if ch.isalpha() and ch not in "aeiou"]
+    i = rnd.choice(positions)
+    return name[: i + 1] + name[i].lower() + name[i + 1 :]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100.0 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE patients (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, medicine TEXT, time_due TEXT)"
+    )
+    names = [make_name(rnd) for _ in range(args.patients)]
+    conn.executemany("INSERT INTO patients (name) VALUES (?)", [(n,) for n in names])
+    started = time.perf_counter()
+    patient_search.create_index(conn)
+    conn.commit()
+    print(
+        f"{args.patients} patients indexed in {time.perf_counter() - started:.2f}s\n"
+    )
+
+    kinds = {
+        "exact": lambda n: n,
+        "family name": lambda n: n.split()[1],
+        "prefix": lambda n: n[: max(4, len(n) - 3)],
+        "misspelt": lambda n: misspell(n, rnd),
+    }
+    print(f"{'query':<14}{'p50 ms':>10}{'p95 ms':>10}{'correct':>10}{'ambiguous':>11}{'wrong':>8}")
+    for kind, make_query in kinds.items():
+        latencies = []
+        correct = ambiguous = wrong = 0
+        for _ in range(args.queries):
+            patient_id = rnd.randrange(len(names)) + 1
+            query = make_query(names[patient_id - 1])
+            t = time.perf_counter()
+            resolved = patient_search.resolve(conn, query)
+            latencies.append(time.perf_counter() - t)
+            if resolved == patient_id:
+                correct += 1
+            elif resolved is None:
+                ambiguous += 1
+            else:
+                wrong += 1
+        print(
+            f"{kind:<14}{percentile(latencies, 50) * 1000:>10.3f}"
+            f"{percentile(latencies, 95) * 1000:>10.3f}"
+            f"{correct:>10}{ambiguous:>11}{wrong:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Throughput benchmark for concurrent reminder sessions.
+
+Runs reminder conversations against stubbed STT/LLM/TTS backends that only
+sleep for a configurable "cloud" latency, first one at a time (the old
+blocking flow) and then concurrently across several devices, and reports
+sessions per minute for both.
+
+    python benchmarks/bench_sessions.py --sessions 40 --devices 8 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from reminder_sessions import DeviceContext, ReminderSession, SessionRunner
+
+
+def make_device(name, latency):
+    """A device whose every cloud/audio call just waits `latency` seconds."""
+    def record(cancel=None):
+        time.sleep(latency)
+        return "audio.wav"
+
+    def transcribe(audio, cancel=None):
+        time.sleep(latency)
+        return "yes I took it"
+
+    def understand(text):
+        time.sleep(latency)
+        return {"intent": "CONFIRMATION", "value": "YES"}
+
+    def synthesize(text, filename):
+        time.sleep(latency)
+        return True
+
+    def play(filename):
+        time.sleep(latency)
+
+    def status(patient_id, schedule_id):
+        return None
+
+    def log(patient_id, status, notes, schedule_id):
+        pass
+
+    return DeviceContext(name, record, transcribe, understand, synthesize, play, status, log)
+
+
+def make_sessions(devices, count):
+    return [
+        ReminderSession(
+            devices[i % len(devices)], i, f"Patient {i}", "Vitamin B", "10:00"
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    runner = SessionRunner(max_workers=args.workers)
+
+    device = make_device("single", args.latency)
+    start = time.perf_counter()
+    for session in make_sessions([device], args.sessions):
+        runner.run(session)
+    sequential = time.perf_counter() - start
+
+    devices = [make_device(f"room-{i}", args.latency) for i in range(args.devices)]
+    sessions = make_sessions(devices, args.sessions)
+
+    async def run_all():
+        return await asyncio.gather(*(s.run() for s in sessions))
+
+    start = time.perf_counter()
+    outcomes = asyncio.run_coroutine_threadsafe(run_all(), runner.loop).result()
+    concurrent = time.perf_counter() - start
+    runner.stop()
+
+    print(f"Sessions: {args.sessions}  devices: {args.devices}  latency: {args.latency}s")
+    print(f"Sequential: {args.sessions / sequential * 60:8.1f} sessions/min")
+    print(f"Concurrent: {args.sessions / concurrent * 60:8.1f} sessions/min")
+    print(f"Outcomes:   {sorted(set(outcomes))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Latency / accuracy benchmark for the speech-to-text backends.
+
+The corpus is a directory of WAV recordings (16 kHz, 16-bit, as written by
+record_audio) plus a `transcripts.tsv` file with one `<file>\t<expected text>`
+line per recording. Run it on the Pi itself to get Pi-class numbers, e.g.
+
+    python benchmarks/bench_stt.py --corpus fixtures/stt --backend local \\
+        --model models/vosk-model-small-en-us-0.15 --names "Uncle Sam,Athlete Joan"
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import wave
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from stt_backends import build_grammar, make_stt_backend
+
+
+def normalize(text):
+    return " ".join((text or "").lower().replace("'", "").split())
+
+
+def load_corpus(corpus_dir):
+    items = []
+    with open(os.path.join(corpus_dir, "transcripts.tsv")) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            filename, expected = line.split("\t", 1)
+            items.append((os.path.join(corpus_dir, filename), expected))
+    return items
+
+
+def audio_seconds(path):
+    with wave.open(path, "rb") as wf:
+        return wf.getnframes() / float(wf.getframerate())
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", required=True)
+    parser.add_argument(
+        "--backend", default="local", help="cloud, local, cloud+local, local+cloud"
+    )
+    parser.add_argument("--model", default="models/vosk-model-small-en-us-0.15")
+    parser.add_argument("--names", default="", help="Comma-separated patient names")
+    parser.add_argument(
+        "--no-grammar", action="store_true", help="Decode with the open vocabulary"
+    )
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--channels", type=int, default=2)
+    args = parser.parse_args()
+
+    names = [n for n in args.names.split(",") if n.strip()]
+    grammar = None if args.no_grammar else build_grammar(names)
+    backend = make_stt_backend(
+        args.backend, args.rate, args.channels, model_path=args.model, grammar=grammar
+    )
+
+    corpus = load_corpus(args.corpus)
+    latencies = []
+    rtfs = []
+    correct = 0
+    for path, expected in corpus:
+        start = time.perf_counter()
+        text = backend.transcribe(path)
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        rtfs.append(elapsed / max(audio_seconds(path), 1e-6))
+        ok = normalize(text) == normalize(expected)
+        correct += ok
+        print(f"{'OK  ' if ok else 'MISS'} {elapsed * 1000:7.1f} ms  {expected!r} -> {text!r}")
+
+    if not corpus:
+        print("Corpus is empty.")
+        return
+
+    print(f"\nBackend: {backend.name}  grammar: {'off' if grammar is None else len(grammar)}")
+    print(f"Utterances: {len(corpus)}")
+    print(f"Accuracy (exact match): {correct / len(corpus):.1%}")
+    print(
+        f"Latency ms: p50={percentile(latencies, 50) * 1000:.1f} "
+        f"p95={percentile(latencies, 95) * 1000:.1f} "
+        f"max={max(latencies) * 1000:.1f}"
+    )
+    print(f"Real-time factor: mean={statistics.mean(rtfs):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+FPS, jitter and CPU per LED state from a frame log.
+
+Reads a log written by interfaces/led_backend.py (LED_LOG=<path>, or
+app.py --led-log) and reports, for every state Pixels played: frames sent,
+time spent in it, frames per second, how far frame intervals were from a
+whole number of frame periods (jitter), and the CPU time the frame clock
+thread used. Frames a state repeats unchanged are not sent, so a state that
+holds still sends fewer frames than the clock rate.
+
+With --record, first plays the usual wakeup/think/speak/off cycle on the
+simulated backend into the log, so the whole check runs on any machine:
+
+    python benchmarks/led_report.py leds.log --record --seconds 20
+    python benchmarks/led_report.py leds.log --fps 50
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "interfaces"))
+
+import led_backend
+from led_animation import FPS
+
+
+def record(path, seconds, pattern_name):
+    from pixels import Pixels
+
+    if pattern_name == "google":
+        from google_home_led_pattern import GoogleHomeLedPattern as pattern
+    else:
+        from alexa_led_pattern import AlexaLedPattern as pattern
+
+    backend = led_backend.SimulatedBackend(path)
+    pixels = Pixels(pattern=pattern, backend=backend)
+    cycle = [
+        (pixels.wakeup, 1.0),
+        (pixels.listen, 2.0),
+        (pixels.think, 3.0),
+        (pixels.speak, 4.0),
+        (pixels.off, 1.0),
+    ]
+    end = time.time() + seconds
+    while time.time() < end:
+        for state, hold in cycle:
+            state()
+            time.sleep(min(hold, max(0, end - time.time())))
+    pixels.clock.stop()
+    backend.log.close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+def report(path, fps):
+    period = 1.0 / fps
+    states = OrderedDict()
+    state = None
+    started = None
+    last_time = None
+    last_frame = None
+    last_cpu = None
+
+    def close(until):
+        if state is not None:
+            states[state]["seconds"] += until - started
+
+    for kind, t, cpu, payload in led_backend.read_log(path):
+        if kind == led_backend.END:
+            close(t)
+            state = None
+        elif kind == led_backend.MARK:
+            # Written by the clock thread just before the state's first frame
+            close(t)
+            if state is not None and last_cpu is not None:
+                states[state]["cpu"] += cpu - last_cpu
+            last_cpu = cpu
+            state = payload.decode("utf-8")
+            started = t
+            last_frame = None
+            states.setdefault(
+                state, {"frames": 0, "seconds": 0.0, "cpu": 0.0, "jitter": []}
+            )
+        elif kind == led_backend.FRAME and state is not None:
+            entry = states[state]
+            entry["frames"] += 1
+            if last_cpu is not None:
+                entry["cpu"] += cpu - last_cpu
+            last_cpu = cpu
+            if last_frame is not None:
+                interval = t - last_frame
+                ticks = max(1, round(interval / period))
+                entry["jitter"].append(abs(interval - ticks * period))
+            last_frame = t
+        last_time = t
+    if last_time is not None:
+        close(last_time)
+
+    print(
+        f"{'state':<10} {'frames':>7} {'seconds':>8} {'fps':>6} {'jitter p50 ms':>14}"
+        f" {'p99 ms':>7} {'max ms':>7} {'cpu ms/frame':>13} {'cpu %':>6}"
+    )
+    for name, s in states.items():
+        if not s["seconds"]:
+            continue
+        jitter = s["jitter"]
+        cpu_per_frame = s["cpu"] / s["frames"] * 1000 if s["frames"] else 0.0
+        print(
+            f"{name:<10} {s['frames']:>7} {s['seconds']:>8.2f}"
+            f" {s['frames'] / s['seconds']:>6.1f}"
+            f" {percentile(jitter, 0.5) * 1000:>14.3f}"
+            f" {percentile(jitter, 0.99) * 1000:>7.3f}"
+            f" {max(jitter or [0]) * 1000:>7.3f}"
+            f" {cpu_per_frame:>13.3f} {s['cpu'] / s['seconds'] * 100:>5.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report on an LED frame log")
+    parser.add_argument("log")
+    parser.add_argument("--fps", type=float, default=FPS, help="Frame clock rate")
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="First record a demo cycle on the simulated backend",
+    )
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--pattern", choices=["alexa", "google"], default="alexa")
+    args = parser.parse_args()
+
+    if args.record:
+        if os.path.exists(args.log):
+            os.remove(args.log)
+        record(args.log, args.seconds, args.pattern)
+    report(args.log, args.fps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Local load test for the caregiver dashboard, APIs and pillbox events.
+
+Starts app.py in --stub mode (no hardware, audio or cloud calls) on a scratch
+database, attaches M simulated pillboxes through pseudo-terminals, and runs N
+simulated caregiver browsers against it:
+
+  * each browser loops over GET /caregiver, /api/logs/all and
+    /api/patient/<id>/logs and keeps a Socket.IO connection open;
+  * each pillbox writes an OPENEVENT line for today every --event-interval
+    seconds, and the time until every browser sees the TAKEN status_batch for
+    that patient is recorded as the event-to-browser delivery delay.
+
+Reports p50/p95/p99 latency per endpoint, error rates and delivery delay.
+With --max-p95-ms / --max-error-rate it exits non-zero when a budget is
+exceeded, so it can gate a release. Everything runs on localhost.
+
+Needs `requests` and `python-socketio[client]` on top of the app's own
+requirements.
+
+    python benchmarks/loadtest.py --browsers 20 --pillboxes 8 --duration 60 \\
+        --serve production
+"""
+
+import argparse
+import os
+import pty
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import requests
+import socketio
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENDPOINTS = ["/caregiver", "/api/logs/all", "/api/patient/{id}/logs"]
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.errors = defaultdict(int)
+        self.requests = defaultdict(int)
+        self.delivery = []  # seconds from OPENEVENT to browser
+        self.socket_errors = 0
+
+    def record(self, endpoint, elapsed, ok):
+        with self.lock:
+            self.requests[endpoint] += 1
+            if ok:
+                self.latencies[endpoint].append(elapsed)
+            else:
+                self.errors[endpoint] += 1
+
+
+class Pillbox:
+    """A pseudo-terminal the app reads as a serial port bound to one patient."""
+
+    def __init__(self, patient_id):
+        self.patient_id = patient_id
+        self.master, slave = pty.openpty()
+        self.path = os.ttyname(slave)
+        self.sent = []  # send times
+
+    def open_lid(self):
+        line = f"OPENEVENT:{datetime.now().strftime('%a')}\n".encode()
+        self.sent.append(time.time())
+        os.write(self.master, line)
+
+
+def start_app(args, db_path, pillboxes, log_file):
+    cmd = [
+        sys.executable,
+        os.path.join(ROOT, "app.py"),
+        "--stub",
+        "--db",
+        db_path,
+        "--serve",
+        args.serve,
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(args.port),
+    ]
+    for box in pillboxes:
+        cmd += ["--serial-port", f"{box.path}@{box.patient_id}"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=log_file, stderr=subprocess.STDOUT)
+
+    base = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("app.py exited during startup; see the app log")
+        try:
+            requests.get(base + "/api/changes", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("app.py did not come up within 30s")
+
+
+def create_patients(base, count):
+    """Adds fixed-width names so no name is a substring of another."""
+    for i in range(count):
+        requests.post(
+            base + "/patient/create",
+            data={
+                "name": f"Load Patient {i:05d}",
+                "medicine": "Vitamin B",
+                "time_due": "23:59",
+            },
+            allow_redirects=False,
+            timeout=10,
+        )
+    # Page through the whole change log: patients can sit past the first page
+    patient_ids = []
+    since = 0
+    while True:
+        page = requests.get(
+            base + "/api/changes",
+            params={"since": since, "limit": 1000},
+            timeout=10,
+        ).json()
+        if page.get("resync"):
+            raise RuntimeError("change log was pruned; use a fresh scratch database")
+        patient_ids += [
+            c["entity_id"] for c in page["changes"] if c["entity"] == "patient"
+        ]
+        since = page["last_seq"]
+        if not page["has_more"]:
+            return patient_ids
+
+
+def browser(base, patient_ids, stats, pillboxes_by_patient, stop):
+    client = socketio.Client(reconnection=True)
+    seen = {}  # patient_id -> last seq seen
+
+    @client.on("connect")
+    def on_connect():
+        client.emit("subscribe", {})
+
+    @client.on("status_batch")
+    def on_batch(data):
+        now = time.time()
+        for update in data["updates"]:
+            box = pillboxes_by_patient.get(update["patient_id"])
+            seq = update.get("seq") or 0
+            if not box or not box.sent or update["status"] != "TAKEN":
+                continue
+            if seq <= seen.get(update["patient_id"], 0):
+                continue
+            seen[update["patient_id"]] = seq
+            with stats.lock:
+                stats.delivery.append(now - box.sent[-1])
+
+    try:
+        client.connect(base)
+    except Exception:
+        with stats.lock:
+            stats.socket_errors += 1
+
+    session = requests.Session()
+    while not stop.is_set():
+        endpoint = random.choice(ENDPOINTS)
+        url = base + endpoint.format(id=random.choice(patient_ids))
+        start = time.perf_counter()
+        try:
+            ok = session.get(url, timeout=10).status_code == 200
+        except requests.RequestException:
+            ok = False
+        stats.record(endpoint, time.perf_counter() - start, ok)
+
+    client.disconnect()
+
+
+def pillbox_loop(box, interval, stop):
+    # Spread the devices out so they do not all fire at once
+    stop.wait(random.uniform(0, interval))
+    while not stop.is_set():
+        box.open_lid()
+        stop.wait(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--browsers", type=int, default=10)
+    parser.add_argument("--pillboxes", type=int, default=4)
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--event-interval", type=float, default=2.0)
+    parser.add_argument("--serve", choices=["dev", "production"], default="dev")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--max-error-rate", type=float)
+    args = parser.parse_args()
+    args.port = args.port or free_port()
+
+    workdir = tempfile.mkdtemp(prefix="medmgr-load-")
+    log_path = os.path.join(workdir, "app.log")
+    base = f"http://127.0.0.1:{args.port}"
+
+    # Pillboxes are bound to patient ids 1..M (the seeded patients come first)
+    pillboxes = [Pillbox(i % max(args.patients, 1) + 1) for i in range(args.pillboxes)]
+    pillboxes_by_patient = {box.patient_id: box for box in pillboxes}
+
+    with open(log_path, "w") as log_file:
+        proc = start_app(args, os.path.join(workdir, "load.db"), pillboxes, log_file)
+        try:
+            patient_ids = create_patients(base, args.patients) or [1]
+            stats = Stats()
+            stop = threading.Event()
+            threads = [
+                threading.Thread(
+                    target=browser,
+                    args=(base, patient_ids, stats, pillboxes_by_patient, stop),
+                    daemon=True,
+                )
+                for _ in range(args.browsers)
+            ]
+            threads += [
+                threading.Thread(
+                    target=pillbox_loop, args=(box, args.event_interval, stop), daemon=True
+                )
+                for box in pillboxes
+            ]
+            for t in threads:
+                t.start()
+            time.sleep(args.duration)
+            stop.set()
+            for t in threads:
+                t.join(timeout=15)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    print(f"Server: {args.serve}  browsers: {args.browsers}  pillboxes: {args.pillboxes}")
+    print(f"Duration: {args.duration:.0f}s  app log: {log_path}\n")
+    print(f"{'endpoint':<26}{'reqs':>8}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    total = errors = 0
+    worst_p95 = 0.0
+    for endpoint in ENDPOINTS:
+        lat = stats.latencies[endpoint]
+        reqs = stats.requests[endpoint]
+        errs = stats.errors[endpoint]
+        total += reqs
+        errors += errs
+        p95 = percentile(lat, 95) * 1000
+        if lat:
+            worst_p95 = max(worst_p95, p95)
+        print(
+            f"{endpoint:<26}{reqs:>8}{(errs / reqs * 100 if reqs else 0):>8.2f}"
+            f"{percentile(lat, 50) * 1000:>10.1f}{p95:>10.1f}"
+            f"{percentile(lat, 99) * 1000:>10.1f}"
+        )
+    print(f"\nThroughput: {total / args.duration:.1f} req/s")
+    sent = sum(len(box.sent) for box in pillboxes)
+    print(
+        f"Pillbox events: {sent}  deliveries: {len(stats.delivery)}  "
+        f"socket connect errors: {stats.socket_errors}"
+    )
+    print(
+        f"Event-to-browser ms: p50={percentile(stats.delivery, 50) * 1000:.1f} "
+        f"p95={percentile(stats.delivery, 95) * 1000:.1f} "
+        f"p99={percentile(stats.delivery, 99) * 1000:.1f}"
+    )
+
+    error_rate = errors / total if total else 1.0
+    failed = False
+    if args.max_p95_ms is not None and worst_p95 > args.max_p95_ms:
+        print(f"FAIL: p95 {worst_p95:.1f} ms > {args.max_p95_ms} ms")
+        failed = True
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        print(f"FAIL: error rate {error_rate:.2%} > {args.max_error_rate:.2%}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
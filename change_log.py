@@ -0,0 +1,120 @@
+"""
+Append-only change log for incremental dashboard sync.
+
+Every write that changes what a dashboard shows (medication log status,
+patients) appends a row here in the same transaction, so `seq` is a
+monotonically increasing cursor over the database state. A client that
+remembers the last `seq` it applied can catch up with `changes_since`.
+
+Nightly maintenance `prune`s entries past the log retention horizon. A
+client whose `seq` is older than everything kept (`is_stale`) has missed
+changes for good and has to reload the full state instead.
+"""
+
+import json
+from datetime import datetime
+
+MAX_PAGE_SIZE = 1000
+
+
+def create_table(c):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id INTEGER,
+            op TEXT NOT NULL,
+            payload TEXT
+        )
+    """
+    )
+
+
+def record_change(c, entity, entity_id, op, payload=None):
+    """
+    Append a change using cursor/connection `c` without committing; the
+    caller commits it together with the write it describes. Returns its seq.
+    """
+    cur = c.execute(
+        "INSERT INTO change_log (created_at, entity, entity_id, op, payload) VALUES (?, ?, ?, ?, ?)",
+        (
+            datetime.now().isoformat(timespec="seconds"),
+            entity,
+            entity_id,
+            op,
+            json.dumps(payload) if payload is not None else None,
+        ),
+    )
+    return cur.lastrowid
+
+
+def record_changes(c, changes):
+    """Append many (entity, entity_id, op, payload) changes with one executemany."""
+    created_at = datetime.now().isoformat(timespec="seconds")
+    c.executemany(
+        "INSERT INTO change_log (created_at, entity, entity_id, op, payload) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                created_at,
+                entity,
+                entity_id,
+                op,
+                json.dumps(payload) if payload is not None else None,
+            )
+            for entity, entity_id, op, payload in changes
+        ],
+    )
+
+
+def latest_seq(conn):
+    row = conn.execute("SELECT MAX(seq) FROM change_log").fetchone()
+    return row[0] or 0
+
+
+def prune(c, cutoff):
+    """
+    Drop changes created before `cutoff` (YYYY-MM-DD), always keeping the
+    newest one so latest_seq survives. Does not commit. Returns how many.
+    """
+    # seq follows created_at, so this reads only the rows about to go
+    row = c.execute(
+        "SELECT seq FROM change_log WHERE created_at >= ? ORDER BY seq LIMIT 1",
+        (cutoff,),
+    ).fetchone()
+    keep_from = row[0] if row else latest_seq(c)
+    return c.execute("DELETE FROM change_log WHERE seq < ?", (keep_from,)).rowcount
+
+
+def is_stale(conn, since):
+    """True if changes after `since` were pruned, so catching up is impossible."""
+    row = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()
+    return row[0] is not None and since + 1 < row[0]
+
+
+def changes_since(conn, since, limit=500):
+    """
+    Changes with seq > since, oldest first. Returns (changes, last_seq,
+    has_more); pass last_seq back as `since` to fetch the next page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    rows = conn.execute(
+        "SELECT seq, created_at, entity, entity_id, op, payload FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+        (since, limit + 1),
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [
+        {
+            "seq": row[0],
+            "created_at": row[1],
+            "entity": row[2],
+            "entity_id": row[3],
+            "op": row[4],
+            "payload": json.loads(row[5]) if row[5] else None,
+        }
+        for row in rows
+    ]
+    last_seq = changes[-1]["seq"] if changes else since
+    return changes, last_seq, has_more
@@ -0,0 +1,212 @@
+"""
+Single-writer database thread with group commit.
+
+Every status write goes through one thread that owns the only writing
+connection. Jobs queued while a transaction is being assembled are run
+together and committed once: the writer takes the first job, waits at most
+`max_delay` seconds (or until `max_batch` jobs) for more, runs each in its
+own SAVEPOINT so a failing job only rolls back itself, and commits. Under
+contention many writes share one fsync instead of queueing on SQLite's lock.
+
+Callers get a concurrent.futures.Future that resolves only after the commit,
+so anything they do with the result (publishing events, Socket.IO emits)
+happens after the data is durable. `on_connect(conn)` runs once on the
+writer's connection before any job (e.g. to attach the archive database).
+`on_commit(seconds, latencies)`, if given, is called after every commit with
+how long the transaction took (BEGIN to COMMIT, fsync included) and each
+job's submit-to-commit latency, e.g. to feed metrics histograms.
+
+`write` blocks its caller until the commit. Under gevent with threads left
+unpatched that would block the hub, and every other greenlet with it, so
+the production server passes `wait=gevent_wait`.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+LATENCY_SAMPLES = 2048
+
+
+def gevent_wait(future, timeout=None):
+    """
+    DBWriter `wait` for gevent with native threads: a greenlet on the hub's
+    (main) thread parks on an AsyncResult that the writer thread sets, so the
+    hub keeps serving other greenlets during the commit. Calls from other OS
+    threads (sessions, pillboxes) block as usual.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return future.result(timeout)
+    from gevent.event import AsyncResult
+
+    done = AsyncResult()
+    future.add_done_callback(done.set)  # Runs on the writer thread
+    done.wait(timeout)
+    return future.result(0)  # concurrent.futures.TimeoutError if not done
+
+class DBWriter:
+    def __init__(
+        self,
+        db_path,
+        max_batch=256,
+        max_delay=0.005,
+        on_connect=None,
+        on_commit=None,
+        wait=None,
+    ):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_connect = on_connect
+        self.on_commit = on_commit
+        self.wait = wait  # wait(future, timeout) -> result, for `write`
+        self._queue = queue.Queue()
+        self._thread = None
+
+        self._lock = threading.Lock()
+        self._jobs = 0
+        self._failed = 0
+        self._commits = 0
+        self._started_at = time.time()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)  # submit -> commit, seconds
+        self._batch_sizes = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="db-writer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, fn, *args):
+        """
+        Run `fn(conn, *args)` on the writer thread inside the next group
+        transaction. Returns a Future for its return value, resolved once
+        the transaction has committed.
+        """
+        future = Future()
+        self._queue.put((fn, args, future, time.perf_counter()))
+        return future
+
+    def write(self, fn, *args, timeout=None):
+        """Blocking `submit(...).result()`, through `wait` if one was given."""
+        future = self.submit(fn, *args)
+        if self.wait is not None:
+            return self.wait(future, timeout)
+        return future.result(timeout)
+
+    def _connect(self):
+        # Transactions are managed explicitly below
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # Stop after this batch
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        began = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((future, None, e))
+                else:
+                    conn.execute("RELEASE job")
+                    results.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"DB writer: batch of {len(batch)} failed: {e}")
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._lock:
+                self._failed += len(batch)
+            return
+
+        committed = time.perf_counter()
+        latencies = [committed - submitted for _, _, _, submitted in batch]
+        with self._lock:
+            self._commits += 1
+            self._jobs += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._latencies.extend(latencies)
+            self._failed += sum(1 for _, _, error in results if error)
+        if self.on_commit:
+            self.on_commit(committed - began, latencies)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            sizes = list(self._batch_sizes)
+            elapsed = time.time() - self._started_at
+
+            def pct(p):
+                if not latencies:
+                    return None
+                index = min(len(latencies) - 1, int(p / 100.0 * len(latencies)))
+                return round(latencies[index] * 1000, 3)
+
+            return {
+                "jobs_total": self._jobs,
+                "jobs_failed": self._failed,
+                "commits_total": self._commits,
+                "jobs_per_second": self._jobs / elapsed if elapsed else 0.0,
+                "jobs_per_commit": round(sum(sizes) / len(sizes), 2) if sizes else None,
+                "commit_latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99)},
+                "queued": self._queue.qsize(),
+                "uptime_seconds": elapsed,
+            }
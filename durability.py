@@ -0,0 +1,137 @@
+"""
+Durability profiles for the SQLite database and transient audio files.
+
+`strict` is SQLite's default behaviour: a rollback journal and an fsync on
+every commit. `sd-card` trades the last few seconds of commits on power loss
+(never consistency) for far fewer writes to the Pi's SD card:
+
+  * WAL with synchronous=NORMAL: a commit appends to the WAL without an
+    fsync; only checkpoints sync the database file.
+  * Checkpoints are batched: the automatic checkpoint threshold is raised and
+    a background Checkpointer copies the WAL back every few minutes, with a
+    PASSIVE checkpoint that never blocks the writer.
+  * The WAV files rewritten on every turn (recorded answer, spoken response,
+    pillbox alert) live on tmpfs instead of the card.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class DurabilityProfile:
+    name: str
+    journal_mode: str
+    synchronous: str
+    wal_autocheckpoint: Optional[int] = None  # WAL pages; None keeps SQLite's 1000
+    checkpoint_interval: Optional[float] = None  # Seconds between checkpoints
+    audio_dir: Optional[str] = None  # Transient WAV files; None is the working dir
+
+
+PROFILES = {
+    "strict": DurabilityProfile("strict", "DELETE", "FULL"),
+    "sd-card": DurabilityProfile(
+        "sd-card",
+        "WAL",
+        "NORMAL",
+        wal_autocheckpoint=8000,  # About 32 MB of WAL before a forced checkpoint
+        checkpoint_interval=300.0,
+        audio_dir="/dev/shm/medication-manager",
+    ),
+}
+
+
+def apply(conn, profile, persistent=False):
+    """
+    Set the per-connection pragmas of `profile`. With `persistent`, also the
+    journal mode, which is stored in the database file; that needs no other
+    connection to be open, so it is done once at startup.
+    """
+    if persistent:
+        conn.execute(f"PRAGMA journal_mode = {profile.journal_mode}").fetchone()
+    conn.execute(f"PRAGMA synchronous = {profile.synchronous}")
+    if profile.wal_autocheckpoint is not None:
+        conn.execute(f"PRAGMA wal_autocheckpoint = {int(profile.wal_autocheckpoint)}")
+
+
+def audio_path(profile, filename):
+    """Where a transient audio file goes under `profile`."""
+    if not profile.audio_dir:
+        return filename
+    try:
+        os.makedirs(profile.audio_dir, exist_ok=True)
+    except OSError as e:
+        print(f"Cannot use {profile.audio_dir} for audio ({e}); using working dir.")
+        return filename
+    return os.path.join(profile.audio_dir, filename)
+
+
+class Checkpointer:
+    """
+    Background thread that checkpoints the WAL every `interval` seconds on
+    its own connection, and truncates it on stop.
+    """
+
+    def __init__(self, db_path, interval):
+        self.db_path = db_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._checkpoints = 0
+        self._pages = 0
+        self._busy = 0
+        self._last = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="wal-checkpointer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+            self.checkpoint("TRUNCATE")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
+
+    def checkpoint(self, mode="PASSIVE"):
+        """Copy committed WAL frames into the database file. Returns pages copied."""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=1)
+            try:
+                busy, _, copied = conn.execute(
+                    f"PRAGMA wal_checkpoint({mode})"
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"WAL checkpoint failed: {e}")
+            return 0
+        with self._lock:
+            self._checkpoints += 1
+            self._pages += max(copied, 0)
+            self._busy += busy
+            self._last = time.time()
+        return copied
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checkpoints": self._checkpoints,
+                "pages_checkpointed": self._pages,
+                "busy": self._busy,
+                "last_checkpoint": self._last,
+                "interval_seconds": self.interval,
+            }
@@ -0,0 +1,62 @@
+"""
+In-process publish/subscribe bus for medication status changes.
+
+log_medication publishes a MedicationStatusEvent after every write. Reminder
+sessions, the Socket.IO emitter and caregiver alerting subscribe to it, either
+to every patient or to a single patient_id, instead of polling the database.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class MedicationStatusEvent:
+    patient_id: int
+    patient_name: str
+    status: str  # TAKEN, MISSED or PENDING
+    date: str
+    time_taken: Optional[str] = None
+    notes: Optional[str] = None
+    seq: Optional[int] = None  # change_log sequence number of the write
+    schedule_id: Optional[int] = None  # Which of the patient's doses
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = {}  # (event type, patient_id or None) -> [handler]
+
+    def subscribe(self, event_type, handler, patient_id=None):
+        """
+        Call `handler(event)` for every published `event_type`, or only for
+        events about `patient_id` if given. Returns an unsubscribe function.
+        """
+        key = (event_type, patient_id)
+        with self._lock:
+            self._handlers.setdefault(key, []).append(handler)
+
+        def unsubscribe():
+            with self._lock:
+                handlers = self._handlers.get(key, [])
+                if handler in handlers:
+                    handlers.remove(handler)
+                if not handlers:
+                    self._handlers.pop(key, None)
+
+        return unsubscribe
+
+    def publish(self, event):
+        """Deliver `event` synchronously on the publishing thread."""
+        event_type = type(event)
+        with self._lock:
+            handlers = list(self._handlers.get((event_type, None), ()))
+            patient_id = getattr(event, "patient_id", None)
+            if patient_id is not None:
+                handlers += self._handlers.get((event_type, patient_id), ())
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Event handler error ({event_type.__name__}): {e}")
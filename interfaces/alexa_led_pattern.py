@@ -14,87 +14,84 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
+from led_animation import FPS, GAMMA, compile_table
 
 
 class AlexaLedPattern(object):
-    def __init__(self, show=None, number=12):
-        self.pixels_number = number
-        self.pixels = [0] * 4 * number
-
-        if not show or not callable(show):
-
-            def dummy(data):
-                pass
+    """
+    Alexa-style LED states, each compiled once into a FrameTable that
+    Pixels hands to its frame clock. Channel values go up to `peak` (24);
+    the wakeup highlight is brighter and is not gamma-corrected.
+    """
 
-            show = dummy
-
-        self.show = show
-        self.stop = False
+    def __init__(self, number=12, encode=bytes, fps=FPS, gamma=GAMMA, peak=24):
+        self.pixels_number = number
+        self.encode = encode
+        self.fps = fps
+        self.gamma = gamma
+        self.peak = peak
+        self._tables = {}
+
+    def _table(self, name, steps, loop=True, variant=None):
+        table = self._tables.get((name, variant))
+        if table is None:
+            table = compile_table(name, steps(), self.encode, self.peak,
+                                  self.gamma, self.fps, loop)
+            self._tables[name, variant] = table
+        return table
+
+    def _breathing(self, channels, step_seconds, hold_seconds):
+        # Brightness 0 -> peak -> 0 one step at a time, holding at both ends
+        steps = []
+        for brightness in list(range(self.peak + 1)) + list(range(self.peak - 1, 0, -1)):
+            pixel = [0, 0, 0, 0]
+            for channel in channels:
+                pixel[channel] = brightness
+            seconds = step_seconds
+            if brightness in (0, self.peak):
+                seconds += hold_seconds
+            steps.append((pixel * self.pixels_number, seconds))
+        return steps
 
     def wakeup(self, direction=0):
         position = (
             int((direction + 15) / (360 / self.pixels_number)) % self.pixels_number
         )
 
-        pixels = [0, 0, 0, 24] * self.pixels_number
-        pixels[position * 4 + 2] = 48
+        def steps():
+            pixels = [0, 0, 0, self.peak] * self.pixels_number
+            pixels[position * 4 + 2] = 2 * self.peak
+            return [(pixels, 1.0 / self.fps)]
 
-        self.show(pixels)
+        return self._table('wakeup', steps, loop=False, variant=position)
 
     def listen(self):
         # Breathing White (Listening) - Slower
-        step = 1
-        brightness = 0
-        while not self.stop:
-            # White is Red+Green+Blue
-            # brightness is used for all channels
-            pixels = [0, brightness, brightness, brightness] * self.pixels_number
-            self.show(pixels)
-            time.sleep(0.04)  # Slower fade (was 0.01)
-
-            if brightness <= 0:
-                step = 1
-                time.sleep(0.2)  # Hold at dark (was 0.05)
-            elif brightness >= 24:
-                step = -1
-                time.sleep(0.2)  # Hold at bright (was 0.05)
-
-            brightness += step
+        return self._table(
+            'listen', lambda: self._breathing((1, 2, 3), 0.04, 0.2)
+        )
 
     def think(self):
         # Rotating White (Thinking/Processing)
-        # 3 pixels White
-        pixels = [0, 0, 0, 0] * self.pixels_number
-        for i in range(3):
-            # White: R=24, G=24, B=24
-            pixels[i * 4 + 1] = 24
-            pixels[i * 4 + 2] = 24
-            pixels[i * 4 + 3] = 24
-
-        while not self.stop:
-            self.show(pixels)
-            time.sleep(0.1)
-            pixels = pixels[-4:] + pixels[:-4]
+        # 3 pixels White, one step every 0.1 s
+        def steps():
+            pixels = [0, 0, 0, 0] * self.pixels_number
+            for i in range(3):
+                pixels[i * 4 + 1:i * 4 + 4] = [self.peak] * 3
+            frames = []
+            for _ in range(self.pixels_number):
+                frames.append((pixels, 0.1))
+                pixels = pixels[-4:] + pixels[:-4]
+            return frames
+
+        return self._table('think', steps)
 
     def speak(self):
         # Breathing Green (Speaking/Playback)
-        step = 1
-        brightness = 0
-        while not self.stop:
-            # +2 is Green
-            pixels = [0, 0, brightness, 0] * self.pixels_number
-            self.show(pixels)
-            time.sleep(0.01)
-
-            if brightness <= 0:
-                step = 1
-                time.sleep(0.05)
-            elif brightness >= 24:
-                step = -1
-                time.sleep(0.05)
-
-            brightness += step
+        return self._table('speak', lambda: self._breathing((2,), 0.01, 0.05))
 
     def off(self):
-        self.show([0] * 4 * 12)
+        return self._table(
+            'off', lambda: [([0] * 4 * self.pixels_number, 1.0 / self.fps)],
+            loop=False,
+        )
@@ -2,8 +2,11 @@
 from https://github.com/tinue/APA102_Pi
 This is the main driver module for APA102 LEDs
 """
-import spidev
 from math import ceil
+try:
+    import spidev
+except ImportError:
+    spidev = None  # Only needed when no spi device is passed in
 
 RGB_MAP = { 'rgb': [3, 2, 1], 'rbg': [3, 1, 2], 'grb': [2, 3, 1],
             'gbr': [2, 1, 3], 'brg': [1, 3, 2], 'bgr': [1, 2, 3] }
@@ -19,6 +22,8 @@ class APA102:
     Public methods are:
      - set_pixel
      - set_pixel_rgb
+     - set_frame
+     - encode / show_frame
      - show
      - clear_strip
      - cleanup
@@ -30,6 +35,15 @@ class APA102:
     The rest of the methods are used internally and should not be used by the
     user of the library.
 
+    The whole SPI message (start frame, one 4 byte frame per LED, end frame)
+    lives in one bytearray, and show() hands it to the SPI driver in a single
+    writebytes2() call without copying it. self.leds is a memoryview of the
+    LED frames inside it. Pass an object with the SpiDev interface as `spi`
+    to drive something other than /dev/spidev<bus>.<device>.
+
+    show() remembers the last frame it sent and skips the transfer when the
+    buffer has not changed since; frames_sent and frames_skipped count both.
+
     Very brief overview of APA102: An APA102 LED is addressed with SPI. The bits
     are shifted in one by one, starting with the least significant bit.
 
@@ -75,7 +89,7 @@ class APA102:
     LED_START = 0b11100000 # Three "1" bits, followed by 5 brightness bits
 
     def __init__(self, num_led, global_brightness=MAX_BRIGHTNESS,
-                 order='rgb', bus=0, device=1, max_speed_hz=8000000):
+                 order='rgb', bus=0, device=1, max_speed_hz=8000000, spi=None):
         self.num_led = num_led  # The number of LEDs in the Strip
         order = order.lower()
         self.rgb = RGB_MAP.get(order, RGB_MAP['rgb'])
@@ -85,12 +99,54 @@ class APA102:
         else:
             self.global_brightness = global_brightness
 
-        self.leds = [self.LED_START,0,0,0] * self.num_led # Pixel buffer
-        self.spi = spidev.SpiDev()  # Init the SPI device
-        self.spi.open(bus, device)  # Open SPI port 0, slave device (CS) 1
-        # Up the speed a bit, so that the LEDs are painted faster
-        if max_speed_hz:
-            self.spi.max_speed_hz = max_speed_hz
+        # Start frame (32 zero bits), LED frames, end frame (num_led/2 bits,
+        # see clock_end_frame). Zeroes are fine for both.
+        self._end_index = 4 + 4 * self.num_led
+        self._frame = bytearray(self._end_index + (self.num_led + 15) // 16)
+        self._frame[4:self._end_index] = bytes([self.LED_START,0,0,0]) * self.num_led
+        self.leds = memoryview(self._frame)[4:self._end_index] # Pixel buffer
+
+        # LED start byte for every whole bright_percent, so that set_pixel
+        # does not redo the brightness math for each pixel
+        self._led_start = {percent: self._start_byte(percent)
+                           for percent in range(101)}
+        self._start_frames = {} # LED start byte -> one per LED, for set_frame
+
+        if spi is None:
+            if spidev is None:
+                raise RuntimeError("spidev is not installed: pip install spidev")
+            spi = spidev.SpiDev()  # Init the SPI device
+            spi.open(bus, device)  # Open SPI port 0, slave device (CS) 1
+            # Up the speed a bit, so that the LEDs are painted faster
+            if max_speed_hz:
+                spi.max_speed_hz = max_speed_hz
+        self.spi = spi
+        # writebytes2 (spidev >= 3.3) takes any buffer and splits it into
+        # transfers of the driver's bufsiz by itself
+        self._writebytes2 = getattr(spi, 'writebytes2', None)
+
+        self._last_frame = None # Copy of what the strip shows, see show()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+
+    def _start_byte(self, bright_percent):
+        """LED start byte for a brightness in percent of global_brightness."""
+        # Calculate pixel brightness as a percentage of the
+        # defined global_brightness. Round up to nearest integer
+        # as we expect some brightness unless set to 0
+        brightness = int(ceil(bright_percent*self.global_brightness/100.0))
+
+        # LED startframe is three "1" bits, followed by 5 brightness bits
+        return (brightness & 0b00011111) | self.LED_START
+
+    def _write(self, data):
+        """Sends a buffer to the strip in as few SPI transfers as possible."""
+        if self._writebytes2 is not None:
+            self._writebytes2(data)
+            return
+        # Older spidev: lists only, at most 4096 bytes per transfer
+        for start in range(0, len(data), 4096):
+            self.spi.writebytes(list(data[start:start + 4096]))
 
     def clock_start_frame(self):
         """Sends a start frame to the LED strip.
@@ -98,7 +154,7 @@ class APA102:
         This method clocks out a start frame, telling the receiving LED
         that it must update its own color now.
         """
-        self.spi.xfer2([0] * 4)  # Start frame, 32 zero bits
+        self._write(self._frame[:4])  # Start frame, 32 zero bits
 
 
     def clock_end_frame(self):
@@ -129,8 +185,7 @@ class APA102:
         been sent as part of "clockEndFrame".
         """
         # Round up num_led/2 bits (or num_led/16 bytes)
-        for _ in range((self.num_led + 15) // 16):
-            self.spi.xfer2([0x00])
+        self._write(self._frame[self._end_index:])
 
 
     def clear_strip(self):
@@ -153,14 +208,9 @@ class APA102:
         if led_num >= self.num_led:
             return  # again, invisible
 
-        # Calculate pixel brightness as a percentage of the
-        # defined global_brightness. Round up to nearest integer
-        # as we expect some brightness unless set to 0
-        brightness = ceil(bright_percent*self.global_brightness/100.0)
-        brightness = int(brightness)
-
-        # LED startframe is three "1" bits, followed by 5 brightness bits
-        ledstart = (brightness & 0b00011111) | self.LED_START
+        ledstart = self._led_start.get(bright_percent)
+        if ledstart is None:
+            ledstart = self._start_byte(bright_percent)
 
         start_index = 4 * led_num
         self.leds[start_index] = ledstart
@@ -182,6 +232,69 @@ class APA102:
                         bright_percent)
 
 
+    def set_frame(self, data, bright_percent=100):
+        """Sets the colors of all pixels at once.
+
+        `data` holds 4 values per LED, [unused, red, green, blue], like the
+        frames the LED patterns produce: bytes, a bytearray, a memoryview, a
+        list of numbers or a NumPy array (lists and arrays of any type are
+        clipped to 0..255 and truncated). Each channel is copied into the pixel buffer
+        with one strided slice assignment, remapped to the strip's color
+        order on the way. Extra values are ignored; LEDs past the end of a
+        shorter frame keep their color. Nothing is shown yet.
+        """
+        self._fill(self._frame, 4, data, bright_percent)
+
+
+    def encode(self, data, bright_percent=100):
+        """Converts a frame for set_frame into the strip's LED frame bytes.
+
+        The result can be shown any number of times with show_frame, which
+        only copies it into the pixel buffer; the LED animations encode
+        their frames once up front.
+        """
+        leds = bytearray(4 * self.num_led)
+        leds[0::4] = bytes([self.LED_START]) * self.num_led
+        self._fill(leds, 0, data, bright_percent)
+        return bytes(leds)
+
+
+    def show_frame(self, leds):
+        """Shows LED frame bytes made by encode right away."""
+        self.leds[:] = leds
+        self.show()
+
+
+    def _fill(self, buf, offset, data, bright_percent):
+        """Writes a set_frame frame into buf, LED frames starting at offset."""
+        if hasattr(data, 'dtype'): # NumPy array
+            if data.dtype != 'uint8':
+                data = data.clip(0, 255).astype('uint8')
+            data = data.ravel()
+        elif not isinstance(data, (bytes, bytearray, memoryview)):
+            if not isinstance(data, (list, tuple)):
+                data = list(data)
+            try:
+                data = bytes(data) # Fast path: ints in 0..255
+            except (TypeError, ValueError): # Computed values, e.g. floats
+                data = bytes(max(0, min(255, int(v))) for v in data)
+        data = memoryview(data).cast('B')
+        count = min(len(data) // 4, self.num_led)
+        end = offset + 4 * count
+
+        ledstart = self._led_start.get(bright_percent)
+        if ledstart is None:
+            ledstart = self._start_byte(bright_percent)
+        starts = self._start_frames.get(ledstart)
+        if starts is None:
+            starts = self._start_frames[ledstart] = bytes([ledstart]) * self.num_led
+
+        buf[offset:end:4] = starts[:count]
+        buf[offset + self.rgb[0]:end:4] = data[1:4 * count:4]
+        buf[offset + self.rgb[1]:end:4] = data[2:4 * count:4]
+        buf[offset + self.rgb[2]:end:4] = data[3:4 * count:4]
+
+
     def rotate(self, positions=1):
         """ Rotate the LEDs by the specified number of positions.
 
@@ -190,19 +303,28 @@ class APA102:
         which means rotating in the opposite direction.
         """
         cutoff = 4 * (positions % self.num_led)
-        self.leds = self.leds[cutoff:] + self.leds[:cutoff]
+        self.leds[:] = self.leds[cutoff:].tobytes() + self.leds[:cutoff].tobytes()
 
 
-    def show(self):
+    def show(self, force=False):
         """Sends the content of the pixel buffer to the strip.
 
-        Todo: More than 1024 LEDs requires more than one xfer operation.
+        Start frame, LED frames and end frame go out as one SPI message.
+        writebytes2 only reads the buffer, so nothing is copied and there is
+        no limit on the number of LEDs.
+
+        A frame identical to the last one sent is not sent again, unless
+        `force` is set (e.g. after the strip lost power).
         """
-        self.clock_start_frame()
-        # xfer2 kills the list, unfortunately. So it must be copied first
-        # SPI takes up to 4096 Integers. So we are fine for up to 1024 LEDs.
-        self.spi.xfer2(list(self.leds))
-        self.clock_end_frame()
+        if not force and self._frame == self._last_frame:
+            self.frames_skipped += 1
+            return
+        self._write(self._frame)
+        if self._last_frame is None:
+            self._last_frame = bytearray(self._frame)
+        else:
+            self._last_frame[:] = self._frame # Same size, no allocation
+        self.frames_sent += 1
 
 
     def cleanup(self):
@@ -235,4 +357,4 @@ class APA102:
     def dump_array(self):
         """For debug purposes: Dump the LED array onto the console."""
 
-        print(self.leds)
+        print(list(self.leds))
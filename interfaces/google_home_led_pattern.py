@@ -15,96 +15,152 @@
 # limitations under the License.
 
 
-import numpy
-import time
-try:
-    import queue as Queue
-except ImportError:
-    import Queue as Queue
+from led_animation import FPS, GAMMA, compile_table, step_indices
 
 
-class GoogleHomeLedPattern(object):
-    def __init__(self, show=None):
-        self.basis = numpy.array([0] * 4 * 12)
-        self.basis[0 * 4 + 1] = 2
-        self.basis[3 * 4 + 1] = 1
-        self.basis[3 * 4 + 2] = 1
-        self.basis[6 * 4 + 2] = 2
-        self.basis[9 * 4 + 3] = 2
-
-        self.pixels = self.basis * 24
-
-        if not show or not callable(show):
-            def dummy(data):
-                pass
-            show = dummy
-
-        self.show = show
-        self.stop = False
-
-    def wakeup(self, direction=0):
-        position = int((direction + 15) / 30) % 12
-
-        basis = numpy.roll(self.basis, position * 4)
-        for i in range(1, 25):
-            pixels = basis * i
-            self.show(pixels)
-            time.sleep(0.005)
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("GoogleHomeLedPattern needs numpy (pip install numpy)")
+    return numpy
 
-        pixels =  numpy.roll(pixels, 4)
-        self.show(pixels)
-        time.sleep(0.1)
 
+class GoogleHomeLedPattern(object):
+    """
+    Google Home-style LED states compiled into FrameTables. The four
+    colored dots keep the position wakeup left them in, so tables are
+    compiled (once) per position.
+
+    Frames are computed in place into one preallocated uint8 buffer, one
+    row per step: rotations are slices of the dot pattern stored twice in
+    a row, and brightness is integer np.multiply/np.add with out=, so
+    compiling a table allocates nothing but the encoded frames. NumPy is
+    only imported when the pattern is created.
+    """
+
+    MAX_STEPS = 38 # Rows in the frame buffer; speak has the most steps
+
+    def __init__(self, number=12, encode=bytes, fps=FPS, gamma=GAMMA):
+        np = self.np = _numpy()
+        self.pixels_number = number
+        size = 4 * number
+        # Dot brightness in units of 24: two copies back to back, so that
+        # every rotation is a slice (see _basis)
+        self._ring = np.zeros(2 * size, dtype=np.uint8)
+        for led, channel, level in ((0, 1, 2), (3, 1, 1), (3, 2, 1), (6, 2, 2), (9, 3, 2)):
+            self._ring[led * 4 + channel] = level
+            self._ring[size + led * 4 + channel] = level
+        self._frames = np.zeros((max(self.MAX_STEPS, number), size), dtype=np.uint8)
+
+        self.encode = encode
+        self.fps = fps
+        self.gamma = gamma
+        self.position = 0
+        self._tables = {}
+
+    @property
+    def basis(self):
+        return self._basis(0)
+
+    def _basis(self, position):
+        """The dots moved on by `position` LEDs, as a view (numpy.roll without the copy)."""
+        size = 4 * self.pixels_number
+        shift = (4 * position) % size
+        return self._ring[size - shift:2 * size - shift]
+
+    def _table(self, name, position, loop=True):
+        table = self._tables.get((name, position))
+        if table is None:
+            steps = getattr(self, name + '_steps')(position)
+            # compile_table copies each row out, so the buffer is reused
+            table = compile_table(name, steps, self.encode, 48, self.gamma,
+                                  self.fps, loop)
+            outro = getattr(self, name + '_outro', None)
+            if outro is not None:
+                # One outro per step, compiled after the steps are encoded
+                # since they overwrite the same rows
+                by_step = [
+                    compile_table(name, outro(position, step), self.encode, 48,
+                                  self.gamma, self.fps, loop=False).frames
+                    for step in range(len(steps))
+                ]
+                table.outros = tuple(by_step[i] for i in
+                                     step_indices(steps, self.fps))
+            self._tables[name, position] = table
+        return table
+
+    def _scaled(self, row, position, level):
+        """Row `row` of the buffer: the dots at `position`, times `level`."""
+        out = self._frames[row]
+        self.np.multiply(self._basis(position), level, out=out)
+        return out
+
+    # Timelines of (frame, seconds); every frame is a row of self._frames
+
+    def wakeup_steps(self, position):
+        np = self.np
+        frames = [(self._scaled(i - 1, position, i), 0.005) for i in range(1, 25)]
+        frames.append((self._scaled(24, position + 1, 24), 0.1))
         for i in range(2):
-            new_pixels = numpy.roll(pixels, 4)
-            self.show(new_pixels * 0.5 + pixels)
-            pixels = new_pixels
-            time.sleep(0.1)
+            # Half of the next position on top of the current one:
+            # 12 * new + 24 * old = 12 * (new + old + old)
+            out = self._frames[25 + i]
+            old = self._basis(position + 1 + i)
+            np.add(self._basis(position + 2 + i), old, out=out)
+            np.add(out, old, out=out)
+            np.multiply(out, 12, out=out)
+            frames.append((out, 0.1))
+        frames.append((self._scaled(27, position + 3, 24), 1.0 / self.fps))
+        return frames
+
+    def listen_steps(self, position):
+        # Fade in: 24 * basis * i / 24
+        return [(self._scaled(i - 1, position, i), 0.01) for i in range(1, 25)]
+
+    def think_steps(self, position):
+        return [(self._scaled(i - 1, position + i, 24), 0.2)
+                for i in range(1, self.pixels_number + 1)]
+
+    def think_outro(self, position, step):
+        """When think is stopped on `step`: five more turns, fading out."""
+        current = position + step + 1
+        frames = []
+        seconds = 0.1
+        for i in range(5):
+            frame = self._scaled(i, current + 1 + i, 6 * (4 - i))
+            frames.append((frame, seconds))
+            seconds /= 2
+        return frames
+
+    def speak_steps(self, position):
+        frames = []
+        levels = list(range(5, 25)) + list(range(23, 5, -1))
+        for row, brightness in enumerate(levels):
+            seconds = 0.02
+            if brightness in (5, 24):
+                seconds += 0.4
+            frames.append((self._scaled(row, position, brightness), seconds))
+        return frames
+
+    def off_steps(self, position=None):
+        return [(self._scaled(0, 0, 0), 1.0 / self.fps)]
 
-        self.show(pixels)
-        self.pixels = pixels
+    def wakeup(self, direction=0):
+        position = int((direction + 15) / 30) % self.pixels_number
+        table = self._table('wakeup', position, loop=False)
+        # The dots end up three places on
+        self.position = (position + 3) % self.pixels_number
+        return table
 
     def listen(self):
-        pixels = self.pixels
-        for i in range(1, 25):
-            self.show(pixels * i / 24)
-            time.sleep(0.01)
+        return self._table('listen', self.position, loop=False)
 
     def think(self):
-        pixels = self.pixels
-
-        while not self.stop:
-            pixels = numpy.roll(pixels, 4)
-            self.show(pixels)
-            time.sleep(0.2)
-
-        t = 0.1
-        for i in range(0, 5):
-            pixels = numpy.roll(pixels, 4)
-            self.show(pixels * (4 - i) / 4)
-            time.sleep(t)
-            t /= 2
-
-        self.pixels = pixels
+        return self._table('think', self.position)
 
     def speak(self):
-        pixels = self.pixels
-        step = 1
-        brightness = 5
-        while not self.stop:
-            self.show(pixels * brightness / 24)
-            time.sleep(0.02)
-
-            if brightness <= 5:
-                step = 1
-                time.sleep(0.4)
-            elif brightness >= 24:
-                step = -1
-                time.sleep(0.4)
-
-            brightness += step
+        return self._table('speak', self.position)
 
     def off(self):
-        self.show([0] * 4 * 12)
-
-
+        return self._table('off', None, loop=False)
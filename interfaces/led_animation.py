@@ -0,0 +1,273 @@
+"""
+Frame-table LED animation.
+
+A pattern is described once as a timeline of (frame, seconds) steps, where a
+frame has 4 values per LED, [unused, red, green, blue], like the frames
+Pixels.show takes. compile_table samples the timeline at the frame rate,
+runs every distinct frame through a gamma lookup table and the strip's
+encoder, and keeps the results in a FrameTable: a tuple of ready-to-send
+byte strings that a looping table simply cycles through.
+
+One FrameClock thread plays the current table. Ticks are scheduled on
+absolute deadlines, so a late frame does not push every later frame back,
+and showing a frame only copies bytes that already exist. A new table
+preempts the current one immediately, after the current table's outro for
+the frame it was on (e.g. a fade-out), if it has one. The clock keeps how late each tick
+was (jitter), the CPU time it used and how long state changes took.
+"""
+
+import threading
+import time
+from array import array
+
+FPS = 50
+GAMMA = 2.2
+JITTER_SAMPLES = 1024
+
+_gamma_tables = {}
+
+
+def gamma_table(peak, gamma=GAMMA):
+    """Lookup table (256 bytes) that gamma-corrects channel values 0..peak.
+
+    Values are taken as a fraction of the pattern's `peak`, so 0 and peak
+    are unchanged and a linear fade between them looks linear to the eye.
+    Values above peak pass through as they are.
+    """
+    key = (peak, gamma)
+    table = _gamma_tables.get(key)
+    if table is None:
+        table = bytes(
+            int(round(peak * (v / float(peak)) ** gamma)) if v <= peak else v
+            for v in range(256)
+        )
+        _gamma_tables[key] = table
+    return table
+
+
+def sample(steps, fps=FPS):
+    """The frame showing at each tick of a timeline of (frame, seconds) steps.
+
+    Steps shorter than a tick may be skipped and longer ones repeat; the
+    same frame object is repeated, not copied.
+    """
+    total = sum(seconds for _, seconds in steps)
+    count = max(1, int(round(total * fps)))
+    frames = []
+    index = 0
+    ends = steps[0][1]
+    for tick in range(count):
+        t = float(tick) / fps
+        while t >= ends and index < len(steps) - 1:
+            index += 1
+            ends += steps[index][1]
+        frames.append(steps[index][0])
+    return frames
+
+
+def step_indices(steps, fps=FPS):
+    """For each frame `sample` would return, the index of its step."""
+    return sample([(i, seconds) for i, (_, seconds) in enumerate(steps)], fps)
+
+
+class FrameTable(object):
+    """Encoded frames of one pattern, played in order.
+
+    A looping table starts over after its last frame (at `loop_from`); any
+    other table stops on its last frame, which the strip keeps showing.
+    `outros`, if set, holds per frame the encoded frames to play when
+    another table preempts this one on that frame.
+    """
+
+    def __init__(self, name, frames, loop=True, outros=None, loop_from=0):
+        self.name = name
+        self.frames = tuple(frames)
+        self.loop = loop
+        self.outros = outros
+        self.loop_from = loop_from
+
+    def __len__(self):
+        return len(self.frames)
+
+    def outro(self, index):
+        """Frames to finish with when preempted while showing frame `index`."""
+        if not self.outros:
+            return ()
+        return self.outros[index % len(self.outros)]
+
+    def after(self, outro):
+        """This table with `outro` (another table's frames) played first."""
+        return FrameTable(self.name, tuple(outro) + self.frames, self.loop,
+                          loop_from=len(outro) + self.loop_from)
+
+
+def compile_table(name, steps, encode=bytes, peak=255, gamma=GAMMA, fps=FPS,
+                  loop=True):
+    """Sample a (frame, seconds) timeline at `fps` into a FrameTable.
+
+    Every distinct frame is converted to bytes, gamma-corrected relative to
+    `peak` and passed through `encode` (APA102.encode for a real strip)
+    once, however often it repeats.
+    """
+    lut = gamma_table(peak, gamma)
+    encoded = {}
+    frames = []
+    for frame in sample(steps, fps):
+        key = id(frame)
+        if key not in encoded:
+            encoded[key] = encode(bytes(frame).translate(lut))
+        frames.append(encoded[key])
+    return FrameTable(name, frames, loop)
+
+
+class FrameClock(object):
+    """
+    Plays FrameTables at a fixed rate on one thread, calling show(frame)
+    with the encoded frames.
+
+    play() only stores the table and notifies the thread, which waits on a
+    condition variable between ticks: the new table's first frame goes out
+    at once, not on the next tick, and of several tables picked before the
+    thread got to them only the last is played. The time from play() to the
+    end of that first show() is kept as the switch latency. on_switch(table),
+    if given, is called on the clock thread just before that first frame.
+    """
+
+    def __init__(self, show, fps=FPS, on_switch=None):
+        self.show = show
+        self.on_switch = on_switch
+        self.fps = fps
+        self.period = 1.0 / fps
+        self._table = None
+        self._pending = None
+        self._requested = None
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self._frames = 0
+        self._overruns = 0
+        self._cpu = 0.0
+        self._switches = 0
+        self._superseded = 0
+        self._lateness = array('d', [0.0]) * JITTER_SAMPLES # Seconds, ring buffer
+        self._latency = array('d', [0.0]) * JITTER_SAMPLES
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='led-clock')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=1):
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def play(self, table):
+        """Switch to `table`, from its first frame, right away."""
+        with self._cond:
+            if self._pending is not None:
+                self._superseded += 1 # Never shown; a newer state won
+            self._pending = table
+            self._requested = time.perf_counter()
+            self._cond.notify()
+
+    @property
+    def playing(self):
+        table = self._table
+        return table.name if table is not None else None
+
+    def _next(self, index, deadline):
+        """
+        Wait for the next tick or a new table. Returns (index, deadline,
+        requested) for the frame to show, or None to stop.
+        """
+        with self._cond:
+            while not self._stopping:
+                if self._pending is not None:
+                    table, self._pending = self._pending, None
+                    if self._table is not None and index:
+                        # Finish the old state first, from the frame it is on
+                        outro = self._table.outro(index - 1)
+                        if outro:
+                            table = table.after(outro)
+                    self._table = table
+                    self._switches += 1
+                    return 0, time.perf_counter(), self._requested
+                table = self._table
+                if table is None or index >= len(table.frames):
+                    self._cond.wait() # Nothing left to show
+                    continue
+                delay = deadline - time.perf_counter()
+                if delay <= 0:
+                    return index, deadline, None
+                self._cond.wait(delay)
+        return None
+
+    def _run(self):
+        index = 0
+        deadline = time.perf_counter()
+        while True:
+            tick = self._next(index, deadline)
+            if tick is None:
+                return
+            index, deadline, requested = tick
+            table = self._table
+            if requested is not None and self.on_switch is not None:
+                self.on_switch(table)
+
+            started = time.perf_counter()
+            cpu = time.thread_time()
+            self.show(table.frames[index])
+            self._cpu += time.thread_time() - cpu
+            shown = time.perf_counter()
+            if requested is not None:
+                self._latency[(self._switches - 1) % JITTER_SAMPLES] = shown - requested
+            self._lateness[self._frames % JITTER_SAMPLES] = started - deadline
+            self._frames += 1
+            index += 1
+            if table.loop and index == len(table.frames):
+                index = table.loop_from
+
+            deadline += self.period
+            if deadline < shown:
+                # Overran a whole tick; start a new schedule instead of
+                # rushing out the frames that are already late
+                self._overruns += 1
+                deadline = shown
+
+    def stats(self):
+        frames = self._frames
+        switches = self._switches
+
+        def ms(seconds):
+            return round(seconds * 1000, 3)
+
+        def summary(ring, count):
+            samples = sorted(ring[:min(count, JITTER_SAMPLES)])
+            if not samples:
+                return None
+            return {
+                'mean_ms': ms(sum(samples) / len(samples)),
+                'p99_ms': ms(samples[int(0.99 * (len(samples) - 1))]),
+                'max_ms': ms(samples[-1]),
+            }
+
+        return {
+            'fps': self.fps,
+            'period_ms': ms(self.period),
+            'playing': self.playing,
+            'frames': frames,
+            'overruns': self._overruns,
+            'jitter': summary(self._lateness, frames),
+            'cpu_ms_per_frame': ms(self._cpu / frames) if frames else None,
+            'switches': switches,
+            'superseded': self._superseded,
+            'switch_latency': summary(self._latency, switches),
+        }
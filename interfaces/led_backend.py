@@ -0,0 +1,187 @@
+"""
+Where the LED frames go.
+
+Pixels takes its SPI device and power pin from a backend:
+
+  * HardwareBackend opens /dev/spidev0.1 with spidev and drives the power
+    pin with gpiozero, as on the ReSpeaker HAT.
+  * SimulatedBackend needs neither: the SPI device and pin only record
+    what they are sent, so the LED code runs on any Linux machine.
+
+Either can record to a FrameLog: every SPI write with a timestamp and the
+CPU time of the thread writing it, plus a marker whenever Pixels' frame
+clock switches state. benchmarks/led_report.py turns a log into FPS,
+jitter and CPU per state.
+
+Log format: the magic line, then records of a little-endian header (kind,
+wall-clock time, thread CPU time, payload length) and the payload: the
+bytes sent for a frame, the state name for a marker, one byte for power,
+nothing for the end record written when the log is closed.
+"""
+
+import atexit
+import os
+import struct
+import threading
+import time
+
+MAGIC = b'LEDLOG1\n'
+HEADER = struct.Struct('<BddI')
+FRAME, MARK, POWER, END = 1, 2, 3, 4
+
+
+class FrameLog(object):
+    """Append-only binary log of LED frames and state changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        atexit.register(self.close)
+
+    def _record(self, kind, payload):
+        header = HEADER.pack(kind, time.time(), time.thread_time(), len(payload))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(header)
+                self._file.write(payload)
+
+    def frame(self, data):
+        self._record(FRAME, data)
+
+    def mark(self, name):
+        self._record(MARK, str(name).encode('utf-8'))
+
+    def power(self, on):
+        self._record(POWER, b'\x01' if on else b'\x00')
+
+    def close(self):
+        self._record(END, b'')
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_log(path):
+    """Yield (kind, time, thread_cpu, payload) for every record in a log."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not an LED frame log' % path)
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return # End, or a record cut short by a crash
+            kind, t, cpu, length = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield kind, t, cpu, payload
+
+
+class RecordingSpi(object):
+    """
+    SpiDev stand-in that logs every write and passes it on to `spi`, or
+    drops it when there is no real device.
+    """
+
+    def __init__(self, spi=None, log=None):
+        self._spi = spi
+        self.log = log
+        self.frames = 0
+        self.bytes_sent = 0
+
+    def writebytes2(self, data):
+        self.frames += 1
+        self.bytes_sent += len(data)
+        if self.log is not None:
+            self.log.frame(data)
+        if self._spi is not None:
+            self._spi.writebytes2(data)
+
+    def close(self):
+        if self._spi is not None:
+            self._spi.close()
+
+
+class SimulatedPin(object):
+    """gpiozero LED stand-in."""
+
+    def __init__(self, log=None):
+        self.log = log
+        self.is_lit = False
+
+    def on(self):
+        self.is_lit = True
+        if self.log is not None:
+            self.log.power(True)
+
+    def off(self):
+        self.is_lit = False
+        if self.log is not None:
+            self.log.power(False)
+
+
+class HardwareBackend(object):
+    """The ReSpeaker HAT's APA102 strip and LED power pin."""
+
+    def __init__(self, log_path=None, bus=0, device=1, max_speed_hz=8000000):
+        self.log = FrameLog(log_path) if log_path else None
+        self.bus = bus
+        self.device = device
+        self.max_speed_hz = max_speed_hz
+
+    def spi(self):
+        import spidev
+
+        spi = spidev.SpiDev()
+        spi.open(self.bus, self.device)
+        spi.max_speed_hz = self.max_speed_hz
+        if self.log is None:
+            return spi
+        return RecordingSpi(spi, self.log)
+
+    def power(self, pin):
+        from gpiozero import LED
+
+        return LED(pin)
+
+    def mark(self, name):
+        if self.log is not None:
+            self.log.mark(name)
+
+
+class SimulatedBackend(object):
+    """
+    No hardware. Frames are counted and, with `log_path`, recorded; with
+    `echo`, every state change is printed.
+    """
+
+    def __init__(self, log_path=None, echo=False):
+        self.log = FrameLog(log_path) if log_path else None
+        self.echo = echo
+
+    def spi(self):
+        return RecordingSpi(None, self.log)
+
+    def power(self, pin):
+        return SimulatedPin(self.log)
+
+    def mark(self, name):
+        if self.echo:
+            print('[LED: %s]' % str(name).upper())
+        if self.log is not None:
+            self.log.mark(name)
+
+
+def default_backend():
+    """
+    HardwareBackend, unless LED_BACKEND=sim. LED_LOG=<path> records the
+    frames with either.
+    """
+    log_path = os.environ.get('LED_LOG') or None
+    if os.environ.get('LED_BACKEND', 'hardware') == 'sim':
+        return SimulatedBackend(log_path)
+    return HardwareBackend(log_path)
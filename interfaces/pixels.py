@@ -1,14 +1,10 @@
 
 import apa102
 import time
-import threading
-from gpiozero import LED
-try:
-    import queue as Queue
-except ImportError:
-    import Queue as Queue
 
+import led_backend
 from alexa_led_pattern import AlexaLedPattern
+from led_animation import FPS, FrameClock, FrameTable
 
 #install numpy to use GoogleHomeLedPattern
 #from google_home_led_pattern import GoogleHomeLedPattern
@@ -16,66 +12,76 @@ from alexa_led_pattern import AlexaLedPattern
 class Pixels:
     PIXELS_N = 12
 
-    def __init__(self, pattern=AlexaLedPattern):
-        self.pattern = pattern(show=self.show)
+    def __init__(self, pattern=AlexaLedPattern, fps=FPS, backend=None):
+        # The HAT's SPI strip and power pin, or a simulator (see led_backend)
+        self.backend = backend or led_backend.default_backend()
+        self.dev = apa102.APA102(num_led=self.PIXELS_N, spi=self.backend.spi())
+        self.pattern = pattern(number=self.PIXELS_N, encode=self.dev.encode, fps=fps)
 
-        self.dev = apa102.APA102(num_led=self.PIXELS_N)
-        
-        self.power = LED(5)
+        self.power = self.backend.power(5)
         self.power.on()
 
-        self.queue = Queue.Queue()
-        self.thread = threading.Thread(target=self._run)
-        self.thread.daemon = True
-        self.thread.start()
+        # One thread plays whichever frame table was picked last
+        self.clock = FrameClock(
+            self.dev.show_frame, fps, on_switch=self._switched
+        ).start()
 
         self.last_direction = None
 
     def wakeup(self, direction=0):
         self.last_direction = direction
-        def f():
-            self.pattern.wakeup(direction)
-
-        self.put(f)
+        self.play(self.pattern.wakeup(direction))
 
     def listen(self):
         if self.last_direction:
-            def f():
-                self.pattern.wakeup(self.last_direction)
-            self.put(f)
+            self.play(self.pattern.wakeup(self.last_direction))
         else:
-            self.put(self.pattern.listen)
+            self.play(self.pattern.listen())
 
     def think(self):
-        self.put(self.pattern.think)
+        self.play(self.pattern.think())
 
     def speak(self):
-        self.put(self.pattern.speak)
+        self.play(self.pattern.speak())
 
     def off(self):
-        self.put(self.pattern.off)
+        self.play(self.pattern.off())
 
-    def put(self, func):
-        self.pattern.stop = True
-        self.queue.put(func)
+    def play(self, table):
+        self.clock.play(table)
 
-    def _run(self):
-        while True:
-            func = self.queue.get()
-            self.pattern.stop = False
-            func()
+    def _switched(self, table):
+        # On the clock thread, so the mark lands between the right frames
+        self.backend.mark(table.name)
 
     def show(self, data):
-        for i in range(self.PIXELS_N):
-            self.dev.set_pixel(i, int(data[4*i + 1]), int(data[4*i + 2]), int(data[4*i + 3]))
-
-        self.dev.show()
-
-
-pixels = Pixels()
+        """Show one frame ([unused, r, g, b] per LED) until the next state."""
+        self.play(FrameTable('show', [self.dev.encode(data)], loop=False))
+
+    def stats(self):
+        """
+        Frames sent to the strip and unchanged frames that were skipped,
+        and the frame clock's jitter and CPU time per frame.
+        """
+        return {
+            'frames_sent': self.dev.frames_sent,
+            'frames_skipped': self.dev.frames_skipped,
+            'clock': self.clock.stats(),
+        }
+
+
+def __getattr__(name):
+    # `from pixels import pixels` creates the shared instance on first use,
+    # so importing this module touches no hardware
+    global pixels
+    if name == 'pixels':
+        pixels = Pixels()
+        return pixels
+    raise AttributeError(name)
 
 
 if __name__ == '__main__':
+    pixels = Pixels()
     while True:
 
         try:
@@ -0,0 +1,116 @@
+"""
+Process I/O accounting from /proc/self/io.
+
+`write_bytes` is what the kernel sent (or will send) to a block device, so
+it is the number that wears an SD card out; writes to tmpfs only show up in
+`wchar`. IOAccounting takes snapshots around each reminder turn and keeps
+per-day totals. The counters are per process, so a turn that overlaps other
+work (another device's session, a dashboard write) is charged for it too.
+
+Where /proc/self/io does not exist (macOS, some containers) every figure is
+None.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from datetime import date
+
+PROC_IO = "/proc/self/io"
+FIELDS = (
+    "rchar",
+    "wchar",
+    "syscw",
+    "read_bytes",
+    "write_bytes",
+    "cancelled_write_bytes",
+)
+TURN_SAMPLES = 512
+
+
+def read_proc_io(path=PROC_IO):
+    """The counters in /proc/self/io as a dict, or None if unavailable."""
+    try:
+        with open(path) as f:
+            pairs = (line.split(":", 1) for line in f if ":" in line)
+            return {key.strip(): int(value) for key, value in pairs}
+    except (OSError, ValueError):
+        return None
+
+
+def _delta(after, before):
+    if after is None or before is None:
+        return None
+    delta = {key: after.get(key, 0) - before.get(key, 0) for key in FIELDS}
+    # Dirty pages dropped before writeback (e.g. a file deleted quickly)
+    delta["storage_bytes"] = delta["write_bytes"] - delta["cancelled_write_bytes"]
+    return delta
+
+
+class IOAccounting:
+    def __init__(self, days=14, reader=read_proc_io, today=date.today):
+        self._read = reader
+        self._today = today
+        self._lock = threading.Lock()
+        self._day = today()
+        self._day_start = reader()
+        self._days = OrderedDict()  # date -> {"io": delta, "turns": n}
+        self._keep_days = days
+        self._turns = deque(maxlen=TURN_SAMPLES)
+        self._day_turns = 0
+
+    def _roll(self, snapshot):
+        # Called with the lock held; closes the previous day on a date change
+        today = self._today()
+        if today != self._day:
+            self._days[self._day.isoformat()] = {
+                "io": _delta(snapshot, self._day_start),
+                "turns": self._day_turns,
+            }
+            while len(self._days) > self._keep_days:
+                self._days.popitem(last=False)
+            self._day = today
+            self._day_start = snapshot
+            self._day_turns = 0
+
+    def begin_turn(self):
+        """Snapshot to hand back to end_turn."""
+        return self._read()
+
+    def end_turn(self, started, label=None):
+        """Record one reminder turn. Returns its I/O delta (or None)."""
+        snapshot = self._read()
+        delta = _delta(snapshot, started)
+        with self._lock:
+            self._roll(snapshot)
+            self._day_turns += 1
+            self._turns.append((label, delta))
+        return delta
+
+    def report(self):
+        snapshot = self._read()
+        with self._lock:
+            self._roll(snapshot)
+            turns = [d for _, d in self._turns if d is not None]
+            days = dict(self._days)
+            days[self._day.isoformat()] = {
+                "io": _delta(snapshot, self._day_start),
+                "turns": self._day_turns,
+            }
+            last_label, last = self._turns[-1] if self._turns else (None, None)
+
+        def mean(key):
+            if not turns:
+                return None
+            return round(sum(d[key] for d in turns) / len(turns))
+
+        return {
+            "available": snapshot is not None,
+            "per_turn": {
+                "turns": len(turns),
+                "mean_storage_bytes": mean("storage_bytes"),
+                "mean_wchar": mean("wchar"),
+                "mean_syscw": mean("syscw"),
+                "last": {"label": last_label, "io": last},
+            },
+            "per_day": days,
+        }
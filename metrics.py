@@ -0,0 +1,232 @@
+"""
+Counters and latency histograms in the Prometheus text format.
+
+A Registry holds Counters, Histograms and Gauges (read from a callback when
+scraped) and renders them all for GET /metrics. Metrics can carry labels,
+e.g. the pipeline stage, and every label combination is its own series, so
+label values should come from a small fixed set.
+
+    stage_seconds = registry.histogram(
+        "stage_seconds", "Time per stage.", labels=("stage",)
+    )
+    with stage_seconds.time(stage="stt"):
+        ...
+
+ResponseTimer measures what the patient actually waits for: from the end of
+their speech to the first audio of the assistant's reply.
+"""
+
+import bisect
+import functools
+import math
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return "+Inf" if value == math.inf else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> value(s)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"{self.name} takes labels {self.labels}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for values, value in series:
+            lines.extend(self._samples(values, value))
+        return lines
+
+    def _samples(self, values, value):
+        labels = _format_labels(self.labels, values)
+        return [f"{self.name}{labels} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    """Counts of observations per bucket upper bound, with their sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        """Context manager (or decorator) observing the seconds it took."""
+        return _Timer(self, labels)
+
+    def _samples(self, values, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), series):
+            cumulative += count
+            labels = _format_labels(
+                self.labels, values, 'le="' + _format_value(bound) + '"'
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, values)
+        lines.append(f"{self.name}_sum{labels} {series[-1]}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+        return False
+
+    def __call__(self, func):
+        # Each call gets its own timer, so decorated functions stay reentrant
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._histogram, self._labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+class Gauge(_Metric):
+    """A value read from `read()` at scrape time; None leaves it out."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        super().__init__(name, help)
+        self._read = read
+
+    def render(self):
+        value = self._read()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read):
+        return self._add(Gauge(name, help, read))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class ResponseTimer:
+    """
+    Patient stopped speaking -> assistant starts speaking, for one speaker.
+
+    heard() marks the end of the patient's speech and speaking() the first
+    audio of the reply, which observes the gap once; cancel() drops a turn
+    that gets no reply (nothing was understood). `over`, a threading.Event
+    passed to heard(), is set once the conversation the turn belongs to has
+    ended (e.g. the session's cancel event): a mark left by a turn that got
+    no reply before then is dropped, not counted against the next
+    conversation's greeting.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._lock = threading.Lock()
+        self._heard = None
+        self._over = None
+
+    def heard(self, at=None, over=None):
+        with self._lock:
+            self._heard = time.perf_counter() if at is None else at
+            self._over = over
+
+    def cancel(self):
+        with self._lock:
+            self._heard = None
+            self._over = None
+
+    def speaking(self):
+        """Returns the latency observed, or None if no turn was waiting."""
+        with self._lock:
+            heard, self._heard = self._heard, None
+            over, self._over = self._over, None
+        if heard is None or (over is not None and over.is_set()):
+            return None
+        latency = time.perf_counter() - heard
+        self.histogram.observe(latency)
+        return latency
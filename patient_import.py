@@ -0,0 +1,288 @@
+"""
+Bulk patient import from CSV or JSON.
+
+Rows need `name`, `medicine` and `time_due` (HH:MM), one row per dose: a
+row whose name (ignoring case) is already a patient, in the database or
+earlier in the file, adds a dose to that patient, so several medications at
+several times a day are several rows. A dose the patient already has (same
+medicine and time) is reported instead of repeated, so importing the same
+file twice is harmless.
+
+Valid rows are inserted with executemany, together with each dose's
+schedule, today's PENDING dose log, the adherence rollups and the
+change_log entries, so importing thousands of patients takes a few short
+transactions instead of one commit per patient. Invalid rows are reported
+and skipped.
+
+The app imports through its database writer thread, IMPORT_CHUNK patients
+per job (import_chunked), so status writes queued meanwhile are committed
+between chunks instead of waiting on one long write lock. The command line
+imports everything in one transaction.
+
+    python patient_import.py patients.csv --db medication_manager.db
+
+Patients imported from the command line get their reminders the next time
+app.py starts; importing through POST /api/patients/import schedules them
+right away.
+"""
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+from datetime import datetime
+
+import adherence
+import change_log
+import patient_search
+import schedules
+
+FIELDS = ("name", "medicine", "time_due")
+MAX_NAME_LENGTH = 100
+IMPORT_CHUNK = 500
+IMPORT_NOTE = "Imported"
+
+
+def parse(data, fmt):
+    """Rows (dicts) from CSV or JSON text. JSON may be a list or {"patients": [...]}."""
+    if fmt == "json":
+        rows = json.loads(data)
+        if isinstance(rows, dict):
+            rows = rows.get("patients", [])
+        if not isinstance(rows, list):
+            raise ValueError("JSON import must be a list of patients")
+        return rows
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(data)))
+    raise ValueError(f"Unknown import format: {fmt}")
+
+
+def _normalize_time(value):
+    return datetime.strptime(value, "%H:%M").strftime("%H:%M")
+
+
+def validate(rows):
+    """
+    Split rows into (doses, errors). Doses are (row, name, medicine,
+    time_due) tuples; errors are {"row": n, "error": message}. Rows are
+    numbered from 1.
+    """
+    doses = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": number, "error": "Not an object"})
+            continue
+        values = {f: str(row.get(f) or "").strip() for f in FIELDS}
+        missing = [f for f in FIELDS if not values[f]]
+        if missing:
+            errors.append({"row": number, "error": f"Missing {', '.join(missing)}"})
+            continue
+        if len(values["name"]) > MAX_NAME_LENGTH:
+            errors.append({"row": number, "error": "Name too long"})
+            continue
+        try:
+            values["time_due"] = _normalize_time(values["time_due"])
+        except ValueError:
+            errors.append({"row": number, "error": "time_due must be HH:MM"})
+            continue
+        doses.append(
+            (number, values["name"], values["medicine"], values["time_due"])
+        )
+    return doses, errors
+
+
+def _next_id(c, table):
+    # Never reuse ids of deleted rows, like AUTOINCREMENT itself
+    row = c.execute(
+        f"""SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+            COALESCE((SELECT MAX(id) FROM {table}), 0))""",
+        (table,),
+    ).fetchone()
+    return row[0] + 1
+
+
+def _existing(c, names):
+    """
+    ({casefolded name: (patient id, stored name)}, {(patient id, medicine,
+    time_due)}) for the patients among `names` that already exist and their
+    active doses.
+    """
+    known = {}
+    for name in names:
+        row = c.execute(
+            "SELECT id, name FROM patients WHERE name = ? COLLATE NOCASE ORDER BY id LIMIT 1",
+            (name,),
+        ).fetchone()
+        if row is not None:
+            known[name.casefold()] = (row[0], row[1])
+    doses = set()
+    for pid in {pid for pid, _ in known.values()}:
+        for medicine, time_due in c.execute(
+            "SELECT medicine, time_due FROM schedules WHERE patient_id = ? AND active = 1",
+            (pid,),
+        ):
+            doses.add((pid, (medicine or "").casefold(), time_due))
+    return known, doses
+
+
+def insert_patients(c, valid, today):
+    """
+    Insert validated (row, name, medicine, time_due) doses, creating the
+    patients that do not exist yet. Does not commit (usable as a DBWriter
+    job). Returns (doses, errors): one dict per dose added, with the
+    patient's and the new schedule's ids, and the rows refused because the
+    patient already has that dose.
+    """
+    known, existing_doses = _existing(c, {name for _, name, _, _ in valid})
+    # Ids are assigned here so that every table can be filled with executemany
+    first_id = _next_id(c, "patients")
+    first_schedule_id = _next_id(c, "schedules")
+    new_patients = []  # (id, name, medicine, time_due)
+    doses = []  # (schedule id, patient id, name, medicine, time_due)
+    errors = []
+    for number, name, medicine, time_due in valid:
+        key = name.casefold()
+        if key not in known:
+            known[key] = (first_id + len(new_patients), name)
+            new_patients.append((known[key][0], name, medicine, time_due))
+        pid, name = known[key]
+        dose = (pid, medicine.casefold(), time_due)
+        if dose in existing_doses:
+            errors.append({"row": number, "error": "Duplicate dose"})
+            continue
+        existing_doses.add(dose)
+        doses.append((first_schedule_id + len(doses), pid, name, medicine, time_due))
+
+    c.executemany(
+        "INSERT INTO patients (id, name, medicine, time_due) VALUES (?, ?, ?, ?)",
+        new_patients,
+    )
+    c.executemany(
+        "INSERT INTO schedules (id, patient_id, medicine, time_due, due_minute) VALUES (?, ?, ?, ?, ?)",
+        [
+            (sid, pid, medicine, time_due, schedules.due_minute(time_due))
+            for sid, pid, _, medicine, time_due in doses
+        ],
+    )
+    c.executemany(
+        "INSERT OR IGNORE INTO medication_logs (patient_id, schedule_id, date, status, notes) VALUES (?, ?, ?, 'PENDING', ?)",
+        [(pid, sid, today, IMPORT_NOTE) for sid, pid, _, _, _ in doses],
+    )
+    adherence.add_pending(c, [pid for _, pid, _, _, _ in doses], today)
+    patient_search.index_names(c, [(pid, name) for pid, name, _, _ in new_patients])
+    created = {pid for pid, _, _, _ in new_patients}
+    change_log.record_changes(
+        c,
+        [
+            (
+                "patient",
+                pid,
+                "insert",
+                {"name": name, "medicine": medicine, "time_due": time_due},
+            )
+            for pid, name, medicine, time_due in new_patients
+        ]
+        + [
+            (
+                "schedule",
+                sid,
+                "insert",
+                {"patient_id": pid, "medicine": medicine, "time_due": time_due},
+            )
+            for sid, pid, _, medicine, time_due in doses
+            if pid not in created
+        ],
+    )
+    return [
+        {
+            "id": pid,
+            "schedule_id": sid,
+            "name": name,
+            "medicine": medicine,
+            "time_due": time_due,
+        }
+        for sid, pid, name, medicine, time_due in doses
+    ], errors
+
+
+def _today(today):
+    return today or datetime.now().strftime("%Y-%m-%d")
+
+
+def import_patients(conn, rows, today=None):
+    """
+    Validate and insert `rows` in one transaction. Returns (doses, errors),
+    where doses are dicts with the patient's and the new schedule's ids.
+    """
+    valid, errors = validate(rows)
+    if not valid:
+        return [], errors
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        doses, refused = insert_patients(conn, valid, _today(today))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return doses, sorted(errors + refused, key=lambda e: e["row"])
+
+
+def import_chunked(write, rows, today=None, chunk_size=IMPORT_CHUNK):
+    """
+    Like import_patients, but inserts `chunk_size` rows per
+    `write(insert_patients, chunk, today)` call (DBWriter.write), each its
+    own transaction. If a chunk fails, the doses committed before it are
+    kept and the rest are reported as one error.
+    """
+    valid, errors = validate(rows)
+    today = _today(today)
+    doses = []
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start : start + chunk_size]
+        try:
+            added, refused = write(insert_patients, chunk, today)
+        except Exception as e:
+            errors.append(
+                {"row": chunk[0][0], "error": f"Import stopped at this row: {e}"}
+            )
+            break
+        doses.extend(added)
+        errors.extend(refused)
+    errors.sort(key=lambda e: e["row"])
+    return doses, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import patients")
+    parser.add_argument("file", help="CSV or JSON file")
+    parser.add_argument("--db", default="medication_manager.db")
+    parser.add_argument(
+        "--format", choices=["csv", "json"], help="Defaults to the file extension"
+    )
+    args = parser.parse_args()
+
+    fmt = args.format or ("json" if args.file.lower().endswith(".json") else "csv")
+    with open(args.file, newline="") as f:
+        rows = parse(f.read(), fmt)
+
+    conn = sqlite3.connect(args.db)
+    started = datetime.now()
+    doses, errors = import_patients(conn, rows)
+    elapsed = (datetime.now() - started).total_seconds()
+    conn.close()
+
+    for error in errors:
+        print(f"Row {error['row']}: {error['error']}")
+    patients = len({d["id"] for d in doses})
+    print(
+        f"Imported {len(doses)} doses for {patients} patients in {elapsed:.2f}s, "
+        f"{len(errors)} rejected."
+    )
+
+
+if __name__ == "__main__":
+    main()
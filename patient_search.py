@@ -0,0 +1,254 @@
+"""
+Indexed patient name resolution.
+
+Logging is id-first: the pillbox and reminder sessions already know the
+patient id. Names only need resolving when all we have is what someone said
+or typed, and that goes through three indexes, cheapest first:
+
+  1. case-insensitive exact match on patients.name;
+  2. an FTS5 trigram index for substring matches (LIKE scans on SQLite
+     builds without the trigram tokenizer);
+  3. per-token Soundex codes in `patient_name_tokens`, for names the speech
+     recognizer spelled differently ("Hammad" for "Hamad").
+
+Candidates are scored per query token (exact > prefix > phonetic >
+substring) and `resolve` only returns a patient when the best score is
+clearly ahead of the next one.
+"""
+
+import re
+import sqlite3
+from functools import lru_cache
+
+EXACT, PREFIX, PHONETIC, SUBSTRING = 1.0, 0.8, 0.6, 0.5
+MIN_SCORE = 0.5
+AMBIGUITY_MARGIN = 0.05
+CANDIDATES = 20
+
+_TOKEN = re.compile(r"[^\W_]+")
+_SOUNDEX = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+
+def tokens(text):
+    return _TOKEN.findall((text or "").casefold())
+
+
+@lru_cache(maxsize=65536)
+def soundex(token):
+    """American Soundex of an alphabetic token, or None."""
+    letters = [ch for ch in token.casefold() if "a" <= ch <= "z"]
+    if not letters:
+        return None
+    code = letters[0].upper()
+    previous = _SOUNDEX.get(letters[0])
+    for ch in letters[1:]:
+        digit = _SOUNDEX.get(ch)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def _has_fts(c):
+    return (
+        c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_names'"
+        ).fetchone()
+        is not None
+    )
+
+
+def create_index(c):
+    """Create the name indexes and fill them for existing patients."""
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_patients_name_nocase ON patients (name COLLATE NOCASE)"
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS patient_name_tokens (
+            token TEXT NOT NULL,
+            code TEXT,
+            patient_id INTEGER NOT NULL,
+            PRIMARY KEY (token, patient_id)
+        ) WITHOUT ROWID
+    """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_patient_name_tokens_code ON patient_name_tokens (code, patient_id)"
+    )
+
+    if not _has_fts(c):
+        try:
+            c.execute(
+                """CREATE VIRTUAL TABLE patient_names USING fts5(
+                    name, content='patients', content_rowid='id', tokenize='trigram')"""
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Trigram name index unavailable ({e}); using LIKE.")
+        else:
+            c.execute("INSERT INTO patient_names (patient_names) VALUES ('rebuild')")
+            # The trigram index follows patients by itself
+            c.execute(
+                """CREATE TRIGGER IF NOT EXISTS patients_names_ai AFTER INSERT ON patients BEGIN
+                    INSERT INTO patient_names (rowid, name) VALUES (new.id, new.name);
+                END"""
+            )
+            c.execute(
+                """CREATE TRIGGER IF NOT EXISTS patients_names_ad AFTER DELETE ON patients BEGIN
+                    INSERT INTO patient_names (patient_names, rowid, name) VALUES ('delete', old.id, old.name);
+                END"""
+            )
+            c.execute(
+                """CREATE TRIGGER IF NOT EXISTS patients_names_au AFTER UPDATE OF name ON patients BEGIN
+                    INSERT INTO patient_names (patient_names, rowid, name) VALUES ('delete', old.id, old.name);
+                    INSERT INTO patient_names (rowid, name) VALUES (new.id, new.name);
+                END"""
+            )
+
+    missing = c.execute(
+        "SELECT id, name FROM patients WHERE id NOT IN (SELECT patient_id FROM patient_name_tokens)"
+    ).fetchall()
+    index_names(c, missing)
+
+
+def index_names(c, patients):
+    """
+    Add the name tokens and their Soundex codes for (patient_id, name)
+    pairs. Called wherever patients are inserted, in the same transaction.
+    Does not commit.
+    """
+    c.executemany(
+        "INSERT OR IGNORE INTO patient_name_tokens (token, code, patient_id) VALUES (?, ?, ?)",
+        [
+            (token, soundex(token), patient_id)
+            for patient_id, name in patients
+            for token in set(tokens(name))
+        ],
+    )
+
+
+def _token_score(query_token, name_tokens):
+    best = 0.0
+    code = soundex(query_token)
+    for token in name_tokens:
+        if token == query_token:
+            return EXACT
+        if token.startswith(query_token):
+            best = max(best, PREFIX)
+        elif code and soundex(token) == code:
+            best = max(best, PHONETIC)
+        elif query_token in token:
+            best = max(best, SUBSTRING)
+    return best
+
+
+def score(query_tokens, name):
+    """How well a name matches the query tokens, 0..1."""
+    name_tokens = tokens(name)
+    if not query_tokens or not name_tokens:
+        return 0.0
+    total = sum(_token_score(t, name_tokens) for t in query_tokens)
+    # Tie-break towards names without extra words
+    extra = max(0, len(name_tokens) - len(query_tokens))
+    return total / len(query_tokens) - 0.01 * extra
+
+
+def _fts_query(query_tokens):
+    # Trigram phrases match anywhere inside the name
+    return " AND ".join(f'"{t}"' for t in query_tokens if len(t) >= 3)
+
+
+def _top_hits(conn, column, values, limit):
+    """Patients sharing the most `column` values with the query."""
+    if len(values) == 1:
+        # Single word: a plain index range, no grouping
+        return conn.execute(
+            f"""SELECT t.patient_id, p.name, 1 FROM patient_name_tokens t
+            JOIN patients p ON p.id = t.patient_id WHERE t.{column} = ? LIMIT ?""",
+            list(values) + [limit],
+        ).fetchall()
+    placeholders = ", ".join("?" * len(values))
+    return conn.execute(
+        f"""SELECT t.patient_id, p.name, t.hits FROM (
+            SELECT patient_id, COUNT(*) AS hits FROM patient_name_tokens
+            WHERE {column} IN ({placeholders}) GROUP BY patient_id
+            ORDER BY hits DESC LIMIT ?) t JOIN patients p ON p.id = t.patient_id""",
+        list(values) + [limit],
+    ).fetchall()
+
+
+def _candidates(conn, query_tokens, limit):
+    distinct = set(query_tokens)
+    rows = _top_hits(conn, "token", distinct, limit)
+    found = {r[0]: r[1] for r in rows}
+    if rows and rows[0][2] == len(distinct):
+        return found  # Every word matched exactly
+
+    # Partial words, then words the recognizer spelled differently
+    match = _fts_query(query_tokens)
+    if _has_fts(conn):
+        if match:
+            found.update(
+                conn.execute(
+                    "SELECT rowid, name FROM patient_names WHERE patient_names MATCH ? LIMIT ?",
+                    (match, limit),
+                ).fetchall()
+            )
+    else:
+        for t in distinct:
+            found.update(
+                conn.execute(
+                    "SELECT id, name FROM patients WHERE name LIKE ? LIMIT ?",
+                    (f"%{t}%", limit),
+                ).fetchall()
+            )
+    if len(found) > len(rows):
+        return found
+    codes = {soundex(t) for t in distinct} - {None}
+    if codes:
+        found.update((r[0], r[1]) for r in _top_hits(conn, "code", codes, limit))
+    return found
+
+
+def search(conn, query, limit=5):
+    """Best-first [(patient_id, name, score)] for a spoken or typed name."""
+    query = (query or "").strip()
+    query_tokens = tokens(query)
+    if not query_tokens:
+        return []
+
+    exact = conn.execute(
+        "SELECT id, name FROM patients WHERE name = ? COLLATE NOCASE LIMIT 2", (query,)
+    ).fetchall()
+    if exact:
+        return [(r[0], r[1], EXACT) for r in exact]
+
+    found = _candidates(conn, query_tokens, max(limit, CANDIDATES))
+    ranked = sorted(
+        ((pid, name, round(score(query_tokens, name), 4)) for pid, name in found.items()),
+        key=lambda r: (-r[2], r[0]),
+    )
+    return [r for r in ranked if r[2] > 0][:limit]
+
+
+def resolve(conn, query):
+    """
+    The patient id for `query`, or None when nothing matches well enough or
+    two patients match about equally well.
+    """
+    matches = search(conn, query, limit=2)
+    if not matches or matches[0][2] < MIN_SCORE:
+        return None
+    if len(matches) > 1 and matches[0][2] - matches[1][2] < AMBIGUITY_MARGIN:
+        return None
+    return matches[0][0]
@@ -0,0 +1,347 @@
+"""
+Asyncio reminder sessions.
+
+A ReminderSession is the reminder conversation (greet -> listen -> understand
+-> respond) written as an asyncio state machine. Each session owns a
+DeviceContext (one speaker/microphone, i.e. one room) for the length of the
+conversation, so sessions on different devices run side by side while the
+blocking cloud and audio calls are awaited in worker threads.
+
+Sessions learn that a dose was taken (e.g. via the pillbox) from the event
+bus rather than by re-querying the database, and stop waiting right away.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+from event_bus import EventBus, MedicationStatusEvent
+
+GREETING = "GREETING"
+LISTENING = "LISTENING"
+UNDERSTANDING = "UNDERSTANDING"
+NO_RESPONSE = "NO_RESPONSE"
+RETRY = "RETRY"
+DONE = "DONE"
+
+
+def greeting_text(patient_name, time_due, medicine):
+    """First thing a reminder says; shared with the TTS cache pre-warming."""
+    return f"Hello {patient_name}. It's {time_due}, time for your {medicine}."
+
+
+class DeviceContext:
+    """
+    The I/O one reminder session talks through. All callables are the
+    ordinary blocking functions from app.py (or stubs in benchmarks):
+
+        record(cancel) -> audio file or typed text, or None if cancelled
+        transcribe(audio, cancel) -> text or None
+        understand(text) -> intent dict, with "patient_id" if a name was
+            heard (None when it matched no patient clearly)
+        synthesize(text, filename) -> bool
+        play(filename)
+        status(patient_id, schedule_id) -> today's status of the dose or None
+        log(patient_id, status, notes, schedule_id)
+
+    `cancel` is a threading.Event set once the session no longer wants the
+    answer (the dose was taken meanwhile): record and transcribe run in
+    worker threads that asyncio cannot stop, so they should check it and
+    return early.
+
+    `bus` is the EventBus that `log` publishes MedicationStatusEvents on.
+    A schedule_id of None means the patient's first (or nearest) dose.
+
+    `accounting`, an optional IOAccounting, is snapshotted once a session
+    holds the device, so a session queued behind another does not move the
+    running one's baseline; the turn's delta is left in the session's `io`.
+    """
+
+    def __init__(
+        self,
+        name,
+        record,
+        transcribe,
+        understand,
+        synthesize,
+        play,
+        status,
+        log,
+        bus=None,
+        output_file="output_response.wav",
+        accounting=None,
+    ):
+        self.name = name
+        self.record = record
+        self.transcribe = transcribe
+        self.understand = understand
+        self.synthesize = synthesize
+        self.play = play
+        self.status = status
+        self.log = log
+        self.bus = bus or EventBus()
+        self.output_file = output_file
+        self.accounting = accounting
+        self.active_patient_id = None
+        self.active_schedule_id = None
+        self._locks = {}
+
+    def lock(self):
+        """Per-event-loop lock serialising conversations on this device."""
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+
+class ReminderSession:
+    def __init__(
+        self,
+        device,
+        patient_id,
+        patient_name,
+        medicine,
+        time_due,
+        delays_count=0,
+        max_reminders=3,
+        max_delays=3,
+        retry_pause=5,
+        schedule_id=None,
+    ):
+        self.device = device
+        self.patient_id = patient_id
+        self.schedule_id = schedule_id
+        self.patient_name = patient_name
+        self.medicine = medicine
+        self.time_due = time_due
+        self.delays_count = delays_count
+        self.max_reminders = max_reminders
+        self.max_delays = max_delays
+        self.retry_pause = retry_pause
+        self.reminders_count = 0
+        self.state = GREETING
+        self.outcome = None
+        self.io = None  # I/O delta of the turn, with device.accounting
+        self._taken = None
+        self._cancel = threading.Event()  # Seen by record/transcribe threads
+
+    async def _call(self, func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    async def _unless_taken(self, awaitable):
+        """Await `awaitable`, or give up and return None once the dose is TAKEN."""
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self._taken.wait())
+        done, _ = await asyncio.wait(
+            {task, waiter}, return_when=asyncio.FIRST_COMPLETED
+        )
+        waiter.cancel()
+        if task in done:
+            return task.result()
+        task.cancel()
+        return None
+
+    async def say(self, text):
+        device = self.device
+        if await self._call(device.synthesize, text, device.output_file):
+            await self._call(device.play, device.output_file)
+
+    def taken(self):
+        return self._taken.is_set()
+
+    async def run(self):
+        """Runs the conversation. Returns "TAKEN", "MISSED" or "SNOOZED"."""
+        async with self.device.lock():
+            self.device.active_patient_id = self.patient_id
+            self.device.active_schedule_id = self.schedule_id
+            accounting = self.device.accounting
+            started = accounting.begin_turn() if accounting else None
+            loop = asyncio.get_running_loop()
+            self._taken = asyncio.Event()
+
+            def on_status(event):
+                # Another of the patient's doses being taken is not this one
+                if self.schedule_id is not None and event.schedule_id not in (
+                    None,
+                    self.schedule_id,
+                ):
+                    return
+                if event.status == "TAKEN":
+                    self._cancel.set()
+                    loop.call_soon_threadsafe(self._taken.set)
+
+            # Subscribe before the one status read so no update slips between
+            unsubscribe = self.device.bus.subscribe(
+                MedicationStatusEvent, on_status, patient_id=self.patient_id
+            )
+            try:
+                print(f"\n--- Reminder for {self.patient_name} ({self.device.name}) ---")
+                status = await self._call(
+                    self.device.status, self.patient_id, self.schedule_id
+                )
+                if status == "TAKEN":
+                    print(
+                        f"Medication already taken for {self.patient_name}. Skipping flow."
+                    )
+                    return self.finish("TAKEN")
+
+                text = None
+                while self.state != DONE:
+                    if self.state == GREETING:
+                        await self.greet()
+                        self.state = LISTENING
+                    elif self.state == LISTENING:
+                        text = await self.listen()
+                    elif self.state == NO_RESPONSE:
+                        await self.no_response()
+                    elif self.state == UNDERSTANDING:
+                        await self.understand(text)
+                    elif self.state == RETRY:
+                        await self.retry()
+                return self.outcome
+            finally:
+                self._cancel.set()
+                unsubscribe()
+                self.device.active_patient_id = None
+                self.device.active_schedule_id = None
+                if accounting:
+                    self.io = accounting.end_turn(started, self.patient_name)
+
+    def finish(self, outcome):
+        self.outcome = outcome
+        self.state = DONE
+        return outcome
+
+    async def greet(self):
+        if self.delays_count:
+            await self.say(
+                f"{self.patient_name}, time is up. Did you take your {self.medicine}?"
+            )
+        else:
+            await self.say(
+                greeting_text(self.patient_name, self.time_due, self.medicine)
+            )
+
+    async def _record_and_transcribe(self):
+        audio = await self._call(self.device.record, self._cancel)
+        if audio is None:
+            return None
+        return await self._call(self.device.transcribe, audio, self._cancel)
+
+    async def listen(self):
+        if self.taken():
+            print(
+                f"Medication for {self.patient_name} was logged as TAKEN. Stopping reminder."
+            )
+            self.finish("TAKEN")
+            return None
+
+        text = await self._unless_taken(self._record_and_transcribe())
+
+        # Pillbox may have been opened while we were listening
+        if self.taken():
+            print(
+                f"Medication for {self.patient_name} was logged as TAKEN during recording. Stopping reminder."
+            )
+            self.finish("TAKEN")
+            return None
+
+        self.state = UNDERSTANDING if text else NO_RESPONSE
+        return text
+
+    async def no_response(self):
+        print("* No response. Waiting...")
+        await self.say("I didn't hear you. Did you take your medication?")
+        await self._unless_taken(asyncio.sleep(self.retry_pause))
+        self.reminders_count += 1
+        self.state = LISTENING if self.reminders_count < self.max_reminders else RETRY
+
+    async def understand(self, text):
+        intent_data = await self._call(self.device.understand, text)
+        intent = intent_data.get("intent")
+        # No name heard means the patient is talking about themselves
+        patient_id = intent_data.get("patient_id", self.patient_id)
+
+        if (intent == "CONFIRMATION" and intent_data.get("value") == "YES") or (
+            intent == "MEDICATION_LOG" and patient_id == self.patient_id
+        ):
+            await self._call(
+                self.device.log, self.patient_id, "TAKEN", None, self.schedule_id
+            )
+            await self.say("Thank you. Recorded.")
+            self.finish("TAKEN")
+
+        elif intent == "MEDICATION_LOG" and patient_id is not None:
+            # Another patient's dose, e.g. "Joan took her iron": their nearest one
+            await self._call(
+                self.device.log, patient_id, "TAKEN", "Logged by voice.", None
+            )
+            await self.say("Thank you. Recorded.")
+            self.reminders_count += 1
+            self.state = RETRY
+
+        elif intent_data.get("intent") == "DELAY":
+            if self.delays_count >= self.max_delays:
+                await self.say(
+                    "You have delayed too many times. I am notifying your caregiver."
+                )
+                await self._call(
+                    self.device.log,
+                    self.patient_id,
+                    "MISSED",
+                    "Exceeded max delays",
+                    self.schedule_id,
+                )
+                self.finish("MISSED")
+                return
+            await self.say("Okay, I will remind you again in a few minutes.")
+            self.finish("SNOOZED")
+
+        else:
+            self.reminders_count += 1
+            self.state = RETRY
+
+    async def retry(self):
+        if self.reminders_count < self.max_reminders:
+            await self.say(
+                "Let's time to take your medicine. Please take your medicine."
+            )
+            self.state = LISTENING
+            return
+
+        await self.say("Max reminders reached. Sending alert.")
+        await self._call(
+            self.device.log,
+            self.patient_id,
+            "MISSED",
+            "Missed medication after reminders",
+            self.schedule_id,
+        )
+        self.finish("MISSED")
+
+
+class SessionRunner:
+    """
+    Event loop in a background thread that runs many sessions at once.
+    Blocking calls made by sessions go to a thread pool of `max_workers`.
+    """
+
+    def __init__(self, max_workers=16):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        )
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(self, session):
+        """Start a session; returns a concurrent.futures.Future of its outcome."""
+        return asyncio.run_coroutine_threadsafe(session.run(), self.loop)
+
+    def run(self, session):
+        """Run a session and block the calling thread until it finishes."""
+        return self.submit(session).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
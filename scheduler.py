@@ -0,0 +1,128 @@
+"""
+Heap-based timer scheduler for medication reminders.
+
+Each scheduled job has a key (the schedule id for reminders), so a snooze or
+an edited `time_due` simply replaces the pending timer for that key.
+Scheduling, rescheduling and cancelling are O(log n); cancelled entries are
+dropped lazily when they reach the top of the heap.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def next_occurrence(time_due, now=None):
+    """Next datetime at which an "HH:MM" daily time falls, today or tomorrow."""
+    now = now or datetime.now()
+    hour, minute = (int(part) for part in time_due.split(":")[:2])
+    due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due <= now:
+        due += timedelta(days=1)
+    return due
+
+
+class ReminderScheduler:
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._heap = []
+        self._entries = {}  # key -> live heap entry
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    def schedule(self, key, when, callback, *args):
+        """
+        Run `callback(*args)` at epoch time `when` (or a datetime), replacing
+        any job already scheduled under `key`.
+        """
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        with self._cond:
+            self._remove(key)
+            entry = [when, next(self._counter), key, callback, args]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            # Only wake the loop if this job is now the earliest one
+            if self._heap[0] is entry:
+                self._cond.notify()
+
+    def reschedule(self, key, when):
+        """Move an existing job to a new time. Returns False if there is none."""
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            callback, args = entry[3], entry[4]
+        self.schedule(key, when, callback, *args)
+        return True
+
+    def cancel(self, key):
+        with self._cond:
+            return self._remove(key)
+
+    def due_at(self, key):
+        """Epoch time the job for `key` fires at, or None."""
+        with self._cond:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[3] = None  # Tombstone; popped lazily
+        # Keep the heap from filling up with tombstones
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [e for e in self._heap if e[3] is not None]
+            heapq.heapify(self._heap)
+        return True
+
+    def _pop_due(self):
+        """Wait until a job is due and pop it. Returns None once stopped."""
+        with self._cond:
+            while self._running:
+                while self._heap and self._heap[0][3] is None:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - self._clock()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                entry = heapq.heappop(self._heap)
+                del self._entries[entry[2]]
+                return entry
+        return None
+
+    def run_forever(self):
+        """Fire jobs on the calling thread as they come due until stop()."""
+        with self._cond:
+            self._running = True
+        while True:
+            entry = self._pop_due()
+            if entry is None:
+                return
+            _, _, key, callback, args = entry
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Scheduler Error ({key}): {e}")
+
+    def start(self):
+        """Run the scheduler loop in a daemon thread."""
+        self._thread = threading.Thread(target=self.run_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
@@ -0,0 +1,204 @@
+"""
+Normalized dose schedules and per-dose medication logs.
+
+A patient has one or more rows in `schedules` (medicine + time of day), and
+`medication_logs` holds one row per scheduled dose per day, unique on
+(schedule_id, date) instead of (patient_id, date). `schedules.due_minute`
+(minutes after midnight) is indexed for active schedules, so "which doses
+are due in the next N minutes" is an index range scan (two ranges when the
+window crosses midnight).
+
+patients.medicine / patients.time_due still describe a patient's first
+schedule for the pages that show them.
+"""
+
+from datetime import datetime, timedelta
+
+MEDICATION_LOGS_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        schedule_id INTEGER,
+        date TEXT NOT NULL,
+        time_taken TEXT,
+        status TEXT NOT NULL CHECK(status IN ('TAKEN', 'MISSED', 'PENDING')),
+        notes TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id),
+        FOREIGN KEY (schedule_id) REFERENCES schedules (id),
+        UNIQUE(schedule_id, date)
+    )
+"""
+
+
+def due_minute(time_due):
+    """Minutes after midnight for an HH:MM time, or None if it is not one."""
+    try:
+        t = datetime.strptime((time_due or "").strip(), "%H:%M")
+    except ValueError:
+        return None
+    return t.hour * 60 + t.minute
+
+
+def _columns(c, table):
+    return [row[1] for row in c.execute(f"PRAGMA table_info({table})")]
+
+
+def create_tables(c):
+    """
+    Create `schedules` and `medication_logs`, migrating a medication_logs
+    table from before schedules existed (one log per patient per day).
+    """
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            medicine TEXT,
+            time_due TEXT NOT NULL,
+            due_minute INTEGER,
+            active INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (patient_id) REFERENCES patients (id)
+        )
+    """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_schedules_due ON schedules (due_minute) WHERE active = 1"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_schedules_patient ON schedules (patient_id)"
+    )
+
+    existing = _columns(c, "medication_logs")
+    if existing and "schedule_id" not in existing:
+        _migrate_logs(c)
+    else:
+        c.execute(MEDICATION_LOGS_SQL.format(table="medication_logs"))
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_medication_logs_patient_date ON medication_logs (patient_id, date)"
+    )
+
+
+def _migrate_logs(c):
+    print("Migrating medication_logs to per-dose schedules...")
+    backfill(c)
+    c.execute(MEDICATION_LOGS_SQL.format(table="medication_logs_new"))
+    c.execute(
+        """INSERT INTO medication_logs_new
+            (id, patient_id, schedule_id, date, time_taken, status, notes)
+        SELECT ml.id, ml.patient_id,
+            (SELECT MIN(s.id) FROM schedules s WHERE s.patient_id = ml.patient_id),
+            ml.date, ml.time_taken, ml.status, ml.notes
+        FROM medication_logs ml"""
+    )
+    c.execute("DROP TABLE medication_logs")
+    c.execute("ALTER TABLE medication_logs_new RENAME TO medication_logs")
+
+
+def add_schedules(c, schedules):
+    """
+    Insert (patient_id, medicine, time_due) schedules. Does not commit.
+    Returns the new schedule ids, in order.
+    """
+    c.executemany(
+        "INSERT INTO schedules (patient_id, medicine, time_due, due_minute) VALUES (?, ?, ?, ?)",
+        [
+            (pid, medicine, time_due, due_minute(time_due))
+            for pid, medicine, time_due in schedules
+        ],
+    )
+    # One statement in one transaction: AUTOINCREMENT hands out consecutive ids
+    last = c.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'schedules'"
+    ).fetchone()
+    count = len(schedules)
+    return list(range(last[0] - count + 1, last[0] + 1)) if count else []
+
+
+def backfill(c):
+    """Give every patient without a schedule one from patients.medicine/time_due."""
+    missing = c.execute(
+        """SELECT id, medicine, time_due FROM patients
+        WHERE id NOT IN (SELECT patient_id FROM schedules)"""
+    ).fetchall()
+    add_schedules(
+        c, [(pid, medicine, time_due or "") for pid, medicine, time_due in missing]
+    )
+
+
+def primary_schedule_id(c, patient_id):
+    row = c.execute(
+        "SELECT MIN(id) FROM schedules WHERE patient_id = ?", (patient_id,)
+    ).fetchone()
+    return row[0]
+
+
+def current_schedule_id(c, patient_id, now=None):
+    """
+    The dose a patient most likely means right now (e.g. by opening the
+    pillbox): the active schedule closest to the current time whose dose
+    today is not TAKEN yet, else the closest one.
+    """
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    rows = c.execute(
+        """SELECT s.id, s.due_minute, ml.status FROM schedules s
+        LEFT JOIN medication_logs ml ON ml.schedule_id = s.id AND ml.date = ?
+        WHERE s.patient_id = ? AND s.active = 1""",
+        (now.strftime("%Y-%m-%d"), patient_id),
+    ).fetchall()
+    if not rows:
+        return primary_schedule_id(c, patient_id)
+
+    def distance(row):
+        if row[1] is None:
+            return 24 * 60
+        return abs(row[1] - minute)
+
+    open_doses = [r for r in rows if r[2] != "TAKEN"]
+    return min(open_doses or rows, key=distance)[0]
+
+
+def due_within(conn, minutes, now=None, limit=-1):
+    """
+    Active schedules due in [now, now + minutes), soonest first and at most
+    `limit` of them (no limit when negative), with the dose's status on the
+    day it falls due. Each day is one indexed range on due_minute.
+    """
+    now = now or datetime.now()
+    start = now.hour * 60 + now.minute
+    end = start + max(0, int(minutes))
+    ranges = [(now.date(), start, min(end, 24 * 60))]
+    day = now.date()
+    while end > 24 * 60:
+        day += timedelta(days=1)
+        end -= 24 * 60
+        ranges.append((day, 0, min(end, 24 * 60)))
+
+    doses = []
+    for day, low, high in ranges:
+        if 0 <= limit <= len(doses):
+            break
+        rows = conn.execute(
+            """SELECT s.id, s.patient_id, p.name, s.medicine, s.time_due, s.due_minute,
+                ml.status
+            FROM schedules s
+            JOIN patients p ON p.id = s.patient_id
+            LEFT JOIN medication_logs ml ON ml.schedule_id = s.id AND ml.date = ?
+            WHERE s.active = 1 AND s.due_minute >= ? AND s.due_minute < ?
+            ORDER BY s.due_minute LIMIT ?""",
+            (day.isoformat(), low, high, limit - len(doses) if limit >= 0 else -1),
+        ).fetchall()
+        for r in rows:
+            doses.append(
+                {
+                    "schedule_id": r[0],
+                    "patient_id": r[1],
+                    "patient_name": r[2],
+                    "medicine": r[3],
+                    "time_due": r[4],
+                    "date": day.isoformat(),
+                    "minutes_until": r[5] - start + 24 * 60 * (day - now.date()).days,
+                    "status": r[6] or "PENDING",
+                }
+            )
+    return doses
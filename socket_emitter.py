@@ -0,0 +1,115 @@
+"""
+Coalescing Socket.IO emitter.
+
+Status updates are collected for a short window and sent as one
+`status_batch` message, keeping only the latest update per dose. The
+batch goes to the dashboard room, and each patient's own update goes to that
+patient's room so calendar pages only hear about their patient.
+
+The flush loop runs as a Socket.IO background task, so every emit happens on
+the server's own thread/greenlet whatever thread produced the update. That
+matters under the gevent production server, where emitting from the voice or
+pillbox OS threads is not safe.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+DASHBOARD_ROOM = "dashboard"
+RATE_WINDOW_SECONDS = 10
+
+
+def patient_room(patient_id):
+    return f"patient:{patient_id}"
+
+
+class CoalescingEmitter:
+    def __init__(self, socketio, window=0.05):
+        self.socketio = socketio
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}  # (patient_id, schedule_id) -> latest update
+        self._outbox = deque()  # (event, data, room) sent as-is on the next flush
+        self._started = False
+
+        self._started_at = time.time()
+        self._updates = 0
+        self._messages = 0
+        self._bytes = 0
+        self._recent = deque()  # (timestamp, payload bytes) within RATE_WINDOW_SECONDS
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Socket.IO flush error: {e}")
+
+    def status_update(self, update):
+        """Queue an update dict (must carry patient_id) for the next batch."""
+        with self._lock:
+            self._updates += 1
+            key = (update["patient_id"], update.get("schedule_id"))
+            self._pending[key] = update
+
+    def emit(self, event, data, room=None):
+        """Queue a one-off message (e.g. an alert) for the next flush, uncoalesced."""
+        with self._lock:
+            self._outbox.append((event, data, room))
+
+    def flush(self):
+        with self._lock:
+            outbox = self._outbox
+            self._outbox = deque()
+            updates = list(self._pending.values())
+            self._pending = {}
+
+        for event, data, room in outbox:
+            self._send(event, data, room)
+        if not updates:
+            return
+        self._send("status_batch", {"updates": updates}, DASHBOARD_ROOM)
+        for update in updates:
+            self._send(
+                "status_batch",
+                {"updates": [update]},
+                patient_room(update["patient_id"]),
+            )
+
+    def _send(self, event, data, room):
+        size = len(json.dumps(data, default=str))
+        now = time.time()
+        with self._lock:
+            self._messages += 1
+            self._bytes += size
+            self._recent.append((now, size))
+            while self._recent and self._recent[0][0] < now - RATE_WINDOW_SECONDS:
+                self._recent.popleft()
+        self.socketio.emit(event, data, to=room)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - RATE_WINDOW_SECONDS:
+                self._recent.popleft()
+            recent_messages = len(self._recent)
+            recent_bytes = sum(size for _, size in self._recent)
+            return {
+                "updates_total": self._updates,
+                "messages_total": self._messages,
+                "payload_bytes_total": self._bytes,
+                "messages_per_second": recent_messages / RATE_WINDOW_SECONDS,
+                "payload_bytes_per_second": recent_bytes / RATE_WINDOW_SECONDS,
+                "pending": len(self._pending) + len(self._outbox),
+                "uptime_seconds": now - self._started_at,
+            }
@@ -0,0 +1,221 @@
+"""
+Speech-to-text backends for the voice assistant.
+
+The reminder flow only ever needs short answers ("yes", "give me five
+minutes", a patient's name), so a small on-device recogniser constrained to
+that vocabulary can stand in for Google Cloud Speech when the network is down,
+or answer first and leave the cloud as the fallback.
+"""
+
+import json
+import math
+import time
+import wave
+from array import array
+
+CONFIRMATION_PHRASES = [
+    "yes",
+    "yeah",
+    "yes i did",
+    "i took it",
+    "i took my medicine",
+    "i have taken it",
+    "done",
+    "no",
+    "not yet",
+    "i did not",
+    "i didn't",
+]
+
+DELAY_PHRASES = [
+    "give me five minutes",
+    "five more minutes",
+    "five minutes",
+    "in a minute",
+    "later",
+    "wait",
+    "not now",
+]
+
+
+def build_grammar(patient_names=()):
+    """Phrase list for grammar-constrained recognisers."""
+    phrases = set(CONFIRMATION_PHRASES) | set(DELAY_PHRASES)
+    for name in patient_names:
+        name = name.lower().strip()
+        if not name:
+            continue
+        phrases.add(name)
+        phrases.add(f"this is {name}")
+        phrases.update(name.split())
+    return sorted(phrases)
+
+
+def left_channel(frames):
+    """
+    The left channel of interleaved 16-bit stereo frames. The HAT's two
+    microphones sit a few centimetres apart, so either one carries the
+    answer; audioop.tomono is gone as of Python 3.13.
+    """
+    return array("h", frames)[::2].tobytes()
+
+
+def rms(frames):
+    """Root-mean-square level of 16-bit frames, as audioop.rms(frames, 2)."""
+    samples = array("h", frames)
+    if not samples:
+        return 0
+    return int(math.sqrt(sum(s * s for s in samples) / len(samples)))
+
+
+class STTBackend:
+    """Turns a recorded WAV file into text, or None if nothing was understood."""
+
+    name = "base"
+
+    def transcribe(self, audio_file):
+        raise NotImplementedError
+
+    def set_grammar(self, phrases):
+        """Restrict recognition to `phrases`. Ignored by open-vocabulary engines."""
+
+
+class GoogleCloudSTT(STTBackend):
+    name = "cloud"
+
+    def __init__(self, sample_rate, channels, language_code="en-US", timeout=None):
+        from google.cloud import speech
+
+        self._speech = speech
+        self.client = speech.SpeechClient()
+        self.config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=language_code,
+            audio_channel_count=channels,
+        )
+        self.timeout = timeout
+
+    def transcribe(self, audio_file):
+        with open(audio_file, "rb") as audio:
+            content = audio.read()
+        audio = self._speech.RecognitionAudio(content=content)
+        response = self.client.recognize(
+            config=self.config, audio=audio, timeout=self.timeout
+        )
+        for result in response.results:
+            return result.alternatives[0].transcript
+        return None
+
+
+class VoskSTT(STTBackend):
+    """
+    Offline recogniser running on the Pi's CPU.
+
+    Uses a small Vosk model (e.g. vosk-model-small-en-us) and, when a grammar
+    is set, only decodes the listed phrases, which keeps both latency and
+    misrecognitions down for yes/no/delay answers.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path, grammar=None):
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("Local STT requires the 'vosk' package.")
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+        self.grammar = list(grammar) if grammar else None
+
+    def set_grammar(self, phrases):
+        self.grammar = list(phrases) if phrases else None
+
+    def transcribe(self, audio_file):
+        wf = wave.open(audio_file, "rb")
+        try:
+            if wf.getsampwidth() != 2:
+                raise ValueError(f"{audio_file}: Vosk needs 16-bit PCM")
+            channels = wf.getnchannels()
+            rate = wf.getframerate()
+            if self.grammar:
+                recognizer = self._vosk.KaldiRecognizer(
+                    self.model, rate, json.dumps(self.grammar + ["[unk]"])
+                )
+            else:
+                recognizer = self._vosk.KaldiRecognizer(self.model, rate)
+
+            data = wf.readframes(4000)
+            while data:
+                if channels == 2:
+                    data = left_channel(data)
+                recognizer.AcceptWaveform(data)
+                data = wf.readframes(4000)
+        finally:
+            wf.close()
+
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        text = text.replace("[unk]", "").strip()
+        return text or None
+
+
+class ChainSTT(STTBackend):
+    """
+    Tries each backend in order until one returns text. `on_call(name,
+    seconds, failed)`, if given, is told how long each attempt took.
+    """
+
+    def __init__(self, backends, on_call=None):
+        self.backends = list(backends)
+        self.name = "+".join(b.name for b in self.backends)
+        self.on_call = on_call
+
+    def set_grammar(self, phrases):
+        for backend in self.backends:
+            backend.set_grammar(phrases)
+
+    def transcribe(self, audio_file):
+        for backend in self.backends:
+            started = time.perf_counter()
+            try:
+                text = backend.transcribe(audio_file)
+            except Exception as e:
+                self._observe(backend, started, True)
+                print(f"STT Error ({backend.name}): {e}")
+                continue
+            self._observe(backend, started, False)
+            if text:
+                return text
+        return None
+
+    def _observe(self, backend, started, failed):
+        if self.on_call:
+            self.on_call(backend.name, time.perf_counter() - started, failed)
+
+
+def make_stt_backend(
+    mode,
+    sample_rate,
+    channels,
+    model_path=None,
+    cloud_timeout=None,
+    grammar=None,
+    on_call=None,
+):
+    """
+    Build the backend chain for `mode`: 'cloud', 'local', 'cloud+local'
+    (cloud first, local fallback on error/timeout) or 'local+cloud'.
+    """
+    backends = []
+    for engine in mode.split("+"):
+        if engine == "cloud":
+            backends.append(
+                GoogleCloudSTT(sample_rate, channels, timeout=cloud_timeout)
+            )
+        elif engine == "local":
+            backends.append(VoskSTT(model_path, grammar=grammar))
+        else:
+            raise ValueError(f"Unknown STT engine: {engine}")
+    return ChainSTT(backends, on_call=on_call)